@@ -2,21 +2,19 @@
 
 # 1. First check to see if the correct version of Python is installed on the local machine 
 echo "Checking Python version..."
-REQ_PYTHON_V="370"
+# (the versions are compared as numbers, so that 3.10 counts as newer than 3.8)
+REQ_PYTHON_CHECK='import sys; sys.exit(sys.version_info[:2] < (3, 8))'
 
-ACTUAL_PYTHON_V=$(python -c 'import sys; version=sys.version_info[:3]; print("{0}{1}{2}".format(*version))')
-ACTUAL_PYTHON3_V=$(python3 -c 'import sys; version=sys.version_info[:3]; print("{0}{1}{2}".format(*version))')
-
-if [[ $ACTUAL_PYTHON_V > $REQ_PYTHON_V ]] || [[ $ACTUAL_PYTHON_V == $REQ_PYTHON_V ]];  then 
+if python -c "$REQ_PYTHON_CHECK" 2> /dev/null; then 
     PYTHON="python"
-elif [[ $ACTUAL_PYTHON3_V > $REQ_PYTHON_V ]] || [[ $ACTUAL_PYTHON3_V == $REQ_PYTHON_V ]]; then 
+elif python3 -c "$REQ_PYTHON_CHECK" 2> /dev/null; then 
     PYTHON="python3"
 else
-    echo -e "\tPython 3.7 is not installed on this machine. Please install Python 3.7 before continuing."
+    echo -e "\tPython 3.8 or newer is not installed on this machine. Please install it before continuing."
     exit 1
 fi
 
-echo -e "\t--Python 3.7 is installed"
+echo -e "\t--Python 3.8 or newer is installed"
 
 # 2. Create Virtual environment 
 
@@ -36,7 +34,7 @@ fi
 
 echo -e "Installing Requirements"
 if [[ ! -e "requirements.txt" ]]; then 
-    echo -e "\t--Need to requirements.txt to install packages."
+    echo -e "\t--Need requirements.txt (in the repository folder) to install packages."
     exit 1
 fi
 
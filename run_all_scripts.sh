@@ -6,6 +6,9 @@ if [ ! -d data ]; then
   sh get_files.sh
 fi 
 cd scripts/
+#Every script adds its stage timings to one report for the run
+export RUN_REPORT=../data/run_report.json
+rm -f $RUN_REPORT
 python3 herald_crawler.py
 python3 herald_cleaner.py
 python3 stuff_crawler.py
@@ -13,3 +16,4 @@ python3 stuff_clean.py
 echo "Sample Web Scraping and Data Cleaning complete for NZ Herald and stuff.co.nz"
 echo "Now creating Economic Policy Uncertainty Index based on downloaded data"
 python3 main.py
+echo "Timings of every stage saved in data/run_report.json"
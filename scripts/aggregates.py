@@ -0,0 +1,250 @@
+# -*- coding: utf-8 -*-
+"""
+Purpose: Materialized aggregates of the keyword indices. For every month
+and newspaper a SQLite file keeps the number of articles and, for every
+registered index, the number of articles holding its keywords, plus the
+value of each index by month. Newly cleaned articles are merged into
+these counts, and only the months they fall in are recomputed, so adding
+a day of articles costs the same whatever the size of the history.
+
+Usage (from the scripts directory), to merge clean pickles:
+    python3 aggregates.py ../data/clean/new_articles.pkl [...]
+
+Authors:
+Diego Diaz
+Rukhshan Arif Mian
+Piyush Tank
+"""
+
+import json
+import os
+import sqlite3
+import sys
+import pandas as pd
+import index_builder as ib
+import main as main_script
+
+DEFAULT_PATH = "../data/index/aggregates.sqlite"
+#Indices kept up to date by the command line
+DEFAULT_INDICES = main_script.INDICES
+MONTH_FORMAT = '%Y-%m'
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS indices (
+    index_name TEXT PRIMARY KEY,
+    keywords TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS articles (
+    url TEXT PRIMARY KEY
+);
+CREATE TABLE IF NOT EXISTS totals (
+    month TEXT NOT NULL,
+    newspaper TEXT NOT NULL,
+    articles INTEGER NOT NULL,
+    PRIMARY KEY (month, newspaper)
+);
+CREATE TABLE IF NOT EXISTS counts (
+    index_name TEXT NOT NULL,
+    month TEXT NOT NULL,
+    newspaper TEXT NOT NULL,
+    matches INTEGER NOT NULL,
+    PRIMARY KEY (index_name, month, newspaper)
+);
+CREATE TABLE IF NOT EXISTS index_values (
+    index_name TEXT NOT NULL,
+    month TEXT NOT NULL,
+    value REAL NOT NULL,
+    PRIMARY KEY (index_name, month)
+);
+'''
+
+
+class IndexAggregates():
+    '''
+    Counts by month and newspaper of the articles merged so far, stored
+    in a SQLite file.
+    '''
+
+    def __init__(self, path=DEFAULT_PATH):
+        '''
+        Inputs:
+            - path (str): SQLite file, created if it does not exist
+        '''
+        self.path = path
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._db = sqlite3.connect(path)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(SCHEMA)
+
+    def indices(self):
+        '''
+        Registered indices as a dict mapping index name to its keywords
+        '''
+        return {name: json.loads(keywords) for name, keywords in
+                self._db.execute("SELECT index_name, keywords FROM indices"
+                                 " ORDER BY rowid")}
+
+    def add_index(self, index_name, words, df=None):
+        '''
+        Registers an index. If articles were already merged, df must hold
+        them (the clean corpus merged so far) to count the new index over
+        the history once.
+            Inputs:
+                - index_name (str): Name of the index
+                - words (list of str): Keywords of the index
+                - df (Pandas dataframe): Clean corpus merged so far
+        '''
+        registered = self.indices()
+        if index_name in registered:
+            if registered[index_name] != list(words):
+                raise ValueError("Index " + index_name + " is already"
+                                 " registered with other keywords")
+            return
+        has_history = self._db.execute("SELECT 1 FROM totals LIMIT 1")\
+            .fetchone() is not None
+        if has_history and df is None:
+            raise ValueError("Articles were already merged: pass the clean"
+                             " corpus to count " + index_name + " over them")
+        with self._db:
+            self._db.execute("INSERT INTO indices VALUES (?, ?)",
+                             (index_name, json.dumps(list(words))))
+            if has_history:
+                masks = ib.match_indices(df[ib.ARTICLE], {index_name: words})
+                counts = ib.monthly_counts(df, masks)
+                self._add_counts(counts, [index_name], totals=False)
+        if has_history:
+            self._recompute(sorted(set(_months(counts))), [index_name])
+
+    def add_articles(self, df):
+        '''
+        Merges newly cleaned articles into the counts of every registered
+        index and recomputes the index values of the months they fall in.
+        Articles whose url was merged before are skipped.
+            Inputs:
+                - df (Pandas dataframe): Clean articles with the newspaper,
+                url, date and article columns
+            Returns:
+                - list of the months ('YYYY-MM') that were recomputed
+        '''
+        df = self._new_articles(df)
+        if df.empty:
+            return []
+        indices = self.indices()
+        counts = ib.monthly_counts(df, ib.match_indices(df[ib.ARTICLE],
+                                                        indices))
+        with self._db:
+            self._db.executemany("INSERT OR IGNORE INTO articles VALUES (?)",
+                                 ((url,) for url in df[ib.URL].dropna()))
+            self._add_counts(counts, list(indices))
+        months = sorted(set(_months(counts)))
+        self._recompute(months, list(indices))
+        return months
+
+    def _new_articles(self, df):
+        '''
+        Rows of df whose url was never merged, without repeated urls.
+        Rows without a url cannot be told apart, so all of them are kept
+        '''
+        df = df[~(df[ib.URL].duplicated() & df[ib.URL].notna())]
+        seen = set()
+        urls = df[ib.URL].dropna().tolist()
+        for start in range(0, len(urls), 500):
+            batch = urls[start:start + 500]
+            seen.update(url for (url,) in self._db.execute(
+                "SELECT url FROM articles WHERE url IN (" +
+                ",".join("?" * len(batch)) + ")", batch))
+        return df[~df[ib.URL].isin(seen)]
+
+    def _add_counts(self, counts, index_names, totals=True):
+        '''
+        Adds the output of index_builder.monthly_counts to the stored
+        counts of index_names, and to the article totals unless totals is
+        False. Must run inside a transaction.
+        '''
+        months = _months(counts)
+        newspapers = counts[ib.NEWSPAPER].tolist()
+        if totals:
+            self._db.executemany(
+                "INSERT INTO totals VALUES (?, ?, ?) ON CONFLICT (month,"
+                " newspaper) DO UPDATE SET articles = articles +"
+                " excluded.articles",
+                zip(months, newspapers, counts[ib.N_ARTICLES].tolist()))
+        for index_name in index_names:
+            self._db.executemany(
+                "INSERT INTO counts VALUES (?, ?, ?, ?) ON CONFLICT"
+                " (index_name, month, newspaper) DO UPDATE SET matches ="
+                " matches + excluded.matches",
+                zip([index_name] * len(months), months, newspapers,
+                    counts[index_name + ' count'].tolist()))
+
+    def _recompute(self, months, index_names):
+        '''
+        Recomputes the value of the indices for the given months from the
+        stored counts, with the same steps as NewspaperIndex.make_index.
+        '''
+        for index_name in index_names:
+            for start in range(0, len(months), 500):
+                batch = months[start:start + 500]
+                counts = pd.DataFrame(self._db.execute(
+                    "SELECT t.month, t.newspaper, COALESCE(c.matches, 0),"
+                    " t.articles FROM totals t LEFT JOIN counts c ON"
+                    " c.index_name = ? AND c.month = t.month AND"
+                    " c.newspaper = t.newspaper WHERE t.month IN (" +
+                    ",".join("?" * len(batch)) + ") ORDER BY t.month,"
+                    " t.newspaper", [index_name] + batch).fetchall(),
+                    columns=[ib.MONTH_YEAR, ib.NEWSPAPER,
+                             index_name + ' count', ib.N_ARTICLES])
+                counts[ib.MONTH_YEAR] = pd.PeriodIndex(
+                    counts[ib.MONTH_YEAR], freq='M')
+                values = ib.index_from_counts(counts, index_name)
+                with self._db:
+                    self._db.executemany(
+                        "INSERT OR REPLACE INTO index_values VALUES"
+                        " (?, ?, ?)",
+                        zip([index_name] * len(values),
+                            _months(values), values[index_name].tolist()))
+
+    def index_frame(self, index_name):
+        '''
+        Values of an index by month, in the format of
+        NewspaperIndex.group_by
+        '''
+        values = pd.DataFrame(self._db.execute(
+            "SELECT month, value FROM index_values WHERE index_name = ?"
+            " ORDER BY month", (index_name,)).fetchall(),
+                              columns=[ib.MONTH_YEAR, index_name])
+        values[ib.MONTH_YEAR] = pd.PeriodIndex(values[ib.MONTH_YEAR],
+                                               freq='M')
+        return values
+
+    def close(self):
+        '''
+        Closes the SQLite file
+        '''
+        self._db.close()
+
+
+def _months(counts):
+    '''
+    month_year column of a counts frame as 'YYYY-MM' strings
+    '''
+    return counts[ib.MONTH_YEAR].dt.strftime(MONTH_FORMAT).tolist()
+
+
+def main(paths):
+    '''
+    Merges clean pickles into the default aggregates and prints the
+    months that changed.
+    '''
+    aggregates = IndexAggregates()
+    for index_name, words in DEFAULT_INDICES.items():
+        aggregates.add_index(index_name, words)
+    for path in paths:
+        months = aggregates.add_articles(pd.read_pickle(path))
+        print(path + ": " + str(len(months)) + " months updated")
+    aggregates.close()
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
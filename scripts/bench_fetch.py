@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+"""
+Purpose: Benchmark for the concurrent fetch engine. Starts a local server
+that stands in for web.archive (every page answers after a fixed delay
+with a NZ Herald-like article) and measures how many articles per
+second herald_crawler.scrape_articles gets for different concurrency
+limits. No request leaves the machine.
+
+Usage (from the scripts directory):
+    python3 bench_fetch.py [num_articles] [delay_in_seconds]
+
+Authors:
+Diego Diaz
+Rukhshan Arif Mian
+Piyush Tank
+"""
+
+import sys
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import herald_crawler
+import sessions
+
+CONCURRENCY_LEVELS = [1, 2, 4, 8, 16, 32]
+
+ARTICLE_PAGE = '''<html><head><title>NZ Herald</title></head><body>
+<h1>Article {0}</h1>
+<div class="publish">12 Mar, 2019 5:00am</div>
+<div id="article-body">
+<p>The economy faces policy uncertainty, said the report number {0}.</p>
+<p>Second paragraph of the stand-in article.</p>
+</div></body></html>'''
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    '''
+    Answers every GET with an article page after DELAY seconds, which
+    plays the role of the network and archive latency.
+    '''
+    DELAY = 0.05
+
+    def do_GET(self):
+        '''
+        Sleeps and returns a small article page
+        '''
+        time.sleep(self.DELAY)
+        body = ARTICLE_PAGE.format(self.path).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        '''
+        Keeps the benchmark output clean
+        '''
+        return
+
+
+class StandInServer(ThreadingHTTPServer):
+    '''
+    Threaded server with a listen backlog large enough for the highest
+    concurrency level
+    '''
+    request_queue_size = 128
+    daemon_threads = True
+
+
+def start_stand_in_server(delay):
+    '''
+    Starts the stand-in server in a background thread.
+        Inputs:
+            - delay (float): Seconds each response takes
+        Returns:
+            - (server, base_url) tuple
+    '''
+    StandInHandler.DELAY = delay
+    server = StandInServer(('127.0.0.1', 0), StandInHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, 'http://127.0.0.1:' + str(server.server_port)
+
+
+def run_benchmark(num_articles=200, delay=0.05):
+    '''
+    Scrapes num_articles stand-in articles at every concurrency level and
+    prints the articles per second reached by each one.
+        Inputs:
+            - num_articles (int): Articles to scrape per level
+            - delay (float): Seconds each response takes
+        Returns:
+            - dict mapping concurrency to articles per second
+    '''
+    #Every level must go to the server, not to the response cache, and
+    #the stand-in never throttles
+    sessions.set_cache(None)
+    sessions.set_limiter(None)
+    server, base_url = start_stand_in_server(delay)
+    results = {}
+    print("concurrency  articles  seconds  articles/s")
+    try:
+        for concurrency in CONCURRENCY_LEVELS:
+            urls = [base_url + '/article/' + str(concurrency) + '/' + str(i)
+                    for i in range(num_articles)]
+            start = time.perf_counter()
+            rows = list(herald_crawler.scrape_articles(urls, None, concurrency))
+            elapsed = time.perf_counter() - start
+            results[concurrency] = len(rows) / elapsed
+            print("{:>11}  {:>8}  {:>7.2f}  {:>10.1f}".format(
+                concurrency, len(rows), elapsed, results[concurrency]))
+    finally:
+        server.shutdown()
+    stats = sessions.connection_stats()
+    print("requests: {}, new connections: {}, reused: {} ({:.1%})".format(
+        stats["requests"], stats["new_connections"], stats["reused"],
+        stats["reuse_ratio"]))
+    return results
+
+
+if __name__ == "__main__":
+    ARGS = [float(arg) for arg in sys.argv[1:]]
+    run_benchmark(int(ARGS[0]) if ARGS else 200,
+                  ARGS[1] if len(ARGS) > 1 else 0.05)
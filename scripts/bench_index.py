@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+"""
+Purpose: Benchmark for the keyword matcher of index_builder. Runs the
+original has_list_of_words (one apply per keyword plus helper columns)
+and the current one over the same articles, reports articles per second
+for each and checks that both mark exactly the same articles (the
+equivalence on edge cases is tested in test_index_builder.py).
+
+Articles are read from the clean pickles in ../data/clean when there
+are any, and otherwise a synthetic corpus is generated.
+
+Usage (from the scripts directory):
+    python3 bench_index.py [number of synthetic articles]
+
+Authors:
+Diego Diaz
+Rukhshan Arif Mian
+Piyush Tank
+"""
+
+import glob
+import random
+import sys
+import time
+import pandas as pd
+import index_builder as ib
+
+CLEAN_FILES = "../data/clean/*pkl"
+#Keyword lists of the indices built in main.py
+KEYWORDS = {'EPU': ['econ', 'policy', 'uncert'],
+            'Natural Disaster': ['earthquake', 'damage'],
+            'Domestic Violence': ['domestic', 'violence']}
+WORDS_PER_ARTICLE = 400
+
+
+def legacy_has_list_of_words(df, column_name, words, index_name):
+    '''
+    has_list_of_words as it was before the single pass matcher, kept as
+    the reference for the equivalence check (the helper column is dropped
+    without axis=1, which current pandas rejects next to columns=)
+    '''
+    df['aux'] = 0
+    for word in words:
+        df[word] = df[column_name].apply(lambda x: x.count(word) > 0)
+        df['aux'] += df[word]
+        df = df.drop([word], axis=1)
+    df[index_name + ' count'] = df['aux'].apply(lambda x: x == len(words))
+    df = df.drop(columns=['aux'])
+    return df
+
+
+def synthetic_articles(num_articles, seed=0):
+    '''
+    Random lower case articles made of filler words and, now and then,
+    words containing the keywords of every index.
+        Returns:
+            - Pandas dataframe with an article column
+    '''
+    rng = random.Random(seed)
+    filler = [''.join(rng.choice('abcdefghijklmnopqrstuvwxyz')
+                      for _ in range(rng.randint(2, 10))) for _ in range(5000)]
+    keywords = ['economy', 'economic', 'policy', 'policies', 'uncertainty',
+                'uncertain', 'earthquake', 'damage', 'domestic', 'violence']
+    articles = []
+    for _ in range(num_articles):
+        words = rng.choices(filler, k=WORDS_PER_ARTICLE)
+        for _ in range(rng.randint(0, 4)):
+            words[rng.randrange(WORDS_PER_ARTICLE)] = rng.choice(keywords)
+        articles.append(' '.join(words))
+    return pd.DataFrame({ib.ARTICLE: articles})
+
+
+def load_articles(num_synthetic):
+    '''
+    Article column of the clean pickles, or a synthetic corpus of
+    num_synthetic articles if there are none
+    '''
+    files = glob.glob(CLEAN_FILES)
+    if not files:
+        return synthetic_articles(num_synthetic)
+    return pd.concat([pd.read_pickle(file)[[ib.ARTICLE]] for file in files],
+                     ignore_index=True)
+
+
+def time_matcher(function, df, words, index_name):
+    '''
+    Runs a has_list_of_words implementation on a copy of df.
+        Returns:
+            - (seconds, boolean column)
+    '''
+    df = df.copy()
+    start = time.perf_counter()
+    df = function(df, ib.ARTICLE, words, index_name)
+    return time.perf_counter() - start, df[index_name + ' count']
+
+
+def run_benchmark(num_synthetic=50000):
+    '''
+    Compares both matchers for the keyword lists of main.py and prints
+    the time of each, speed-up and the number of articles marked
+    differently.
+        Returns:
+            - dict mapping index name to a dict with the results
+    '''
+    df = load_articles(num_synthetic)
+    report = {}
+    print("{} articles".format(len(df)))
+    print("index               legacy s  single pass s  speed-up  mismatches")
+    for index_name, words in KEYWORDS.items():
+        old_time, old = time_matcher(legacy_has_list_of_words, df, words,
+                                     index_name)
+        new_time, new = time_matcher(ib.has_list_of_words, df, words,
+                                     index_name)
+        mismatches = int((old.to_numpy(dtype=bool) !=
+                          new.to_numpy(dtype=bool)).sum())
+        report[index_name] = {"articles": len(df), "legacy": old_time,
+                              "single_pass": new_time,
+                              "mismatches": mismatches}
+        print("{:<18}  {:>8.2f}  {:>13.2f}  {:>7.1f}x  {:>10}".format(
+            index_name, old_time, new_time, old_time / new_time, mismatches))
+        assert mismatches == 0, index_name + ": the matchers differ"
+    return report
+
+
+if __name__ == "__main__":
+    run_benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 50000)
@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+"""
+Purpose: Benchmark for the month and newspaper aggregation of
+NewspaperIndex.make_index. Runs the original steps (period conversion,
+two group bys, a join and a third group by over the dataframe) and the
+CountMatrix of index_builder (a bincount into a dense month x newspaper
+matrix) over synthetic corpora of growing size, reports the time of each
+and checks that both give exactly the same index values.
+
+Only the aggregation is timed: the keyword matches are drawn at random
+(see bench_index.py for the keyword matcher).
+
+Usage (from the scripts directory):
+    python3 bench_make_index.py [number of articles ...]
+
+Authors:
+Diego Diaz
+Rukhshan Arif Mian
+Piyush Tank
+"""
+
+import sys
+import time
+import numpy as np
+import pandas as pd
+import index_builder as ib
+
+SIZES = [10000, 100000, 1000000, 10000000]
+NEWSPAPERS = ['NZ Herald', 'Stuff', 'tvnz_one_news']
+#Share of the articles of each newspaper
+NEWSPAPER_SHARES = [0.5, 0.35, 0.15]
+FIRST_DAY = '2009-01-01'
+NUM_DAYS = 4100
+MATCH_RATE = 0.01
+INDEX_NAME = 'EPU'
+
+
+def synthetic_corpus(num_articles, seed=0):
+    '''
+    Newspaper, date and a placeholder article (missing for a few
+    articles) of num_articles synthetic articles, plus a random keyword
+    match for each.
+        Returns:
+            - (df, mask)
+    '''
+    rng = np.random.default_rng(seed)
+    days = rng.integers(0, NUM_DAYS, num_articles)
+    article = np.full(num_articles, 'text', dtype=object)
+    article[rng.random(num_articles) < 0.001] = None
+    df = pd.DataFrame({
+        ib.NEWSPAPER: np.array(NEWSPAPERS, dtype=object)[
+            rng.choice(len(NEWSPAPERS), num_articles, p=NEWSPAPER_SHARES)],
+        ib.DATE: pd.Timestamp(FIRST_DAY) + pd.to_timedelta(days, unit='D'),
+        ib.ARTICLE: article})
+    return df, rng.random(num_articles) < MATCH_RATE
+
+
+def legacy_make_index(df, mask, index_name):
+    '''
+    Steps 2 to 4 of make_index as they were before the CountMatrix, kept
+    as the reference for the equivalence check
+    '''
+    df = df.copy()
+    df[index_name + ' count'] = mask
+    df['month_year'] = df[ib.DATE].dt.to_period('M')
+    group_by = df.groupby(['month_year', 'newspaper']).agg({index_name + ' count':\
+               'sum', ib.ARTICLE:'count'}).rename(columns={ib.ARTICLE:ib.N_ARTICLES})\
+                .reset_index()
+    group_by[index_name] = group_by[index_name\
+        + " count"] / group_by[ib.N_ARTICLES]
+
+    counts_by_newspaper = group_by.reset_index().groupby('month_year').agg({ib.N_ARTICLES: 'sum'})\
+    .rename(columns={ib.N_ARTICLES:'total articles'})
+
+    new_df = group_by.join(counts_by_newspaper)
+    new_df['newspaper weight'] = new_df['total articles'] \
+    / new_df[ib.N_ARTICLES]
+    new_df['weighted ' + index_name] = new_df['newspaper weight']\
+    * new_df[index_name]
+
+    total_df = new_df.groupby('month_year').agg({index_name:'sum', \
+                             }).reset_index()
+    return total_df
+
+
+def matrix_make_index(df, mask, index_name):
+    '''
+    Steps 2 to 4 of make_index with the CountMatrix
+    '''
+    return ib.CountMatrix(ib.month_ordinals(df[ib.DATE]),
+                          df[ib.NEWSPAPER].array,
+                          df[ib.ARTICLE].notna().to_numpy(),
+                          {index_name: mask}).index(index_name)
+
+
+def time_function(function, df, mask):
+    '''
+    Runs an implementation and returns its result and the seconds taken
+    '''
+    start = time.perf_counter()
+    result = function(df, mask, INDEX_NAME)
+    return result, time.perf_counter() - start
+
+
+def run_benchmark(sizes=None):
+    '''
+    Times both implementations for every size and prints the results
+    '''
+    print("{:>12}{:>12}{:>12}{:>10}".format("articles", "legacy s",
+                                            "matrix s", "speed-up"))
+    for num_articles in sizes or SIZES:
+        df, mask = synthetic_corpus(num_articles)
+        legacy, legacy_seconds = time_function(legacy_make_index, df, mask)
+        matrix, matrix_seconds = time_function(matrix_make_index, df, mask)
+        pd.testing.assert_frame_equal(legacy, matrix, check_exact=True)
+        print("{:>12,}{:>12.3f}{:>12.3f}{:>10.1f}".format(
+            num_articles, legacy_seconds, matrix_seconds,
+            legacy_seconds / matrix_seconds))
+
+
+if __name__ == "__main__":
+    run_benchmark([int(size) for size in sys.argv[1:]] or None)
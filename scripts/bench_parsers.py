@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+"""
+Purpose: Benchmark for the parsing backends. Runs the article extractor
+of each site with the original BeautifulSoup code ('bs4' backend) and
+with the lxml selector extraction ('lxml' backend) over stored pages,
+reports pages per second for each, and checks that both give identical
+fields for every page.
+
+Pages are read from <pages_dir>/<site>/*.html when that folder exists,
+and otherwise from the crawlers' response cache.
+
+Usage (from the scripts directory):
+    python3 bench_parsers.py [pages_dir]
+
+Authors:
+Diego Diaz
+Rukhshan Arif Mian
+Piyush Tank
+"""
+
+import glob
+import os
+import sys
+import time
+import cache
+import parsers
+
+DEFAULT_PAGES_DIR = "../data/sample_pages"
+#Text that identifies the pages of each site in the response cache
+SITE_URLS = {'herald': 'nzherald.co.nz', 'stuff': 'stuff.co.nz',
+             'tvnz': 'tvnz.co.nz'}
+
+
+def load_pages(site, pages_dir=DEFAULT_PAGES_DIR, limit=500):
+    '''
+    Loads up to limit stored pages of a site.
+        Inputs:
+            - site (str): 'herald', 'stuff' or 'tvnz'
+            - pages_dir (str): Folder with one subfolder of .html pages
+            per site
+            - limit (int): Maximum number of pages
+        Returns:
+            - list of bytes
+    '''
+    files = sorted(glob.glob(os.path.join(pages_dir, site, "*.html")))[:limit]
+    if files:
+        pages = []
+        for path in files:
+            with open(path, "rb") as page:
+                pages.append(page.read())
+        return pages
+
+    if not os.path.exists(os.path.join(cache.DEFAULT_CACHE_DIR,
+                                       "index.sqlite")):
+        return []
+    response_cache = cache.ResponseCache()
+    pages = []
+    for url in response_cache.urls(SITE_URLS[site])[:limit]:
+        response = response_cache.get(url)
+        if response is not None:
+            pages.append(response.content)
+    response_cache.close()
+    return pages
+
+
+def time_backend(site, pages, backend):
+    '''
+    Extracts every page with a backend.
+        Returns:
+            - (pages per second, list of extracted fields)
+    '''
+    start = time.perf_counter()
+    results = [parsers.extract(site, page, backend) for page in pages]
+    elapsed = time.perf_counter() - start
+    return len(pages) / elapsed if elapsed else float('inf'), results
+
+
+def run_benchmark(pages_dir=DEFAULT_PAGES_DIR):
+    '''
+    Compares both backends on the stored pages of every site and prints
+    pages per second, speed-up and the number of pages whose fields
+    differ.
+        Returns:
+            - dict mapping site to a dict with the results
+    '''
+    report = {}
+    print("site     pages   bs4 pages/s  lxml pages/s  speed-up  mismatches")
+    for site in parsers.BACKENDS['lxml']:
+        pages = load_pages(site, pages_dir)
+        if not pages:
+            print("{:<7}  no stored pages".format(site))
+            continue
+        bs4_rate, bs4_fields = time_backend(site, pages, 'bs4')
+        lxml_rate, lxml_fields = time_backend(site, pages, 'lxml')
+        mismatches = sum(1 for old, new in zip(bs4_fields, lxml_fields)
+                         if old != new)
+        report[site] = {"pages": len(pages), "bs4": bs4_rate,
+                        "lxml": lxml_rate, "mismatches": mismatches}
+        print("{:<7}  {:>5}  {:>12.1f}  {:>12.1f}  {:>8.1f}x  {:>10}".format(
+            site, len(pages), bs4_rate, lxml_rate, lxml_rate / bs4_rate,
+            mismatches))
+    return report
+
+
+if __name__ == "__main__":
+    run_benchmark(sys.argv[1] if len(sys.argv) > 1 else DEFAULT_PAGES_DIR)
@@ -0,0 +1,238 @@
+# -*- coding: utf-8 -*-
+"""
+Purpose: Benchmark harness for the index and cleaning pipeline over the
+synthetic corpora of synthetic.py, from 10 thousand up to 10 million
+rows. Times:
+    - has_list_of_words, remove_stopwords and clean_herald, which work
+    row by row: the corpus is generated and timed a chunk at a time, so
+    every size runs in bounded memory
+    - make_index (NewspaperIndex) and stuff_clean.clean, which need the
+    whole corpus at once: sizes above MAX_WHOLE_ROWS are recorded as
+    skipped
+Generating the data is not timed. The results (seconds and rows per
+second of every stage and size, plus the versions and machine they were
+measured on) are saved as JSON. When a baseline file exists, every
+result is compared with it and a stage that got slower than the
+tolerance is reported as a regression (exit code 1).
+
+Usage (from the scripts directory):
+    python3 bench_pipeline.py [--sizes 10000 100000 ...]
+        [--stages make_index ...] [--save] [--baseline FILE]
+
+Authors:
+Diego Diaz
+Rukhshan Arif Mian
+Piyush Tank
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import herald_cleaner
+import index_builder as ib
+import stuff_clean
+import synthetic
+import writer
+
+SIZES = [10000, 100000, 1000000, 10000000]
+#Largest corpus the whole corpus stages load at once
+MAX_WHOLE_ROWS = 300000
+BASELINE = "../benchmarks/baseline.json"
+#Share of the baseline rows per second a stage may lose
+TOLERANCE = 0.25
+INDEX_NAME = 'EPU'
+INDEX_WORDS = ['econ', 'policy', 'uncert']
+
+
+def has_list_of_words(df):
+    '''
+    Keyword matcher of the EPU index
+    '''
+    return ib.has_list_of_words(df, ib.ARTICLE, INDEX_WORDS, INDEX_NAME)
+
+
+def remove_stopwords(df):
+    '''
+    Stopword removal of the Herald cleaner on the articles
+    '''
+    return herald_cleaner.remove_stopwords(df, ib.ARTICLE)
+
+
+def make_index(df):
+    '''
+    EPU index of the whole corpus
+    '''
+    return ib.NewspaperIndex(df, INDEX_NAME, INDEX_WORDS)
+
+
+def stuff_clean_files(directory):
+    '''
+    Cleans the raw Stuff part files of a folder into a pickle next to it
+    (without printing the first rows)
+    '''
+    with contextlib.redirect_stdout(io.StringIO()):
+        return stuff_clean.clean(directory, directory + ".pkl")
+
+
+def write_parts(chunks, directory):
+    '''
+    Saves chunks of raw articles as part files, as the crawlers do
+    '''
+    os.makedirs(directory)
+    for number, chunk in enumerate(chunks):
+        table = pa.Table.from_pandas(
+            chunk, schema=pa.schema([(column, pa.string())
+                                     for column in chunk.columns]),
+            preserve_index=False)
+        pq.write_table(table, os.path.join(
+            directory, writer.PART_PATTERN.format(number)))
+
+
+#For every stage: the synthetic chunks it runs on, the function timed and
+#whether it runs a chunk at a time
+STAGES = {
+    'has_list_of_words': (synthetic.clean_chunk, has_list_of_words, True),
+    'remove_stopwords': (synthetic.clean_chunk, remove_stopwords, True),
+    'clean_herald': (synthetic.raw_herald_chunk,
+                     herald_cleaner.clean_herald, True),
+    'make_index': (synthetic.clean_chunk, make_index, False),
+    'stuff_clean': (synthetic.raw_stuff_chunk, stuff_clean_files, False),
+}
+
+
+def time_stage(stage, num_rows, chunk_size=synthetic.CHUNK_SIZE, seed=0):
+    '''
+    Times a stage over the first num_rows rows of its synthetic corpus.
+        Returns:
+            - dict with the seconds and rows per second, or with the
+            reason the size was skipped
+    '''
+    make_chunk, function, streamed = STAGES[stage]
+    chunks = synthetic.chunks(make_chunk, num_rows, chunk_size, seed)
+    seconds = 0.0
+    if streamed:
+        for chunk in chunks:
+            start = time.perf_counter()
+            function(chunk)
+            seconds += time.perf_counter() - start
+    elif num_rows > MAX_WHOLE_ROWS:
+        return {"skipped": "needs the whole corpus in memory (more than " +
+                           str(MAX_WHOLE_ROWS) + " rows)"}
+    elif stage == 'stuff_clean':
+        folder = tempfile.mkdtemp()
+        try:
+            write_parts(chunks, os.path.join(folder, "raw"))
+            start = time.perf_counter()
+            function(os.path.join(folder, "raw"))
+            seconds = time.perf_counter() - start
+        finally:
+            shutil.rmtree(folder)
+    else:
+        df = pd.concat(list(chunks), ignore_index=True)
+        start = time.perf_counter()
+        function(df)
+        seconds = time.perf_counter() - start
+    return {"seconds": round(seconds, 4),
+            "rows_per_second": round(num_rows / seconds, 1)}
+
+
+def environment():
+    '''
+    Versions and machine the results were measured on
+    '''
+    return {"python": platform.python_version(), "pandas": pd.__version__,
+            "numpy": np.__version__, "pyarrow": pa.__version__,
+            "machine": platform.machine(), "system": platform.system(),
+            "cpus": os.cpu_count(), "chunk_size": synthetic.CHUNK_SIZE,
+            "max_whole_rows": MAX_WHOLE_ROWS,
+            "date": time.strftime("%Y-%m-%d")}
+
+
+def run_benchmarks(stages, sizes):
+    '''
+    Times every stage for every size, printing the results as they come
+        Returns:
+            - dict mapping stage to a dict mapping size (as text) to the
+            result of time_stage
+    '''
+    results = {}
+    for stage in stages:
+        results[stage] = {}
+        for num_rows in sizes:
+            result = time_stage(stage, num_rows)
+            results[stage][str(num_rows)] = result
+            print("{:<20}{:>12,}  ".format(stage, num_rows) + (
+                result["skipped"] if "skipped" in result else
+                "{:>10.3f} s{:>14,.0f} rows/s".format(
+                    result["seconds"], result["rows_per_second"])))
+    return results
+
+
+def regressions(results, baseline, tolerance=TOLERANCE):
+    '''
+    Stages and sizes whose rows per second fell below (1 - tolerance)
+    times the baseline
+        Returns:
+            - list of (stage, size, rows per second, baseline rows per
+            second)
+    '''
+    slower = []
+    for stage, by_size in results.items():
+        for size, result in by_size.items():
+            before = baseline.get(stage, {}).get(size, {})
+            if "rows_per_second" in result and "rows_per_second" in before \
+                    and result["rows_per_second"] < \
+                    (1 - tolerance) * before["rows_per_second"]:
+                slower.append((stage, size, result["rows_per_second"],
+                               before["rows_per_second"]))
+    return slower
+
+
+def main(argv):
+    '''
+    Runs the benchmarks and saves or checks them against the baseline
+    '''
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES)
+    parser.add_argument("--stages", nargs="+", choices=list(STAGES),
+                        default=list(STAGES))
+    parser.add_argument("--baseline", default=BASELINE)
+    parser.add_argument("--save", action="store_true",
+                        help="save the results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE)
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(args.stages, args.sizes)
+    if args.save:
+        if os.path.dirname(args.baseline):
+            os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, "w") as file:
+            json.dump({"environment": environment(), "results": results},
+                      file, indent=2)
+        print("Baseline saved to " + args.baseline)
+        return 0
+    if not os.path.exists(args.baseline):
+        print("No baseline in " + args.baseline + ", run with --save")
+        return 0
+    with open(args.baseline) as file:
+        baseline = json.load(file)
+    slower = regressions(results, baseline["results"], args.tolerance)
+    for stage, size, now, before in slower:
+        print("REGRESSION {} at {} rows: {:,.0f} rows/s, baseline "
+              "{:,.0f}".format(stage, size, now, before))
+    return 1 if slower else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
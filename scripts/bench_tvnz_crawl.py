@@ -0,0 +1,255 @@
+# -*- coding: utf-8 -*-
+"""
+Purpose: Benchmark for the TVNZ link crawler. Starts a local server with
+a mirror of a TVNZ One News snapshot (a home page, section pages that
+link to each other and to their stories, and story pages that link back
+and to related stories, all under web.archive-like urls), answering
+every page after a fixed delay. It then crawls the mirror with:
+    - the serial breadth-first crawler as it was before the LinkFrontier
+    (one page at a time, a full soup per page and links deduplicated on
+    a list)
+    - tvnz_crawler.crawl_and_get_article_links with different numbers
+    of threads
+and reports the pages per second of each. With a page budget larger
+than the mirror, every crawler must find the same story pages, which is
+checked. A smaller budget (second argument) shows how many stories
+each crawler finds before the budget runs out.
+No request leaves the machine.
+
+Usage (from the scripts directory):
+    python3 bench_tvnz_crawl.py [num_stories] [page_budget] [delay]
+
+Authors:
+Diego Diaz
+Rukhshan Arif Mian
+Piyush Tank
+"""
+
+import queue
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import parsers
+import sessions
+import tvnz_crawler
+import util
+
+CONCURRENCY_LEVELS = [1, 4, 8, 16]
+SECTIONS = ['new-zealand', 'world', 'politics', 'business', 'sport',
+            'entertainment', 'weather', 'health']
+PREFIX = '/web/20180507013014/https://www.tvnz.co.nz/one-news'
+WORDS = ['government', 'says', 'new', 'plan', 'police', 'auckland', 'rugby',
+         'storm', 'budget', 'election', 'minister', 'report', 'wins', 'after']
+RELATED_STORIES = 5
+
+PAGE = '''<html><head><title>{title}</title></head><body>
+<nav><a href="{prefix}">Home</a>{nav}</nav>
+{story}
+<ul>{links}</ul>
+<footer><a href="#top">Top</a><a href="mailto:news@tvnz.co.nz">Contact</a>
+</footer></body></html>'''
+STORY = '''<div class="storyPage first-page"><h1>{title}</h1>
+<p>Story text of {title}.</p><p>Second paragraph.</p></div>'''
+
+
+def make_mirror(num_stories, seed=0):
+    '''
+    Pages of a synthetic TVNZ snapshot
+        Returns:
+            - (pages, stories) where pages maps every path to its html and
+            stories is the set of story paths
+    '''
+    rng = random.Random(seed)
+    nav = ''.join('<a href="{}/{}">{}</a>'.format(PREFIX, section, section)
+                  for section in SECTIONS)
+    by_section = {section: [] for section in SECTIONS}
+    for number in range(num_stories):
+        section = SECTIONS[number % len(SECTIONS)]
+        slug = '-'.join(rng.sample(WORDS, 4)) + '-' + str(number)
+        by_section[section].append(PREFIX + '/' + section + '/' + slug)
+    stories = [path for paths in by_section.values() for path in paths]
+
+    def link_list(paths):
+        return ''.join('<li><a href="{0}">{0}</a></li>'.format(path)
+                       for path in paths)
+
+    pages = {PREFIX: PAGE.format(title='One News', prefix=PREFIX, nav=nav,
+                                 story='', links=link_list(stories[::10]))}
+    for section, paths in by_section.items():
+        pages[PREFIX + '/' + section] = PAGE.format(
+            title=section, prefix=PREFIX, nav=nav, story='',
+            links=link_list(paths))
+    for path in stories:
+        title = path.rsplit('/', 1)[1]
+        related = rng.sample(stories, min(RELATED_STORIES, len(stories)))
+        pages[path] = PAGE.format(
+            title=title, prefix=PREFIX, nav=nav,
+            story=STORY.format(title=title), links=link_list(related))
+    return pages, set(stories)
+
+
+class MirrorHandler(BaseHTTPRequestHandler):
+    '''
+    Answers every GET with the page of the mirror after DELAY seconds,
+    which plays the role of the archive latency, or 404 for paths
+    outside the mirror
+    '''
+    DELAY = 0.02
+    PAGES = {}
+    served = 0
+    lock = threading.Lock()
+
+    def do_GET(self):
+        '''
+        Sleeps and returns the page
+        '''
+        time.sleep(self.DELAY)
+        page = self.PAGES.get(self.path)
+        if page is None:
+            self.send_error(404)
+            return
+        with MirrorHandler.lock:
+            MirrorHandler.served += 1
+        body = page.encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        '''
+        Keeps the benchmark output clean
+        '''
+        return
+
+
+class MirrorServer(ThreadingHTTPServer):
+    '''
+    Threaded server with a listen backlog large enough for the highest
+    concurrency level
+    '''
+    request_queue_size = 128
+    daemon_threads = True
+
+
+def start_mirror(pages, delay):
+    '''
+    Starts the mirror server in a background thread.
+        Returns:
+            - (server, base_url) tuple
+    '''
+    MirrorHandler.PAGES = pages
+    MirrorHandler.DELAY = delay
+    server = MirrorServer(('127.0.0.1', 0), MirrorHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, 'http://127.0.0.1:' + str(server.server_port)
+
+
+def legacy_get_all_links(soup, url):
+    '''
+    get_all_links as it was, deduplicating on a list
+    '''
+    all_links = []
+    for link in soup.find_all('a'):
+        if link.has_attr('href'):
+            link = util.remove_fragment(link['href'])
+            abs_link = util.convert_if_relative_url(url, link)
+            if abs_link not in all_links:
+                all_links.append(abs_link)
+    return all_links
+
+
+def legacy_crawl(num_pages_to_crawl, url_to_crawl):
+    '''
+    crawl_and_get_article_links as it was before the LinkFrontier: one
+    page at a time, breadth first, kept as the reference for the
+    comparison
+    '''
+    links_queue = queue.Queue()
+    links_set = {url_to_crawl}
+    links_queue.put(url_to_crawl)
+    article_links = set()
+    i = 0
+    while (i <= num_pages_to_crawl) and (links_queue.qsize() >= 1):
+        current_url = links_queue.get()
+        r_object = util.get_request(current_url)
+        if not r_object:
+            continue
+        soup = parsers.make_soup(r_object.content)
+        if tvnz_crawler.check_if_article(soup):
+            article_links.add(current_url)
+        for link in legacy_get_all_links(soup, current_url):
+            if link not in links_set:
+                links_queue.put(link)
+                links_set.add(link)
+        i += 1
+    return list(article_links)
+
+
+def time_crawl(name, crawl, base_url):
+    '''
+    Runs a crawler over the mirror and prints the pages it downloaded,
+    the seconds taken, the pages per second and the stories found
+        Returns:
+            - set of story urls found
+    '''
+    MirrorHandler.served = 0
+    start = time.perf_counter()
+    found = crawl(base_url + PREFIX)
+    elapsed = time.perf_counter() - start
+    print("{:<16}{:>7}{:>9.2f}{:>9.1f}{:>9}".format(
+        name, MirrorHandler.served, elapsed, MirrorHandler.served / elapsed,
+        len(found)))
+    return set(found)
+
+
+def run_benchmark(num_stories=400, page_budget=None, delay=0.02):
+    '''
+    Crawls the mirror with the serial crawler and the concurrent one at
+    every concurrency level
+        Inputs:
+            - num_stories (int): Story pages in the mirror
+            - page_budget (int): Pages each crawler may process, enough
+            for the whole mirror by default
+            - delay (float): Seconds each response takes
+        Returns:
+            - dict mapping crawler to pages per second
+    '''
+    #Every crawl must go to the server, not to the response cache, and
+    #the mirror never throttles
+    sessions.set_cache(None)
+    sessions.set_limiter(None)
+    pages, stories = make_mirror(num_stories)
+    budget = page_budget or len(pages) * 2
+    server, base_url = start_mirror(pages, delay)
+    expected = {base_url + path for path in stories}
+    print("mirror: {} pages, {} stories, budget {} pages".format(
+        len(pages), len(stories), budget))
+    print("{:<16}{:>7}{:>9}{:>9}{:>9}".format("crawler", "pages", "seconds",
+                                              "pages/s", "stories"))
+    try:
+        found = time_crawl("serial", lambda url: legacy_crawl(budget, url),
+                           base_url)
+        if page_budget is None:
+            assert found == expected, "serial crawler missed stories"
+        for concurrency in CONCURRENCY_LEVELS:
+            found = time_crawl(
+                "concurrent x" + str(concurrency),
+                lambda url, level=concurrency: tvnz_crawler.\
+                    crawl_and_get_article_links(budget, url, level),
+                base_url)
+            if page_budget is None:
+                assert found == expected, "concurrent crawler missed stories"
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    ARGS = [float(arg) for arg in sys.argv[1:]]
+    run_benchmark(int(ARGS[0]) if ARGS else 400,
+                  int(ARGS[1]) if len(ARGS) > 1 and ARGS[1] else None,
+                  ARGS[2] if len(ARGS) > 2 else 0.02)
@@ -0,0 +1,280 @@
+# -*- coding: utf-8 -*-
+"""
+Purpose: Persistent response cache for the crawlers. Archived pages in
+web.archive never change, so once a page has been downloaded it is kept
+on disk and later crawls (or re-runs after changing an extractor or a
+cleaner) read it from there instead of the network.
+
+Entries are keyed by url and kept in a small SQLite index. Bodies are
+compressed with zlib and stored once per content hash, so identical
+pages served under different urls take the space of one. Entries expire
+after a TTL and the least recently used ones are evicted when the cache
+grows over its size limit.
+
+Authors:
+Diego Diaz
+Rukhshan Arif Mian
+Piyush Tank
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+
+DEFAULT_CACHE_DIR = "../data/cache"
+#Archived snapshots never change, so entries live for a long time
+DEFAULT_TTL = 365 * 24 * 60 * 60
+DEFAULT_MAX_BYTES = 5 * 1024 ** 3
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS entries (
+    url TEXT PRIMARY KEY,
+    digest TEXT NOT NULL,
+    status INTEGER NOT NULL,
+    final_url TEXT,
+    headers TEXT,
+    encoding TEXT,
+    fetched_at REAL NOT NULL,
+    last_access REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entries_digest ON entries (digest);
+CREATE INDEX IF NOT EXISTS entries_last_access ON entries (last_access);
+CREATE TABLE IF NOT EXISTS blobs (
+    digest TEXT PRIMARY KEY,
+    size INTEGER NOT NULL
+);
+'''
+
+
+class CachedResponse():
+    '''
+    Stand-in for requests.Response built from a cache entry. It has the
+    attributes the crawlers use: status_code, content, text, url,
+    headers and encoding.
+    '''
+
+    def __init__(self, url, status_code, content, headers, encoding):
+        self.url = url
+        self.status_code = status_code
+        self.content = content
+        self.headers = headers
+        self.encoding = encoding
+        self.from_cache = True
+
+    @property
+    def text(self):
+        '''
+        Body decoded with the encoding of the original response
+        '''
+        return self.content.decode(self.encoding or 'utf-8', errors='replace')
+
+
+class ResponseCache():
+    '''
+    On-disk cache of successful responses, keyed by url and
+    deduplicated by the hash of the body.
+    '''
+
+    def __init__(self, directory=DEFAULT_CACHE_DIR, ttl=DEFAULT_TTL,
+                 max_bytes=DEFAULT_MAX_BYTES):
+        '''
+        Inputs:
+            - directory (str): Folder that holds the index and the bodies
+            - ttl (int): Seconds an entry stays valid, None for no expiry
+            - max_bytes (int): Maximum compressed size of the bodies
+        '''
+        self.directory = directory
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(os.path.join(directory, "blobs"), exist_ok=True)
+        self._db = sqlite3.connect(os.path.join(directory, "index.sqlite"),
+                                   check_same_thread=False)
+        self._db.executescript(SCHEMA)
+        self._total_bytes = self._db.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM blobs").fetchone()[0]
+
+    def _blob_path(self, digest):
+        return os.path.join(self.directory, "blobs", digest[:2], digest + ".z")
+
+    def get(self, url):
+        '''
+        Looks up a url.
+            Inputs:
+                - url (str): Url as it was requested
+            Returns:
+                - CachedResponse, or None if the url is not cached or its
+                entry has expired
+        '''
+        with self._lock:
+            row = self._db.execute(
+                "SELECT digest, status, final_url, headers, encoding, "
+                "fetched_at FROM entries WHERE url = ?", (url,)).fetchone()
+            if row is None or (self.ttl is not None
+                               and time.time() - row[5] > self.ttl):
+                self.misses += 1
+                return None
+        #The body is read and decompressed without the lock, so threads
+        #only wait for each other on the index
+        try:
+            with open(self._blob_path(row[0]), "rb") as blob:
+                content = zlib.decompress(blob.read())
+        except (OSError, zlib.error):
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self._db.execute("UPDATE entries SET last_access = ? WHERE url = ?",
+                             (time.time(), url))
+            self._db.commit()
+            self.hits += 1
+        return CachedResponse(row[2], row[1], content, json.loads(row[3]),
+                              row[4])
+
+    def put(self, url, response):
+        '''
+        Stores a response. Only responses with status 200 are cached.
+            Inputs:
+                - url (str): Url as it was requested
+                - response (requests.Response): Response to store
+        '''
+        if response.status_code != 200:
+            return
+        content = response.content
+        digest = hashlib.sha256(content).hexdigest()
+        headers = json.dumps({"Content-Type":
+                              response.headers.get("Content-Type", "")})
+        now = time.time()
+
+        with self._lock:
+            stored = self._db.execute("SELECT 1 FROM blobs WHERE digest = ?",
+                                      (digest,)).fetchone() is not None
+        size = None if stored else self._write_blob(digest, content)
+
+        with self._lock:
+            old = self._db.execute("SELECT digest FROM entries WHERE url = ?",
+                                   (url,)).fetchone()
+            if self._db.execute("SELECT 1 FROM blobs WHERE digest = ?",
+                                (digest,)).fetchone() is None:
+                #The body may have been evicted since it was looked up
+                if size is None or not os.path.exists(self._blob_path(digest)):
+                    size = self._write_blob(digest, content)
+                self._db.execute("INSERT INTO blobs VALUES (?, ?)",
+                                 (digest, size))
+                self._total_bytes += size
+            self._db.execute(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (url, digest, response.status_code, response.url, headers,
+                 response.encoding, now, now))
+            if old and old[0] != digest:
+                self._remove_if_orphan([old[0]])
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+            self._db.commit()
+
+    def _write_blob(self, digest, content):
+        '''
+        Compresses a body and writes it under its digest. The file is
+        written under a temporary name of the thread and then moved into
+        place, so readers never see half of it and threads writing the
+        same body do not clash. put calls it without the lock.
+            Returns:
+                - compressed size in bytes
+        '''
+        path = self._blob_path(digest)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        compressed = zlib.compress(content)
+        tmp_path = path + "." + str(threading.get_ident()) + ".tmp"
+        with open(tmp_path, "wb") as blob:
+            blob.write(compressed)
+        os.replace(tmp_path, path)
+        return len(compressed)
+
+    def _evict(self):
+        '''
+        Removes the least recently used entries until the bodies fit in
+        max_bytes. Called with the lock held.
+        '''
+        while self._total_bytes > self.max_bytes:
+            oldest = self._db.execute(
+                "SELECT url, digest FROM entries ORDER BY last_access LIMIT 100"
+                ).fetchall()
+            if not oldest:
+                break
+            self._db.executemany("DELETE FROM entries WHERE url = ?",
+                                 [(url,) for url, _ in oldest])
+            self._remove_if_orphan({digest for _, digest in oldest})
+
+    def _remove_if_orphan(self, digests):
+        '''
+        Deletes the bodies in digests that no entry points to anymore.
+        Called with the lock held.
+        '''
+        for digest in digests:
+            if self._db.execute("SELECT 1 FROM entries WHERE digest = ?",
+                                (digest,)).fetchone():
+                continue
+            row = self._db.execute("SELECT size FROM blobs WHERE digest = ?",
+                                   (digest,)).fetchone()
+            try:
+                os.remove(self._blob_path(digest))
+            except FileNotFoundError:
+                pass
+            if row:
+                self._total_bytes -= row[0]
+                self._db.execute("DELETE FROM blobs WHERE digest = ?",
+                                 (digest,))
+
+    def purge_expired(self):
+        '''
+        Deletes every entry older than the TTL, and the bodies only they
+        pointed to
+        '''
+        if self.ttl is None:
+            return
+        with self._lock:
+            expired = self._db.execute(
+                "SELECT url, digest FROM entries WHERE fetched_at < ?",
+                (time.time() - self.ttl,)).fetchall()
+            self._db.executemany("DELETE FROM entries WHERE url = ?",
+                                 [(url,) for url, _ in expired])
+            self._remove_if_orphan({digest for _, digest in expired})
+            self._db.commit()
+
+    def urls(self, pattern=None):
+        '''
+        Lists the cached urls.
+            Inputs:
+                - pattern (str): Only urls containing this text
+            Returns:
+                - list of str
+        '''
+        with self._lock:
+            rows = self._db.execute("SELECT url FROM entries WHERE url LIKE ?",
+                                    ('%' + (pattern or '') + '%',)).fetchall()
+        return [row[0] for row in rows]
+
+    def stats(self):
+        '''
+        Returns a dict with hits, misses, number of entries, number of
+        distinct bodies and their compressed size in bytes
+        '''
+        with self._lock:
+            entries = self._db.execute("SELECT COUNT(*) FROM entries"
+                                       ).fetchone()[0]
+            blobs = self._db.execute("SELECT COUNT(*) FROM blobs").fetchone()[0]
+        return {"hits": self.hits, "misses": self.misses, "entries": entries,
+                "bodies": blobs, "bytes": self._total_bytes}
+
+    def close(self):
+        '''
+        Closes the index
+        '''
+        with self._lock:
+            self._db.close()
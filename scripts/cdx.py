@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+"""
+Purpose: Bulk discovery of article urls through the Wayback Machine CDX
+server. Instead of downloading one homepage snapshot per day and
+scraping the links out of it, this pages through the CDX listing of
+every capture of a domain in a date range, keeps the urls that pass the
+article check of each site and removes duplicates by canonical url.
+
+The CDX server address can be changed (cdx_url) so that the discovery
+can be run against a local stand-in.
+
+Authors:
+Diego Diaz
+Rukhshan Arif Mian
+Piyush Tank
+"""
+
+import json
+import re
+import urllib.parse
+import fetcher
+import parsers
+import sessions
+
+CDX_URL = "https://web.archive.org/cdx/search/cdx"
+WAYBACK_URL = "https://web.archive.org/web/"
+#Captures asked for in each page of the listing
+PAGE_SIZE = 5000
+
+
+def herald_is_article(url):
+    '''
+    Same check as herald_crawler.get_articles: NZ Herald articles have an
+    objectid in their url
+    '''
+    return url.find("objectid") >= 0
+
+
+def stuff_is_article(url):
+    '''
+    Same check as stuff_crawler.check_if_article, applied to the
+    web.archive url of the capture: the timestamp and the story id are
+    two runs of six or more digits
+    '''
+    return len(re.findall(r'\d{6,}', url)) == 2
+
+
+def tvnz_is_article(url):
+    '''
+    TVNZ stories live at /one-news/<section>/<slug>. Whether a page is
+    a story (the storyPage check of tvnz_crawler) can only be told from
+    its content, so this is a first filter and discover() checks the
+    pages themselves when verify is set.
+    '''
+    path = urllib.parse.urlparse(url[len(WAYBACK_URL) + 15:]).path
+    parts = [part for part in path.split('/') if part]
+    return len(parts) >= 3 and parts[0] == 'one-news'
+
+
+SITES = {
+    'herald': {'domain': 'nzherald.co.nz', 'predicate': herald_is_article,
+               'keep_params': ('objectid',), 'wayback': False},
+    'stuff': {'domain': 'stuff.co.nz', 'predicate': stuff_is_article,
+              'keep_params': (), 'wayback': True},
+    'tvnz': {'domain': 'tvnz.co.nz', 'predicate': tvnz_is_article,
+             'keep_params': (), 'wayback': True},
+}
+
+
+def canonical_url(url, keep_params=()):
+    '''
+    Canonical form of a site url, used to find duplicates: https scheme,
+    lower case host without www, no fragment, no trailing slash and no
+    query string except for the parameters in keep_params.
+        Inputs:
+            - url (str): Site url, or a web.archive url of a capture
+            - keep_params (tuple of str): Query parameters that identify
+            the page and must be kept
+        Returns:
+            - str
+    '''
+    if url.startswith(WAYBACK_URL):
+        url = url[len(WAYBACK_URL) + 15:]
+    parsed = urllib.parse.urlsplit(url)
+    host = parsed.netloc.lower().split(':')[0]
+    if host.startswith('www.'):
+        host = host[4:]
+    query = urllib.parse.urlencode(sorted(
+        (key, value) for key, value in urllib.parse.parse_qsl(parsed.query)
+        if key.lower() in keep_params))
+    return urllib.parse.urlunsplit(('https', host, parsed.path.rstrip('/'),
+                                    query, ''))
+
+
+def iter_captures(domain, start_date, end_date, cdx_url=CDX_URL,
+                  page_size=PAGE_SIZE, get=sessions.get):
+    '''
+    Pages through the CDX listing of the successful captures of a domain.
+        Inputs:
+            - domain (str): Domain, all its subdomains are included
+            - start_date, end_date (str): YYYYMMDD, both included
+            - cdx_url (str): Address of the CDX server
+            - page_size (int): Captures per page of the listing
+            - get (function): Function that fetches a url
+        Yields:
+            - (timestamp, original url) tuples
+    '''
+    params = {'url': domain, 'matchType': 'domain', 'from': start_date,
+              'to': end_date, 'output': 'json', 'fl': 'timestamp,original',
+              'filter': 'statuscode:200', 'collapse': 'urlkey',
+              'limit': page_size, 'showResumeKey': 'true'}
+    while True:
+        response = get(cdx_url + '?' + urllib.parse.urlencode(params))
+        if response is None or response.status_code != 200:
+            return
+        rows = json.loads(response.text or '[]')
+        resume_key = None
+        #The last row holds the resume key when there are more pages,
+        #after an empty row
+        if len(rows) >= 2 and rows[-2] == []:
+            resume_key = rows[-1][0]
+            rows = rows[:-2]
+        for row in rows[1:]:
+            yield row[0], row[1]
+        if not resume_key:
+            return
+        params['resumeKey'] = resume_key
+
+
+def discover(site, start_date, end_date, cdx_url=CDX_URL, verify=False,
+             concurrency=fetcher.DEFAULT_CONCURRENCY):
+    '''
+    Finds the article urls of a site captured between two dates.
+        Inputs:
+            - site (str): 'herald', 'stuff' or 'tvnz'
+            - start_date, end_date (str): YYYYMMDD, both included
+            - cdx_url (str): Address of the CDX server
+            - verify (bool): Download every candidate and keep only the
+            ones whose content is an article. Only needed for TVNZ.
+            - concurrency (int): Requests in flight when verifying
+        Returns:
+            - list of urls in the form the crawler of the site uses: the
+            site url for the Herald, the web.archive url for Stuff and
+            TVNZ. The first capture of every canonical url is used.
+    '''
+    config = SITES[site]
+    seen = set()
+    urls = []
+    for timestamp, original in iter_captures(config['domain'], start_date,
+                                             end_date, cdx_url):
+        canonical = canonical_url(original, config['keep_params'])
+        if canonical in seen:
+            continue
+        wayback_url = WAYBACK_URL + timestamp + '/' + original
+        if not config['predicate'](wayback_url):
+            continue
+        seen.add(canonical)
+        urls.append(wayback_url if config['wayback'] else original)
+
+    if verify:
+        urls = [url for url, is_article in check_articles(urls, concurrency)
+                if is_article]
+    return urls
+
+
+def check_articles(urls, concurrency=fetcher.DEFAULT_CONCURRENCY,
+                   get=sessions.get):
+    '''
+    Downloads the pages batch by batch and tells whether each one is a
+    TVNZ story. Only the answer is kept, so the pages of a batch are
+    released before the next batch is downloaded.
+        Inputs:
+            - urls (list of str): Urls to check
+            - concurrency (int): Requests in flight
+            - get (function): Function that fetches a url
+        Yields:
+            - (url, is_article) tuples, in the order of urls
+    '''
+    for url, response in fetcher.iter_fetch(urls, concurrency, get):
+        yield url, (response is not None and response.status_code == 200
+                    and parsers.tvnz_is_article(response.content))
@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+"""
+Purpose: Cleans the raw data of the three newspapers with one command.
+The raw articles of every source are split in chunks and the cleaning
+steps that work row by row (herald_cleaner.clean_chunk for the Herald,
+stuff_clean.clean_columns for Stuff, tvnz_clean.clean_tvnz_frame for
+TVNZ) run on the chunks of all sources at the same time in a pool
+of processes, one per core. The cleaned chunks are put back together in
+their original order, so the result does not depend on which process
+finished first, and the steps that need every article of a source
+(removing repeated urls for Stuff and repeated titles for TVNZ) run on
+the whole source, as in the cleaner of each source.
+
+Usage (from the scripts directory):
+    python3 clean_all.py [number of processes]
+
+Authors:
+Diego Diaz
+Rukhshan Arif Mian
+Piyush Tank
+"""
+
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+import corpus
+import herald_cleaner
+import instrument
+import stuff_clean
+import tvnz_clean
+import writer
+
+#Rows of every chunk sent to a process
+CHUNK_SIZE = 10000
+CLEAN_DIRECTORY = "../data/clean/"
+#Raw data of every source, the same the cleaner of each source uses
+RAW_HERALD = "../data/raw/herald_sample"
+RAW_STUFF = "../data/raw/test_stuff_raw"
+RAW_TVNZ = "../data/raw/"
+
+
+def load_herald(path=RAW_HERALD):
+    '''
+    Raw Herald articles
+    '''
+    return writer.read_parts(path)
+
+
+def load_stuff(path=RAW_STUFF):
+    '''
+    Raw Stuff articles with the project columns and without repeated
+    urls, chosen as in stuff_clean.clean (the url is deduplicated on the
+    raw articles, before they are cleaned)
+    '''
+    stuff_df = stuff_clean.select_articles(writer.read_parts(path))
+    return stuff_df.sort_values(by=stuff_clean.ARTICLE)\
+        .drop_duplicates([stuff_clean.URL])
+
+
+def load_tvnz(location=RAW_TVNZ):
+    '''
+    Raw TVNZ articles from the part files and the batch csv files
+    '''
+    tvnz_clean.append_all_tvnz_batches(location)
+    return pd.read_pickle(location + 'tvnz_raw_data.pkl')
+
+
+def finish_stuff(stuff_df):
+    '''
+    Same final order as stuff_clean.clean
+    '''
+    return stuff_df.sort_values(by=stuff_clean.ARTICLE)
+
+
+def finish_tvnz(data):
+    '''
+    Removes the repeated titles, as in tvnz_clean.clean_tvnz_articles
+    '''
+    return data.drop_duplicates(subset='title', keep='first')
+
+
+#For every source: how to load it, the row by row cleaning that runs in
+#the processes, the steps that run on the whole source after the merge
+#and the clean file, the same one the cleaner of the source writes
+SOURCES = {
+    'herald': (load_herald, herald_cleaner.clean_chunk, None,
+               'herald_clean_sample.pkl'),
+    'stuff': (load_stuff, stuff_clean.clean_columns, finish_stuff,
+              'test_stuff_clean.pkl'),
+    'tvnz': (load_tvnz, tvnz_clean.clean_tvnz_frame, finish_tvnz,
+             'sample_tvnz_clean_data.pkl'),
+}
+
+
+def _clean_chunk(task):
+    '''
+    Runs in a worker process: cleans one chunk of one source
+    '''
+    source, position, chunk = task
+    return source, position, SOURCES[source][1](chunk)
+
+
+def split(data_frame, chunk_size=CHUNK_SIZE):
+    '''
+    Splits a dataframe in consecutive chunks of at most chunk_size rows
+    '''
+    return [data_frame.iloc[start:start + chunk_size]
+            for start in range(0, len(data_frame), chunk_size)]
+
+
+@instrument.timed()
+def clean_all(sources=None, workers=None, chunk_size=CHUNK_SIZE,
+              output_directory=CLEAN_DIRECTORY, store_root=None):
+    '''
+    Cleans the given sources in a process pool and saves one clean
+    pickle per source.
+        Inputs:
+            - sources (dict): Maps source name ('herald', 'stuff' or
+            'tvnz') to the raw data location to load, the default of each
+            source if None. All sources by default
+            - workers (int): Number of processes, one per core by default
+            - chunk_size (int): Rows of every chunk
+            - output_directory (str): Folder for the clean pickles
+            - store_root (str): If given, the clean articles are also
+            added to the corpus store in this folder
+        Returns:
+            - dict mapping source name to its clean dataframe
+    '''
+    if sources is None:
+        sources = {name: None for name in SOURCES}
+
+    tasks = []
+    chunk_counts = {}
+    for source, location in sources.items():
+        load = SOURCES[source][0]
+        raw = load() if location is None else load(location)
+        chunks = split(raw, chunk_size)
+        chunk_counts[source] = len(chunks)
+        tasks += [(source, position, chunk)
+                  for position, chunk in enumerate(chunks)]
+
+    start = time.perf_counter()
+    cleaned = {}
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+        for source, position, chunk in pool.map(_clean_chunk, tasks):
+            cleaned[(source, position)] = chunk
+    print("Cleaned " + str(len(tasks)) + " chunks in " +
+          "{:.2f}".format(time.perf_counter() - start) + " seconds")
+
+    results = {}
+    for source in sources:
+        frames = [cleaned[(source, position)]
+                  for position in range(chunk_counts[source])]
+        if not frames:
+            continue
+        data = pd.concat(frames) if len(frames) > 1 else frames[0]
+        finish = SOURCES[source][2]
+        if finish is not None:
+            data = finish(data)
+        data.to_pickle(output_directory + SOURCES[source][3])
+        if store_root is not None:
+            corpus.write(data, store_root)
+        print(source + ": " + str(len(data)) + " clean articles")
+        results[source] = data
+    return results
+
+
+if __name__ == "__main__":
+    clean_all(workers=int(sys.argv[1]) if len(sys.argv) > 1 else None)
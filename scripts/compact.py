@@ -0,0 +1,332 @@
+# -*- coding: utf-8 -*-
+"""
+Purpose: Compact in-memory representation of the clean corpus. Instead of
+one Python string per newspaper, url, title and article and one Timestamp
+per date, the corpus is kept as:
+    - newspaper: small integer codes into the list of newspapers
+    - url: integer codes into the list of distinct url prefixes (the
+    Wayback Machine address plus the host of the original site), the
+    14 digit Wayback timestamp as an integer, and the rest of the url
+    - title, article and the rest of the url: Arrow string arrays (a
+    single buffer with all the texts plus their offsets)
+    - date: datetime64 values, and the month of every article as int32
+    month codes (months since January 1970, the ordinals of monthly
+    periods)
+NewspaperIndex, build_indices and the keyword matchers of index_builder
+accept a CompactCorpus in place of the clean dataframe.
+
+Usage (from the scripts directory), to compare the memory of the clean
+corpus as a dataframe and as a CompactCorpus:
+    python3 compact.py
+
+Authors:
+Diego Diaz
+Rukhshan Arif Mian
+Piyush Tank
+"""
+
+import sys
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import corpus
+import index_builder as ib
+import instrument
+
+CLEAN_FILES = "../data/clean/*pkl"
+#Texts turned into Python strings at a time by the keyword matchers
+BATCH_SIZE = 10000
+#Month code of articles without a date
+NO_MONTH = np.iinfo(np.int32).min
+#Timestamp of urls that are not Wayback Machine captures
+NO_STAMP = -1
+#Splits a url into an interned prefix (Wayback address and host of the
+#original site), the capture timestamp and the rest. The groups cover the
+#whole url, so joining them gives it back unchanged
+URL_PARTS = (r'^(?:(?P<archive>https?://web\.archive\.org/web/)'
+             r'(?P<stamp>[0-9]{14})?)?'
+             r'(?P<host>(?:[a-z_]*/)?[A-Za-z]+://[^/]*)?'
+             r'(?P<path>.*)$')
+STAMP_FORMAT = "{:014d}"
+
+
+def _codes(values):
+    '''
+    Dictionary codes of an Arrow array, in the smallest integer type, and
+    the list of distinct values. Missing values get the code -1.
+    '''
+    encoded = pc.dictionary_encode(pa.chunked_array([values])
+                                   .combine_chunks())
+    categories = encoded.dictionary.to_pylist()
+    dtype = np.int8 if len(categories) < 2 ** 7 else np.int32
+    codes = encoded.indices.fill_null(-1).to_numpy(zero_copy_only=False)
+    return codes.astype(dtype), categories
+
+
+def _text(values):
+    '''
+    Arrow string array of a column
+    '''
+    if isinstance(values, (pa.Array, pa.ChunkedArray)):
+        return pc.cast(values, pa.large_string())
+    return pa.chunked_array([pa.array(values, type=pa.large_string(),
+                                      from_pandas=True)])
+
+
+def _nbytes(values):
+    '''
+    Bytes of a numpy or Arrow array, or of a list of strings
+    '''
+    if isinstance(values, list):
+        return sys.getsizeof(values) + sum(sys.getsizeof(value)
+                                           for value in values)
+    return values.nbytes
+
+
+class CompactCorpus():
+    '''
+    Clean corpus stored in integer codes and Arrow string buffers.
+    '''
+
+    def __init__(self, newspaper, url, date, title=None, article=None):
+        '''
+        Inputs:
+            - newspaper, url, title, article: The columns of the clean
+            corpus, as Pandas series or Arrow arrays. url, title and
+            article may be left out (None)
+            - date: Dates of the articles, as a Pandas series or an Arrow
+            timestamp array
+        '''
+        self.newspaper_codes, self.newspapers = _codes(_text(newspaper))
+        self.url_prefix_codes = self.url_prefixes = None
+        self.url_stamps = self.url_rest = None
+        if url is not None:
+            self._set_urls(_text(url))
+        if isinstance(date, (pa.Array, pa.ChunkedArray)):
+            date = date.to_pandas()
+        self.dates = pd.to_datetime(pd.Series(date)).to_numpy(
+            dtype='datetime64[ns]')
+        months = self.dates.astype('datetime64[M]')
+        self.month_codes = np.where(np.isnat(months), NO_MONTH,
+                                    months.astype(np.int64)).astype(np.int32)
+        self.title = None if title is None else _text(title)
+        self.article = None if article is None else _text(article)
+
+    def _set_urls(self, urls):
+        '''
+        Splits the urls into prefix codes, timestamps and the rest
+        '''
+        parts = pc.extract_regex(urls, URL_PARTS)
+        prefix = pc.binary_join_element_wise(
+            pc.struct_field(parts, 'archive'), pc.struct_field(parts, 'host'),
+            pa.scalar('', pa.large_string()))
+        self.url_prefix_codes, self.url_prefixes = _codes(
+            pc.if_else(pc.is_null(urls), pa.scalar(None, pa.large_string()),
+                       prefix))
+        stamps = pc.struct_field(parts, 'stamp')
+        self.url_stamps = pc.cast(pc.if_else(pc.equal(stamps, ''),
+                                             pa.scalar(None, stamps.type),
+                                             stamps), pa.int64())\
+            .fill_null(NO_STAMP).to_numpy()
+        self.url_rest = pc.struct_field(parts, 'path')
+
+    @classmethod
+    def from_frame(cls, df):
+        '''
+        Compact copy of a clean dataframe (see main.append_dfs_in_dir)
+        '''
+        return cls(*[df[column] if column in df else None for column in
+                     (ib.NEWSPAPER, ib.URL, ib.DATE, ib.TITLE, ib.ARTICLE)])
+
+    @classmethod
+    def from_store(cls, root=corpus.DEFAULT_ROOT, columns=None, start=None,
+                   end=None, newspapers=None):
+        '''
+        Reads the corpus store straight into a CompactCorpus, without
+        making Python strings of the texts.
+            Inputs: see corpus.read (newspaper and date are always read)
+        '''
+        columns = list(dict.fromkeys([ib.NEWSPAPER, ib.DATE] +
+                                     list(columns or corpus.COLUMNS)))
+        table = corpus.read_table(root, columns, start, end, newspapers)
+        return cls(*[table[column] if column in columns else None for column
+                     in (ib.NEWSPAPER, ib.URL, ib.DATE, ib.TITLE,
+                         ib.ARTICLE)])
+
+    def __len__(self):
+        return len(self.newspaper_codes)
+
+    def newspaper(self):
+        '''
+        Newspaper of every article as a Pandas categorical
+        '''
+        return pd.Categorical.from_codes(self.newspaper_codes,
+                                         self.newspapers)
+
+    def urls(self):
+        '''
+        Urls of the articles, as they were given
+        '''
+        if self.url_rest is None:
+            raise ValueError("The corpus was loaded without the urls")
+        prefixes = np.array(self.url_prefixes + [None], dtype=object)
+        rest = self.url_rest.to_numpy(zero_copy_only=False)
+        urls = []
+        for code, stamp, path in zip(self.url_prefix_codes, self.url_stamps,
+                                     rest):
+            prefix = prefixes[code]
+            if prefix is None:
+                urls.append(None)
+                continue
+            if stamp != NO_STAMP:
+                archive, host = prefix.split('/web/', 1)
+                prefix = archive + '/web/' + STAMP_FORMAT.format(stamp) + host
+            urls.append(prefix + path)
+        return pd.Series(urls, dtype=object)
+
+    def month_year(self):
+        '''
+        Month of every article as monthly periods
+        '''
+        return pd.PeriodIndex.from_ordinals(self.month_ordinals(),
+                                            freq='M').array
+
+    def month_ordinals(self):
+        '''
+        Month codes as index_builder.month_ordinals
+        '''
+        ordinals = self.month_codes.astype(np.int64)
+        ordinals[self.month_codes == NO_MONTH] = pd.NaT.value
+        return ordinals
+
+    def has_article(self):
+        '''
+        Whether every article has its text
+        '''
+        if self.article is None:
+            raise ValueError("The corpus was loaded without the articles")
+        return pc.is_valid(self.article).to_numpy(zero_copy_only=False)
+
+    def _batches(self, column):
+        '''
+        Texts of a column as lists of Python strings, BATCH_SIZE at a time
+        '''
+        texts = self.article if column == ib.ARTICLE else self.title
+        for start in range(0, len(self), BATCH_SIZE):
+            yield texts.slice(start, BATCH_SIZE).to_pylist()
+
+    @instrument.timed()
+    def match_indices(self, indices, column=ib.ARTICLE):
+        '''
+        index_builder.match_indices for the compact corpus. Only
+        BATCH_SIZE texts are turned into Python strings at a time.
+            Inputs:
+                - indices (dict): Maps index name to its list of keywords
+                - column (str): ARTICLE or TITLE
+            Returns:
+                - dict mapping index name to a numpy array of bool
+        '''
+        orders = None
+        matches = np.zeros((len(self), len(indices)), dtype=bool)
+        start = 0
+        for batch in self._batches(column):
+            if orders is None:
+                sample = [text for text in batch[:ib.SAMPLE_SIZE]
+                          if text is not None]
+                orders = [ib._keyword_order(sample, words)
+                          for words in indices.values()]
+            matches[start:start + len(batch)] = np.array(
+                [[all(word in text for word in order) for order in orders]
+                 for text in batch], dtype=bool).reshape(len(batch),
+                                                         len(orders))
+            start += len(batch)
+        return {index_name: matches[:, i]
+                for i, index_name in enumerate(indices)}
+
+    def contains_all(self, words, column=ib.ARTICLE):
+        '''
+        index_builder.contains_all for the compact corpus
+        '''
+        return self.match_indices({None: words}, column)[None]
+
+    @instrument.timed()
+    def count_matrix(self, masks):
+        '''
+        index_builder.CountMatrix of the compact corpus
+        '''
+        return ib.CountMatrix(self.month_ordinals(), self.newspaper(),
+                              self.has_article(), masks)
+
+    def monthly_counts(self, masks):
+        '''
+        index_builder.monthly_counts for the compact corpus
+        '''
+        return ib.count_by_month(self.month_year(), self.newspaper(),
+                                 self.has_article(), masks)
+
+    def to_frame(self):
+        '''
+        The corpus as a clean dataframe
+        '''
+        df = pd.DataFrame({ib.NEWSPAPER: np.array(self.newspapers + [None],
+                                                  dtype=object)[
+                                                      self.newspaper_codes]})
+        if self.url_rest is not None:
+            df[ib.URL] = self.urls()
+        df[ib.DATE] = self.dates
+        for column, values in ((ib.TITLE, self.title),
+                               (ib.ARTICLE, self.article)):
+            if values is not None:
+                df[column] = values.to_pandas()
+        return df
+
+    def memory_report(self):
+        '''
+        Bytes held by every part of the corpus.
+            Returns:
+                - dict mapping each column to its bytes, plus 'total'
+        '''
+        report = {
+            ib.NEWSPAPER: _nbytes(self.newspaper_codes) +
+                          _nbytes(self.newspapers),
+            ib.DATE: _nbytes(self.dates) + _nbytes(self.month_codes)}
+        if self.url_rest is not None:
+            report[ib.URL] = _nbytes(self.url_prefix_codes) + \
+                _nbytes(self.url_prefixes) + _nbytes(self.url_stamps) + \
+                _nbytes(self.url_rest)
+        for column, values in ((ib.TITLE, self.title),
+                               (ib.ARTICLE, self.article)):
+            if values is not None:
+                report[column] = _nbytes(values)
+        report['total'] = sum(report.values())
+        return report
+
+
+def frame_memory(df):
+    '''
+    Bytes held by every column of a dataframe, counting the Python objects
+    it points to, plus 'total'
+    '''
+    report = df.memory_usage(index=False, deep=True).to_dict()
+    report['total'] = sum(report.values())
+    return report
+
+
+def main():
+    '''
+    Prints the memory of the clean corpus as a dataframe and as a
+    CompactCorpus
+    '''
+    #main imports this module, so it is only imported when run
+    import main as main_script
+    df = main_script.append_dfs_in_dir(CLEAN_FILES)
+    before = frame_memory(df)
+    after = CompactCorpus.from_frame(df).memory_report()
+    for column in before:
+        print("{:<12}{:>16,}{:>16,}".format(column, before[column],
+                                            after[column]))
+
+
+if __name__ == "__main__":
+    main()
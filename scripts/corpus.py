@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+"""
+Purpose: Columnar store for the clean corpus. The clean articles of every
+newspaper are kept as Parquet files partitioned by newspaper and month
+(<root>/newspaper=<name>/month=<YYYY-MM>/part-*.parquet), so a reader
+can load only the columns it needs and only the files of the months and
+newspapers it asks for, instead of unpickling every clean dataframe in
+full. Files are read through memory maps.
+
+Usage (from the scripts directory), to convert the clean pickles once:
+    python3 corpus.py
+
+Authors:
+Diego Diaz
+Rukhshan Arif Mian
+Piyush Tank
+"""
+
+import glob
+import os
+import shutil
+import uuid
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+###GLOBAL VARIABLES FOR COLUMN NAMES
+NEWSPAPER = "newspaper"
+URL = "url"
+DATE = "date"
+TITLE = "title"
+ARTICLE = "article"
+#Words of every article after removing stopwords, counted by
+#cleaning.remove_stopwords (only for the sources that remove them)
+TOKENS = "article tokens"
+MONTH = "month"
+
+DEFAULT_ROOT = "../data/corpus"
+CLEAN_FILES = "../data/clean/*pkl"
+COLUMNS = [NEWSPAPER, URL, DATE, TITLE, ARTICLE]
+#Schema of the files; newspaper and month are stored in the folder names
+SCHEMA = pa.schema([(URL, pa.string()), (DATE, pa.timestamp('ns')),
+                    (TITLE, pa.string()), (ARTICLE, pa.string()),
+                    (TOKENS, pa.int64())])
+PARTITIONING = ds.partitioning(pa.schema([(NEWSPAPER, pa.string()),
+                                          (MONTH, pa.string())]),
+                               flavor='hive')
+
+
+def _to_table(df):
+    '''
+    Arrow table of a clean dataframe with the corpus columns and types,
+    plus the month used to partition it. The token counts are null when
+    the dataframe has none
+    '''
+    df = pd.DataFrame({
+        NEWSPAPER: df[NEWSPAPER].astype(str),
+        URL: df[URL].where(df[URL].isna(), df[URL].astype(str)),
+        DATE: pd.to_datetime(df[DATE]).astype('datetime64[ns]'),
+        TITLE: df[TITLE].where(df[TITLE].isna(), df[TITLE].astype(str)),
+        ARTICLE: df[ARTICLE].where(df[ARTICLE].isna(),
+                                   df[ARTICLE].astype(str)),
+        TOKENS: df[TOKENS].astype('Int64') if TOKENS in df
+                else pd.array([None] * len(df), dtype='Int64')})
+    df[MONTH] = df[DATE].dt.strftime('%Y-%m')
+    schema = SCHEMA.insert(0, pa.field(NEWSPAPER, pa.string()))\
+        .append(pa.field(MONTH, pa.string()))
+    return pa.Table.from_pandas(df, schema=schema, preserve_index=False)
+
+
+def write(df, root=DEFAULT_ROOT):
+    '''
+    Adds clean articles to the store. New files are written next to the
+    existing ones of the same newspaper and month.
+        Inputs:
+            - df (Pandas dataframe): Clean dataframe with the newspaper,
+            url, date, title and article columns, and the article tokens
+            column if it has one
+            - root (str): Folder of the store
+    '''
+    pq.write_to_dataset(_to_table(df), root, partitioning=PARTITIONING,
+                        basename_template="part-" + uuid.uuid4().hex +
+                        "-{i}.parquet",
+                        existing_data_behavior='overwrite_or_ignore',
+                        compression='zstd')
+
+
+def convert_pickles(clean_files=CLEAN_FILES, root=DEFAULT_ROOT):
+    '''
+    Builds the store from the clean pickles, replacing any previous one.
+        Inputs:
+            - clean_files (str): Glob of the clean pickles
+            - root (str): Folder of the store
+        Returns:
+            - number of articles written
+    '''
+    if os.path.isdir(root):
+        shutil.rmtree(root)
+    total = 0
+    for path in sorted(glob.glob(clean_files)):
+        df = pd.read_pickle(path)
+        write(df, root)
+        total += len(df)
+        print(path + ": " + str(len(df)) + " articles")
+    return total
+
+
+def dataset(root=DEFAULT_ROOT):
+    '''
+    Arrow dataset over the store, reading the files through memory maps.
+    Columns missing from a file (such as the token counts in stores
+    written before they were kept) are read as nulls
+    '''
+    schema = pa.unify_schemas([SCHEMA, PARTITIONING.schema])
+    return ds.dataset(root, schema=schema, format='parquet',
+                      partitioning=PARTITIONING,
+                      filesystem=pa.fs.LocalFileSystem(use_mmap=True))
+
+
+def _timestamp(value):
+    '''
+    Arrow scalar with the type of the date column
+    '''
+    return pa.scalar(pd.Timestamp(value).as_unit('ns').value,
+                     type=pa.timestamp('ns'))
+
+
+def read_table(root=DEFAULT_ROOT, columns=None, start=None, end=None,
+               newspapers=None):
+    '''
+    read, returning the Arrow table without converting it to Pandas
+    '''
+    condition = None
+    conditions = []
+    if start is not None:
+        start = pd.Timestamp(start)
+        conditions += [ds.field(MONTH) >= start.strftime('%Y-%m'),
+                       ds.field(DATE) >= _timestamp(start)]
+    if end is not None:
+        end = pd.Timestamp(end)
+        conditions += [ds.field(MONTH) <= end.strftime('%Y-%m'),
+                       ds.field(DATE) < _timestamp(end)]
+    if newspapers is not None:
+        conditions.append(ds.field(NEWSPAPER).isin(list(newspapers)))
+    for part in conditions:
+        condition = part if condition is None else condition & part
+    return dataset(root).to_table(columns=list(columns or COLUMNS),
+                                  filter=condition)
+
+
+def read(root=DEFAULT_ROOT, columns=None, start=None, end=None,
+         newspapers=None):
+    '''
+    Reads articles from the store. Only the requested columns are read,
+    and only the files of the requested months and newspapers are opened.
+        Inputs:
+            - root (str): Folder of the store
+            - columns (list of str): Columns to read, the five corpus
+            columns by default (add TOKENS for the token counts)
+            - start (str or datetime): First date to include
+            - end (str or datetime): Date from which articles are left out
+            - newspapers (list of str): Newspapers to include, all by
+            default
+        Returns:
+            - Pandas dataframe
+    '''
+    return read_table(root, columns, start, end, newspapers).to_pandas()
+
+
+if __name__ == "__main__":
+    print(str(convert_pickles()) + " articles written to " + DEFAULT_ROOT)
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+"""
+Purpose: Concurrent fetch engine for the crawlers. Downloads many
+web.archive pages at the same time, with a limit on how many requests
+can be in flight, instead of waiting for one article before asking
+for the next one.
+
+The requests are sent by one pool of threads for a whole iteration. A
+bounded window of submitted urls keeps the pool busy: as soon as the
+oldest url is handed back, the next one is submitted, so a slow page
+only holds back the results behind it, never the requests.
+
+Authors:
+Diego Diaz
+Rukhshan Arif Mian
+Piyush Tank
+"""
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import requests
+import sessions
+
+#Number of requests in flight at the same time when nothing else is given
+DEFAULT_CONCURRENCY = 8
+
+
+def _fetch(url, get):
+    '''
+    Fetches a single url.
+        Inputs:
+            - url (str): Absolute url to fetch
+            - get (function): Blocking function that takes a url and
+            returns a response object
+        Returns:
+            - response, or None if the request failed with a connection
+            error
+    '''
+    try:
+        return get(url)
+    except requests.exceptions.RequestException:
+        return None
+
+
+def fetch_all(urls, concurrency=DEFAULT_CONCURRENCY, get=sessions.get):
+    '''
+    Fetches all urls concurrently with at most concurrency requests
+    in flight.
+        Inputs:
+            - urls (iterable of str): Absolute urls to fetch
+            - concurrency (int): Maximum number of requests in flight
+            - get (function): Blocking function that takes a url and
+            returns a response object, the shared session by default
+        Returns:
+            - list of (url, response) tuples in the same order as urls.
+            Response is None when the connection failed.
+    '''
+    urls = list(urls)
+    return list(iter_fetch(urls, concurrency, get, window=len(urls)))
+
+
+def iter_fetch(urls, concurrency=DEFAULT_CONCURRENCY, get=sessions.get,
+               window=None):
+    '''
+    Same as fetch_all but yields the responses as they are ready, in
+    order, so that the caller can stop early (for example, after
+    collecting enough articles) without downloading every url, and only
+    the responses in the window are held in memory.
+        Inputs:
+            - urls (iterable of str): Absolute urls to fetch
+            - concurrency (int): Maximum number of requests in flight
+            - get (function): Blocking function that takes a url and
+            returns a response object
+            - window (int): Urls submitted but not yet handed back, four
+            times the concurrency by default
+        Yields:
+            - (url, response) tuples in the same order as urls
+    '''
+    concurrency = max(1, concurrency)
+    window = max(1, window or 4 * concurrency)
+    submitted = deque()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        try:
+            for url in urls:
+                submitted.append((url, executor.submit(_fetch, url, get)))
+                if len(submitted) >= window:
+                    url, future = submitted.popleft()
+                    yield url, future.result()
+            while submitted:
+                url, future = submitted.popleft()
+                yield url, future.result()
+        finally:
+            #A caller that stops early does not wait for the rest
+            for _, future in submitted:
+                future.cancel()
@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+"""
+Purpose: Durable crawl frontier for the crawlers. A small SQLite ledger
+records which days (or batches) have had their article links collected
+and which article urls are pending, visited or failed. A day is finished
+once none of its urls is pending. A crawler that stops for any reason can be started again with
+the same ledger and continues where it stopped.
+
+Every update touches only the rows of the urls or day involved, so a
+checkpoint costs the same at the first article as at the hundred
+thousandth.
+
+Authors:
+Diego Diaz
+Rukhshan Arif Mian
+Piyush Tank
+"""
+
+import sqlite3
+import time
+
+PENDING = "pending"
+VISITED = "visited"
+FAILED = "failed"
+
+DISCOVERED = "discovered"
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS days (
+    day TEXT PRIMARY KEY,
+    state TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS urls (
+    url TEXT PRIMARY KEY,
+    day TEXT,
+    state TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS urls_day_state ON urls (day, state);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+'''
+
+
+class CrawlFrontier():
+    '''
+    Ledger of the progress of one crawl, stored in a SQLite file.
+    '''
+
+    def __init__(self, path):
+        '''
+        Inputs:
+            - path (str): SQLite file for the ledger. It is created if it
+            does not exist and resumed if it does.
+        '''
+        self.path = path
+        self._db = sqlite3.connect(path)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(SCHEMA)
+
+    def setdefault(self, key, value):
+        '''
+        Stores value under key the first time it is called for that key
+        and returns the stored value. Used to keep settings, like the date
+        a crawl started from, the same across resumed runs.
+        '''
+        with self._db:
+            self._db.execute("INSERT OR IGNORE INTO meta VALUES (?, ?)",
+                             (key, str(value)))
+        return self._db.execute("SELECT value FROM meta WHERE key = ?",
+                                (key,)).fetchone()[0]
+
+    def day_state(self, day):
+        '''
+        Returns None for a day that was never started and DISCOVERED once
+        its article links have been collected.
+        '''
+        row = self._db.execute("SELECT state FROM days WHERE day = ?",
+                               (day,)).fetchone()
+        return row[0] if row else None
+
+    def is_day_done(self, day):
+        '''
+        Checks if the links of day were collected and none of its
+        articles is still pending
+        '''
+        return self.day_state(day) == DISCOVERED and self._db.execute(
+            "SELECT 1 FROM urls WHERE day = ? AND state = ? LIMIT 1",
+            (day, PENDING)).fetchone() is None
+
+    def add_day_urls(self, day, urls):
+        '''
+        Records the article urls collected for a day as pending and marks
+        the day as discovered, in one transaction. Urls already in the
+        ledger keep their state.
+            Inputs:
+                - day (str): Key of the day or batch
+                - urls (iterable of str): Article urls found for it
+        '''
+        now = time.time()
+        with self._db:
+            self._db.executemany(
+                "INSERT OR IGNORE INTO urls (url, day, state, updated_at) "
+                "VALUES (?, ?, ?, ?)",
+                [(url, day, PENDING, now) for url in urls])
+            self._db.execute("INSERT OR REPLACE INTO days VALUES (?, ?, ?)",
+                             (day, DISCOVERED, now))
+
+    def pending(self, day=None):
+        '''
+        Returns the urls still to be processed, for one day or for all
+        '''
+        if day is None:
+            rows = self._db.execute("SELECT url FROM urls WHERE state = ?",
+                                    (PENDING,))
+        else:
+            rows = self._db.execute(
+                "SELECT url FROM urls WHERE day = ? AND state = ?",
+                (day, PENDING))
+        return [row[0] for row in rows]
+
+    def mark_visited(self, urls):
+        '''
+        Marks the given urls as visited
+        '''
+        self._set_state(urls, VISITED)
+
+    def mark_failed(self, urls):
+        '''
+        Marks the given urls as failed and counts the attempt
+        '''
+        self._set_state(urls, FAILED)
+
+    def _set_state(self, urls, state):
+        if isinstance(urls, str):
+            urls = [urls]
+        now = time.time()
+        with self._db:
+            self._db.executemany(
+                "INSERT INTO urls (url, state, attempts, updated_at) "
+                "VALUES (?, ?, 1, ?) ON CONFLICT(url) DO UPDATE SET "
+                "state = excluded.state, attempts = attempts + 1, "
+                "updated_at = excluded.updated_at",
+                [(url, state, now) for url in urls])
+
+    def retry_failed(self, max_attempts=3):
+        '''
+        Puts the failed urls with fewer than max_attempts attempts back
+        in the pending state so that they are processed again. The
+        crawlers call it when they start, so a resumed crawl retries its
+        failures.
+        '''
+        now = time.time()
+        with self._db:
+            self._db.execute(
+                "UPDATE urls SET state = ?, updated_at = ? "
+                "WHERE state = ? AND attempts < ?",
+                (PENDING, now, FAILED, max_attempts))
+
+    def counts(self):
+        '''
+        Returns a dict with the number of urls in each state and the
+        number of days finished
+        '''
+        counts = {PENDING: 0, VISITED: 0, FAILED: 0}
+        for state, count in self._db.execute(
+                "SELECT state, COUNT(*) FROM urls GROUP BY state"):
+            counts[state] = count
+        counts["days done"] = self._db.execute(
+            "SELECT COUNT(*) FROM days WHERE state = ? AND day NOT IN "
+            "(SELECT day FROM urls WHERE state = ? AND day IS NOT NULL)",
+            (DISCOVERED, PENDING)).fetchone()[0]
+        return counts
+
+    def close(self):
+        '''
+        Closes the ledger
+        '''
+        self._db.close()
@@ -4,11 +4,10 @@
 @author: diego - rukshan - piyush
 """
 
-from datetime import datetime
-import re
-import pandas as pd
-import nltk
-from nltk.corpus import stopwords
+import cleaning
+import corpus
+import instrument
+import writer
 
 ###GLOBAL VARIABLES FOR COLUMN NAMES
 NEWSPAPER = "newspaper"
@@ -16,7 +15,9 @@ URL = "url"
 DATE = "date"
 TITLE = "title"
 ARTICLE = "article"
+DATE_FORMAT = '%d %b, %Y %I:%M%p'
 
+@instrument.timed()
 def clean_herald(data_frame):
     '''
     Cleans the dataframe. For the Herald this process involves
@@ -24,56 +25,75 @@ def clean_herald(data_frame):
     Nones or are empty. Eliminating all not alphabet
     characters from the articles, converting to lower
     case, and transforming the date to a datetime object
-    for easier manipulation
+    for easier manipulation. Every step works on whole
+    columns at once (see cleaning.py)
     Inputs:
         - data_frame (Pandas dataframe): Dataframe with
             5 columns: 'newspaper', 'url', 'date', 'title',
             and 'article'.
     '''
-    data_frame = data_frame[data_frame[ARTICLE] != 'None']
-    data_frame = data_frame[data_frame[ARTICLE] != '']
+    keep = (data_frame[ARTICLE] != 'None') & (data_frame[ARTICLE] != '')
 
     #removing premium articles that we are not able to access completely
-    data_frame = data_frame[data_frame[DATE] != 'None']
-    data_frame = data_frame[data_frame[DATE] != '']
+    keep &= (data_frame[DATE] != 'None') & (data_frame[DATE] != '')
+    data_frame = data_frame[keep].copy()
 
     #cleaning articles from non-letter characters
-    data_frame[ARTICLE] = data_frame.apply(lambda x: re.sub("[^a-z ']+", "",\
-      x[ARTICLE].lower()), axis=1)
-    data_frame[TITLE] = data_frame.apply(lambda x: re.sub("[^a-z ']+", "",\
-      x[TITLE].lower()), axis=1)
+    data_frame[ARTICLE] = cleaning.clean_text(data_frame[ARTICLE])
+    data_frame[TITLE] = cleaning.clean_text(data_frame[TITLE])
 
     #transforming dates to datetime objects
-    data_frame[DATE] = data_frame.apply(lambda x: datetime.strptime(\
-              x[DATE].strip(), '%d %b, %Y %I:%M%p'), axis=1)
+    data_frame[DATE] = cleaning.parse_dates(data_frame[DATE], DATE_FORMAT)
 
     return data_frame
 
 
+@instrument.timed()
 def remove_stopwords(data_frame, column_name):
     '''
-    Removes english stopwords from a single column
+    Removes english stopwords from a single column, and keeps
+    the number of words left in every row in the column
+    column_name + ' tokens' (see cleaning.remove_stopwords)
     Inputs:
         - data_frame (Pandas dataframe): Dataframe to remove
         stops words from in a given column
         - column_name (str): Column name to remove
         stopwords from
     '''
-    stop = stopwords.words('english')
-    data_frame[column_name] = data_frame[column_name].apply(lambda x: ' '.\
-      join([word for word in x.split() if word not in stop]))
+    data_frame[column_name], data_frame[column_name + ' tokens'] = \
+        cleaning.remove_stopwords(data_frame[column_name])
     return data_frame
 
+def clean_chunk(data_frame):
+    '''
+    Every cleaning step for a chunk of raw Herald articles: clean_herald
+    and then remove_stopwords on the articles
+    '''
+    return remove_stopwords(clean_herald(data_frame), ARTICLE)
+
+
+def clean_to_store(raw_directory, root=corpus.DEFAULT_ROOT,
+                   chunk_size=cleaning.CHUNK_SIZE):
+    '''
+    Cleans every raw Herald article, a chunk at a time, into the corpus
+    store (see cleaning.clean_to_store)
+    Inputs:
+        - raw_directory (str): Folder with the raw part files
+        - root (str): Folder of the corpus store
+        - chunk_size (int): Rows cleaned at a time
+    '''
+    return cleaning.clean_to_store(raw_directory, clean_chunk, root,
+                                   chunk_size)
+
+
 def main():
     '''
     Runs cleaner on sample data frame produced by herald_crawler.py
     '''
     print("Cleaning sample database created by herald_crawler.py")
     try:
-        file_path = "../data/raw/herald_sample.pkl"
-        data_frame = pd.read_pickle(file_path)
+        data_frame = writer.read_parts("../data/raw/herald_sample")
         data_frame = clean_herald(data_frame)
-        nltk.download('stopwords')
         data_frame = remove_stopwords(data_frame, ARTICLE)
         print("Printing 5 first rows")
         print(data_frame.head())
@@ -5,14 +5,22 @@
 """
 
 import queue
-import time
 from datetime import datetime
 from datetime import timedelta
 import requests
-import pandas as pd
-from bs4 import BeautifulSoup
+import cdx
+import fetcher
+import frontier
+import instrument
+import parsers
+import pipeline
+import seen
+import sessions
+import telemetry
+import writer
 
 PREFIX_INDEX_WEBARCHIVE = 43
+COLUMNS = ["newspaper", "url", "date", "title", "article"]
 
 def is_ok_to_follow(url):
     '''
@@ -68,27 +76,32 @@ def get_past_url(url, days_back_in_time):
     return 'https://web.archive.org/web/' + target_date + url
 
 
-def crawl(num_pages_to_crawl, days_back_in_time, visited_urls):
+@instrument.timed()
+def crawl(num_pages_to_crawl, days_back_in_time, visited_urls,
+          concurrency=fetcher.DEFAULT_CONCURRENCY):
     '''
-    Crawl the college catalog and generates a CSV file with an index.
+    Crawls an old homepage of the NZ Herald and collects the urls of the
+    news articles linked from it. Other pages found on the way are
+    fetched concurrently, concurrency at a time, until
+    num_pages_to_crawl pages have been visited.
 
     Inputs:
         num_pages_to_crawl: the number of pages to process during the crawl
-        course_map_filename: the name of a JSON file that contains the mapping
-          course codes to course identifiers
-        index_filename: the name for the CSV of the index.
+        days_back_in_time: number of days to travel back in time
+        visited_urls: dictionary with the urls already visited
+        concurrency: maximum number of requests in flight
 
     Outputs:
-        CSV file of the index index.
+        Set with the urls of the news articles found.
     '''
 
     url = get_past_url('https://www.nzherald.co.nz/', days_back_in_time)
     try:
-        req = requests.get(url)#, allow_redirects=False)
+        req = sessions.get(url)#, allow_redirects=False)
     except requests.exceptions.TooManyRedirects:
         print("Too many redirects, skipping url")
         return []
-    soup = BeautifulSoup(req.content, features='lxml')
+    soup = parsers.link_soup(req.content)
     starting_url = url
 
     article_urls = set()
@@ -98,24 +111,94 @@ def crawl(num_pages_to_crawl, days_back_in_time, visited_urls):
 
     while not queue_sites.empty() and len(visited_urls) < num_pages_to_crawl:
 
-        url = queue_sites.get()
-        if visited_urls.get(url):
+        telemetry.set_queue('herald.pages', queue_sites.qsize())
+        wave = []
+        while not queue_sites.empty() and len(wave) < \
+            min(concurrency, num_pages_to_crawl - len(visited_urls)):
+            url = queue_sites.get()
+            if not visited_urls.get(url) and url not in wave:
+                wave.append(url)
+
+        for url, req in fetcher.fetch_all(wave, concurrency):
+            if req is None or req.status_code != 200:
+                continue
+
+            soup = parsers.link_soup(req.content)
+            visited_urls[url] = 1
+            get_articles(soup, starting_url, article_urls, visited_urls,\
+                         queue_sites)
+
+    return article_urls
+
+
+@instrument.timed()
+def scrape_articles(article_urls, seen_urls=None,
+                    concurrency=fetcher.DEFAULT_CONCURRENCY, limit=None,
+                    crawl_frontier=None):
+    '''
+    Downloads the given NZ Herald articles concurrently, extracts them in
+    the process pool of the fetch/extract pipeline and yields one row per
+    article with the columns used by the rest of the project: newspaper,
+    url, date, title and article.
+        Inputs:
+            - article_urls (iterable of str): Urls of the articles
+            - seen_urls (seen.UrlLedger): Ledger of the articles already
+            saved. Articles in it are skipped before being downloaded and
+            the rest are claimed in it. An in-memory ledger is used if None
+            is given
+            - concurrency (int): Maximum number of requests in flight
+            - limit (int): If given, stop after this many articles
+            - crawl_frontier (CrawlFrontier): If given, articles that
+            could not be downloaded are marked as failed in it, and
+            articles already saved before as visited
+        Yields:
+            - list with newspaper, url, date, title and article
+    '''
+    if seen_urls is None:
+        seen_urls = seen.UrlLedger(None)
+    urls, duplicates = seen_urls.claim(article_urls)
+    if duplicates:
+        print(str(len(duplicates)) + " articles already visited")
+        if crawl_frontier:
+            crawl_frontier.mark_visited(duplicates)
+    collected = 0
+
+    for url, status, fields in pipeline.fetch_and_extract(urls, 'herald',
+                                                          concurrency):
+        if status is None:
+            #The rate limiter slows down after a refused connection
+            telemetry.article('herald', saved=False)
+            telemetry.log("article_failed", site='herald', url=url,
+                          reason="connection refused")
+            seen_urls.release(url)
+            if crawl_frontier:
+                crawl_frontier.mark_failed(url)
             continue
-        req = requests.get(url)
-        if req.status_code != 200:
+        if status != 200 or fields is None:
+            #fields is None when the extractor could not read the page
+            telemetry.article('herald', saved=False)
+            telemetry.log("article_failed", site='herald', url=url,
+                          status=status)
+            seen_urls.release(url)
+            if crawl_frontier:
+                crawl_frontier.mark_failed(url)
             continue
 
-        soup = BeautifulSoup(req.content)
-        visited_urls[url] = 1
-        get_articles(soup, starting_url, article_urls, visited_urls, queue_sites)
+        title, date_and_time, article = fields
+        telemetry.article('herald')
+        yield ["NZ Herald", url, date_and_time, title, article]
 
-    return article_urls
+        collected += 1
+        if limit and collected >= limit:
+            return
 
 
 def get_data_from_url(soup):
     '''
     Takes a BeautifulSoup object for a New Zealand Herald article as input
     an returns title, date and time, and the article text as a tuple.
+    The crawler uses the faster parsers.herald_article, which gives the
+    same result; this version is kept as its reference.
         Inputs:
             - soup (BeautifulSoup): Soup to get newspaper article data from.
             Works for Herald articles.
@@ -146,16 +229,21 @@ def get_data_from_url(soup):
 #####
 #####
 
-def full_herald_scraping(filename, years_to_scrape, days_to_skip_each_time=1):
+@instrument.timed()
+def full_herald_scraping(directory, years_to_scrape, days_to_skip_each_time=1,
+                         concurrency=fetcher.DEFAULT_CONCURRENCY,
+                         frontier_path=None, discovery='homepage',
+                         seen_path=seen.DEFAULT_PATH):
     '''
     Will scrape the NZ Herald a number of times equal to 365 times
-    years_to_scrape, if days_to_skip_each_time is higher than 1. Saves a
-    dataframe with the required columns for the next step of the project.
-    Given the long time it takes to scrape a long period, flags are included to
-    keep track of the iterations.
+    years_to_scrape, if days_to_skip_each_time is higher than 1. Saves the
+    articles with the required columns for the next step of the project.
+    Given the long time it takes to scrape a long period, the progress is
+    kept in a crawl frontier: calling the function again with the same
+    directory resumes the scraping from the last part file written.
         Inputs:
-            - filename (str): Filename to save the dataframe into. The output is
-            a pandas pickle so it can be saved in .pkl format
+            - directory (str): Folder to write the Parquet part files into.
+            They can be read back with writer.read_parts
             - years_to_scrape (int): Years to scrape from the herald. Increasing
             this number by one will produce 365 more iterations, which takes a
             considerable amount of time.
@@ -163,92 +251,87 @@ def full_herald_scraping(filename, years_to_scrape, days_to_skip_each_time=1):
             variable, the scraper will skip this amount of days in each
             iteration. This allows to get data that is more spread out in time
             faster.
+            - concurrency (int): Maximum number of requests in flight
+            - frontier_path (str): SQLite file with the progress of the
+            crawl, directory + '.frontier' by default
+            - discovery (str): How the articles of each day are found.
+            'homepage' crawls the homepage snapshot of the day, 'cdx'
+            lists every article captured that day from the Wayback CDX
+            server
+            - seen_path (str): SQLite file of the url ledger shared by all
+            crawlers. Articles saved by any earlier run are not downloaded
+            again
         Returns:
             None
     '''
-    visited_urls = {}
-    d_f = pd.DataFrame(columns=["newspaper", "url", "date", "title", "article"])
-    counter = 0
+    telemetry.start()
+    crawl_frontier = frontier.CrawlFrontier(frontier_path or
+                                            directory.rstrip('/') + '.frontier')
+    #Articles that failed in an earlier run are tried again
+    crawl_frontier.retry_failed()
+    seen_urls = seen.UrlLedger(seen_path)
+    #Days are counted from the date the crawl first started, so a resumed
+    #crawl goes through the same dates
+    start = datetime.strptime(crawl_frontier.setdefault(
+        'start_date', datetime.today().strftime('%Y%m%d')), '%Y%m%d')
+    offset = (datetime.today() - start).days
+
+    def saved(urls):
+        crawl_frontier.mark_visited(urls)
+        seen_urls.add(urls, 'herald')
 
-    for i in range(0, years_to_scrape * 365):
-        count_bad_status = 0
-        article_urls = crawl(0, (i + 1) * days_to_skip_each_time, visited_urls)
-
-        for url in article_urls:
-            try:
-                req = requests.get(url)
-            except requests.exceptions.ConnectionError:
-                req.status_code = "Connection refused"
-                print("Max retries exceeded, connection refused.\
-                      Sleeping for thirty seconds before continuing")
-                time.sleep(30)
-                continue
-            if req.status_code != 200:
-                print("Bad status code, moving to next article")
-                count_bad_status += 1
-                continue
-            if visited_urls.get(url):
-                print("Article already visited")
+    visited_urls = {}
+    #Articles are marked as visited only once the part holding them is saved
+    with writer.ArticleWriter(directory, COLUMNS, on_commit=saved) as out:
+        for i in range(0, years_to_scrape * 365):
+            days_back = offset + (i + 1) * days_to_skip_each_time
+            day = (start - timedelta(days=(i + 1) * days_to_skip_each_time))\
+                .strftime('%Y%m%d')
+            if crawl_frontier.is_day_done(day):
                 continue
-
-            soup = BeautifulSoup(req.content)
-            title, date_and_time, article = get_data_from_url(soup)
-            visited_urls[url] = 1
-            print(title + ": Currently in iteration " + str(i + 1) +\
-                  " and date: " + date_and_time)
-
-            d_f.loc[counter] = ["NZ Herald", url, date_and_time, title, article]
-            counter += 1
-            if counter % 50 == 0:
-                d_f.to_pickle(filename)
-    d_f.to_pickle(filename)
-
-
-def sample_herald_scraping(filename):
+            if not crawl_frontier.day_state(day):
+                if discovery == 'cdx':
+                    found = cdx.discover('herald', day, day)
+                else:
+                    found = crawl(0, days_back, visited_urls, concurrency)
+                crawl_frontier.add_day_urls(day, found)
+
+            for row in scrape_articles(crawl_frontier.pending(day),
+                                       seen_urls, concurrency,
+                                       crawl_frontier=crawl_frontier):
+                telemetry.log("article_saved", site='herald', iteration=i + 1,
+                              title=row[3], date=row[2])
+                out.write(row)
+    crawl_frontier.close()
+    seen_urls.close()
+
+
+@instrument.timed()
+def sample_herald_scraping(directory, concurrency=fetcher.DEFAULT_CONCURRENCY):
     '''
-    Will scrape two days to test that the scraper works. Saves a dataframe with
-    the required columns for the next step of the project.
+    Will scrape two days to test that the scraper works. Saves the articles
+    with the required columns for the next step of the project.
         Inputs:
-            - filename (str): Filename to save the dataframe into. The output is
-            a pandas pickle so it can be saved in .pkl format
+            - directory (str): Folder to write the Parquet part files into.
+            They can be read back with writer.read_parts
+            - concurrency (int): Maximum number of requests in flight
     '''
     visited_urls = {}
-    d_f = pd.DataFrame(columns=["newspaper", "url", "date", "title", "article"])
+    #The sample must not mark articles as seen for the real crawls
+    seen_urls = seen.UrlLedger(None)
     counter = 0
-    for i in range(3):
-        count_bad_status = 0
-        article_urls = crawl(0, (i + 1) * 5, visited_urls)
-        for url in article_urls:
-            try:
-                req = requests.get(url)
-            except requests.exceptions.ConnectionError:
-                req.status_code = "Connection refused"
-                print("Max retries exceeded, connection refused. \
-                      Sleeping for 10 seconds before continuing")
-                time.sleep(10)
-                continue
-            if req.status_code != 200:
-                print("Bad status code, moving to next article")
-                count_bad_status += 1
-                continue
-            if visited_urls.get(url):
-                print("Article already visited")
-                continue
-
-            soup = BeautifulSoup(req.content, features='lxml')
-            title, date_and_time, article = get_data_from_url(soup)
-            visited_urls[url] = 1
-            print("Saving Article N: " + str(counter) + ", the title is: "+\
-                    title + " and date: " + date_and_time)
-
-            d_f.loc[counter] = ["NZ Herald", url, date_and_time, title, article]
-            counter += 1
-            if counter % 5 == 0:
-                print("Max 5 articles per day. Starting new day.")
-                break
+    with writer.ArticleWriter(directory, COLUMNS, append=False) as out:
+        for i in range(3):
+            article_urls = crawl(0, (i + 1) * 5, visited_urls, concurrency)
+            for row in scrape_articles(article_urls, seen_urls, concurrency,
+                                       limit=5):
+                telemetry.log("article_saved", site='herald', number=counter,
+                              title=row[3], date=row[2])
+                out.write(row)
+                counter += 1
+            print("Max 5 articles per day. Starting new day.")
 
     print("Finished sample scraping, saved in data/raw")
-    d_f.to_pickle(filename)
 
 
 def main():
@@ -256,10 +339,11 @@ def main():
     Runs sample scraper for 3 days and 5 news articles each
     '''
     print("Starting sample scraping from the NZ Herald and saving to data/raw")
-    sample_herald_scraping("../data/raw/herald_sample.pkl")
+    telemetry.start()
+    sample_herald_scraping("../data/raw/herald_sample")
 
 if __name__ == "__main__":
     main()
-    #full_herald_scraping("herald_data.csv", 500, 5)
+    #full_herald_scraping("../data/raw/herald_data", 500, 5)
     #continue_scraping("last.csv", 500, 5, 841)
     
\ No newline at end of file
@@ -4,7 +4,11 @@ Purpose: Creates an index based on the given keywords
 @authors: diego - rukshan - piyush
 """
 
+import numpy as np
+import pandas as pd
 import matplotlib.pyplot as plt
+import corpus
+import instrument
 
 
 ###GLOBAL VARIABLES FOR COLUMN NAMES
@@ -14,6 +18,11 @@ DATE = "date"
 TITLE = "title"
 ARTICLE = "article"
 N_ARTICLES = 'number of articles'
+MONTH_YEAR = 'month_year'
+#Only columns an index needs from the corpus
+INDEX_COLUMNS = [NEWSPAPER, DATE, ARTICLE]
+#Articles used to estimate how common each keyword is
+SAMPLE_SIZE = 1000
 
 #%%
 
@@ -32,7 +41,8 @@ class NewspaperIndex():
             df (Pandas dataframe): Clean dataframe with
             5 columns: 'newspaper', 'url', 'date', 'title',
             and 'article'. Every column is in string format
-            except for date which is a python datetime object
+            except for date which is a python datetime object.
+            A compact.CompactCorpus of it can be given instead
             index_name (str): Name for the index to create
             word_lst (list of strings): List where each
             entry is a keyword to count according to our
@@ -43,6 +53,7 @@ class NewspaperIndex():
         self.group_by = self.make_index(df)
 
 
+    @instrument.timed()
     def make_index(self, df):
         '''
         Creates the index according to our methodology
@@ -67,27 +78,89 @@ class NewspaperIndex():
                 a column with the index calculated and a month-year
                 column with the month-period.
         '''
-        df = has_list_of_words(df.copy(), ARTICLE, self.word_lst, self.index_name)
-        df['month_year'] = df[DATE].dt.to_period('M')
-        group_by = df.groupby(['month_year', 'newspaper']).agg({self.index_name + ' count':\
-                   'sum', ARTICLE:'count'}).rename(columns={ARTICLE:N_ARTICLES})\
-                    .reset_index()
-        group_by[self.index_name] = group_by[self.index_name\
-            + " count"] / group_by[N_ARTICLES]
+        if isinstance(df, pd.DataFrame):
+            mask = contains_all(df[ARTICLE], self.word_lst)
+            matrix = CountMatrix(*_month_columns(df),
+                                 {self.index_name: mask})
+        else:
+            #A compact corpus (see compact.CompactCorpus)
+            mask = df.contains_all(self.word_lst)
+            matrix = df.count_matrix({self.index_name: mask})
+        return matrix.index(self.index_name)
 
-        counts_by_newspaper = group_by.reset_index().groupby('month_year').agg({N_ARTICLES: 'sum'})\
-        .rename(columns={N_ARTICLES:'total articles'})
+    @classmethod
+    def from_corpus(cls, index_name, word_lst, root=corpus.DEFAULT_ROOT,
+                    start=None, end=None):
+        '''
+        Creates the index from the Parquet corpus store, reading only the
+        columns an index needs and only the months between start and end.
+            Inputs:
+                - index_name (str): Name for the index to create
+                - word_lst (list of strings): Keywords of the index
+                - root (str): Folder of the corpus store
+                - start, end (str or datetime): Dates to read, all by
+                default (see corpus.read)
+        '''
+        return cls(corpus.read(root, INDEX_COLUMNS, start, end), index_name,
+                   word_lst)
 
-        new_df = group_by.join(counts_by_newspaper)
-        new_df['newspaper weight'] = new_df['total articles'] \
-        / new_df[N_ARTICLES]
-        new_df['weighted ' + self.index_name] = new_df['newspaper weight']\
-        * new_df[self.index_name]
+    @classmethod
+    def from_inverted_index(cls, inverted, index_name, word_lst,
+                            column=ARTICLE):
+        '''
+        Creates the index from an inverted index of the corpus instead of
+        the articles: the articles holding every keyword are found by
+        intersecting posting lists. Gives the same index as building it
+        from the dataframe the inverted index was made from.
+            Inputs:
+                - inverted (inverted_index.InvertedIndex): Index of the
+                clean corpus
+                - index_name (str): Name for the index to create
+                - word_lst (list of strings): Keywords of the index
+                - column (str): Column whose terms are searched
+        '''
+        mask = inverted.match_all(word_lst, column)
+        return cls.from_counts(inverted.monthly_counts({index_name: mask}),
+                               index_name, word_lst)
 
-        total_df = new_df.groupby('month_year').agg({self.index_name:'sum', \
-                                 }).reset_index()
-        return total_df
+    @classmethod
+    def from_aggregates(cls, aggregates, index_name):
+        '''
+        Creates the index from the values kept up to date in the
+        materialized aggregates, without going over any article.
+            Inputs:
+                - aggregates (aggregates.IndexAggregates): Aggregates
+                where the index is registered
+                - index_name (str): Name of the index
+        '''
+        index = cls.__new__(cls)
+        index.index_name = index_name
+        index.word_lst = aggregates.indices()[index_name]
+        index.group_by = aggregates.index_frame(index_name)
+        return index
 
+    @classmethod
+    def from_counts(cls, counts, index_name, word_lst):
+        '''
+        Creates the index from counts already aggregated by month and
+        newspaper (see monthly_counts), without going over the articles.
+            Inputs:
+                - counts (pandas dataframe or CountMatrix): Output of
+                monthly_counts with a column index_name + ' count', or
+                the CountMatrix of the index
+                - index_name (str): Name of the index
+                - word_lst (list of strings): Keywords of the index
+        '''
+        index = cls.__new__(cls)
+        index.index_name = index_name
+        index.word_lst = word_lst
+        if isinstance(counts, CountMatrix):
+            index.group_by = counts.index(index_name)
+        else:
+            index.group_by = index_from_counts(counts, index_name)
+        return index
+
+    @instrument.timed()
     def plot_index(self, starting_year):
         '''
         Makes the plot with the index
@@ -110,18 +183,279 @@ class NewspaperIndex():
 
         return fig
 
-def has_word(df, column_name, word):
+
+@instrument.timed()
+def build_indices(df, indices):
+    '''
+    Creates several indices with a single pass over the articles and a
+    single CountMatrix, without copying the dataframe. Gives the same
+    indices as creating a NewspaperIndex for each keyword list.
+        Inputs:
+            - df (Pandas dataframe or compact.CompactCorpus): Clean
+            corpus, as for NewspaperIndex
+            - indices (dict): Maps index name to its list of keywords
+        Returns:
+            - dict mapping index name to its NewspaperIndex
+    '''
+    if isinstance(df, pd.DataFrame):
+        masks = match_indices(df[ARTICLE], indices)
+        counts = CountMatrix(*_month_columns(df), masks)
+    else:
+        masks = df.match_indices(indices)
+        counts = df.count_matrix(masks)
+    return {index_name: NewspaperIndex.from_counts(counts, index_name, words)
+            for index_name, words in indices.items()}
+
+
+def monthly_counts(df, masks):
+    '''
+    Counts, for every month and newspaper, the articles published and
+    the articles matching each index. Only the date and newspaper columns
+    of df are read; the article text is not copied.
+        Inputs:
+            - df (Pandas dataframe): Clean dataframe, as for
+            NewspaperIndex
+            - masks (dict): Maps index name to a boolean array with one
+            entry per article of df
+        Returns:
+            - Pandas dataframe with the month_year and newspaper columns,
+            an index_name + ' count' column per index and the number of
+            articles column
+    '''
+    return count_by_month(*_month_columns(df), masks)
+
+
+def _month_columns(df):
+    '''
+    Month ordinal, newspaper and whether the article is present, for
+    every article of a clean dataframe
+    '''
+    return (month_ordinals(df[DATE]), df[NEWSPAPER].array,
+            df[ARTICLE].notna().to_numpy())
+
+
+def month_ordinals(dates):
     '''
-    Checks if word is present in articles and creates
-    a dummy variable with the result
+    Ordinals of the monthly periods of dates (months since January
+    1970), the same as dates.dt.to_period('M').asi8. Each distinct day is
+    converted once and the rest is a table lookup.
+        Inputs:
+            - dates (Pandas series or array of datetimes)
+        Returns:
+            - numpy array of int64, NaT for missing dates
+    '''
+    values = np.asarray(pd.to_datetime(dates), dtype='datetime64[ns]')\
+        .view(np.int64)
+    missing = values == pd.NaT.value
+    days = values // (24 * 60 * 60 * 10 ** 9)
+    if missing.all():
+        return values.copy()
+    if missing.any():
+        days[missing] = days[~missing].min()
+    first = days.min()
+    table = np.arange(first, days.max() + 1).astype('datetime64[D]')\
+        .astype('datetime64[M]').astype(np.int64)
+    ordinals = table[days - first]
+    ordinals[missing] = pd.NaT.value
+    return ordinals
+
+
+def count_by_month(month_year, newspaper, has_article, masks):
+    '''
+    monthly_counts from the columns it needs, for callers that keep them
+    without the articles (see inverted_index.InvertedIndex).
+        Inputs:
+            - month_year (array of monthly periods): Month of each article
+            - newspaper (array of str): Newspaper of each article
+            - has_article (array of bool): Whether the article text is
+            present, articles without it are not counted
+            - masks (dict): Maps index name to a boolean array
+        Returns:
+            - Pandas dataframe, see monthly_counts
+    '''
+    matrix = CountMatrix(month_year, newspaper, has_article, masks)
+    month, paper = np.nonzero(matrix.rows)
+    columns = {MONTH_YEAR: matrix.months[month],
+               NEWSPAPER: matrix.newspapers[paper]}
+    for index_name, matches in matrix.matches.items():
+        columns[index_name + ' count'] = matches[month, paper]
+    columns[N_ARTICLES] = matrix.articles[month, paper]
+    return pd.DataFrame(columns)
+
+
+class CountMatrix():
+    '''
+    Counts of articles by month and newspaper, as dense matrices with a
+    row per month (every month from the first to the last, in order) and
+    a column per newspaper (in alphabetical order). They are filled with
+    a single bincount over integer codes of the month and newspaper of
+    every article. Articles without a month or a newspaper are left out,
+    as a group by would.
+    '''
+
+    def __init__(self, month_year, newspaper, has_article, masks):
+        '''
+        Inputs: see count_by_month. month_year may also be given as
+        integer ordinals (see month_ordinals) and newspaper as a Pandas
+        categorical
+        '''
+        if isinstance(month_year, np.ndarray) and month_year.dtype.kind == 'i':
+            ordinals = month_year.astype(np.int64, copy=False)
+        else:
+            ordinals = np.asarray(pd.PeriodIndex(month_year, freq='M').asi8)
+        if isinstance(newspaper, pd.Categorical):
+            order = np.argsort(newspaper.categories.to_numpy(dtype=object))
+            rank = np.empty(len(order) + 1, dtype=np.int64)
+            rank[order] = np.arange(len(order))
+            rank[-1] = -1
+            paper = rank[newspaper.codes]
+            self.newspapers = newspaper.categories[order].to_numpy()
+        else:
+            paper, self.newspapers = pd.factorize(newspaper, sort=True)
+        keep = (paper >= 0) & (ordinals != pd.NaT.value)
+        if keep.all():
+            keep = slice(None)
+        ordinals = ordinals[keep]
+        first = ordinals.min() if len(ordinals) else 0
+        num_months = ordinals.max() - first + 1 if len(ordinals) else 0
+        self.months = pd.PeriodIndex.from_ordinals(
+            np.arange(first, first + num_months), freq='M').array
+        shape = (num_months, len(self.newspapers))
+        cell = (ordinals - first) * shape[1] + paper[keep]
+
+        def count(selected=None):
+            '''
+            Articles of every cell, only the selected ones if given
+            '''
+            cells = cell if selected is None else \
+                cell[np.asarray(selected, dtype=bool)[keep]]
+            return np.bincount(cells, minlength=shape[0] * shape[1])\
+                .reshape(shape)
+
+        self.rows = count()
+        #Nearly every article has its text, so the missing ones are counted
+        self.articles = self.rows - count(~np.asarray(has_article,
+                                                       dtype=bool))
+        self.matches = {index_name: count(mask)
+                        for index_name, mask in masks.items()}
+
+    def index(self, index_name):
+        '''
+        Steps 3 and 4 of NewspaperIndex.make_index on the matrices
+        '''
+        return index_from_matrix(self.months, self.rows, self.articles,
+                                 self.matches[index_name], index_name)
+
+
+def index_from_matrix(months, rows, articles, matches, index_name):
+    '''
+    Steps 3 and 4 of NewspaperIndex.make_index: the share of articles of
+    every newspaper holding the keywords is added up by month. The shares
+    are added in newspaper order with compensated (Kahan) summation,
+    skipping missing ones, which is how the group by sum of Pandas adds
+    them, so the index is the same to the last bit.
+        Inputs:
+            - months (array of monthly periods): Month of every row
+            - rows, articles, matches (2d arrays): Articles, articles
+            with text and articles holding the keywords of every month
+            (row) and newspaper (column). Cells without articles are left
+            out of the index
+            - index_name (str): Name of the index
+        Returns:
+            - Pandas dataframe with the month_year and index_name columns
+    '''
+    with np.errstate(divide='ignore', invalid='ignore'):
+        shares = matches / articles
+    shares[rows == 0] = np.nan
+    total = np.zeros(len(months))
+    compensation = np.zeros(len(months))
+    for share in shares.T:
+        present = ~np.isnan(share)
+        step = share - compensation
+        added = total + step
+        error = added - total - step
+        error[np.isnan(error)] = 0
+        total = np.where(present, added, total)
+        compensation = np.where(present, error, compensation)
+    used = rows.any(axis=1)
+    return pd.DataFrame({MONTH_YEAR: months[used], index_name: total[used]})
+
+
+def index_from_counts(counts, index_name):
+    '''
+    Steps 3 and 4 of NewspaperIndex.make_index, from the counts of
+    monthly_counts.
+        Inputs:
+            - counts (pandas dataframe): Output of monthly_counts
+            - index_name (str): Index to compute
+        Returns:
+            - Pandas dataframe with the month_year and index_name columns
+    '''
+    ordinals = np.asarray(pd.PeriodIndex(counts[MONTH_YEAR], freq='M').asi8)
+    paper, newspapers = pd.factorize(counts[NEWSPAPER], sort=True)
+    first = ordinals.min() if len(ordinals) else 0
+    num_months = ordinals.max() - first + 1 if len(ordinals) else 0
+    shape = (num_months, len(newspapers))
+    cell = (ordinals - first, paper)
+    matrices = []
+    for values in (np.ones(len(counts), dtype=np.int64),
+                   counts[N_ARTICLES].to_numpy(),
+                   counts[index_name + ' count'].to_numpy()):
+        matrix = np.zeros(shape, dtype=np.int64)
+        np.add.at(matrix, cell, values)
+        matrices.append(matrix)
+    months = pd.PeriodIndex.from_ordinals(
+        np.arange(first, first + num_months), freq='M').array
+    return index_from_matrix(months, *matrices, index_name)
+
+
+def _keyword_order(sample, words):
+    '''
+    Keywords without repetitions, rarest first in sample
+    '''
+    return sorted(set(words),
+                  key=lambda word: sum(word in text for text in sample))
+
+
+@instrument.timed()
+def match_indices(texts, indices):
+    '''
+    Boolean mask of every index in a single pass over the texts: for
+    each text, every keyword list is checked with the same short-circuit
+    search as contains_all.
     Inputs:
-        - df (Pandas dataframe): Dataframe to remove
-        stops words from in a given column
-        - column_name (str): Column name to check
-        - word (str): Keyword to check
+        - texts (Pandas series): Texts to check
+        - indices (dict): Maps index name to its list of keywords
+    Returns:
+        - dict mapping index name to a numpy array of bool
     '''
-    df[word] = df[column_name].apply(lambda x: x.count(word) > 0)
-    return df
+    values = texts.to_numpy(dtype=object)
+    sample = values[:SAMPLE_SIZE]
+    orders = [_keyword_order(sample, words) for words in indices.values()]
+    matches = np.array([[all(word in text for word in order)
+                         for order in orders] for text in values],
+                       dtype=bool).reshape(len(values), len(orders))
+    return {index_name: matches[:, i] for i, index_name in enumerate(indices)}
+
+
+@instrument.timed()
+def contains_all(texts, words):
+    '''
+    Boolean mask of the texts that contain every word as a substring,
+    the same as checking x.count(word) > 0 for each word. Goes over the
+    texts once, and for each text checks the rarest words first (how
+    common a word is is estimated on the first SAMPLE_SIZE texts), so
+    most texts are discarded after a single substring search.
+    Inputs:
+        - texts (Pandas series): Texts to check
+        - words (list of str): Keywords that must all be present
+    Returns:
+        - numpy array of bool with one entry per text
+    '''
+    values = texts.to_numpy(dtype=object)
+    order = _keyword_order(values[:SAMPLE_SIZE], words)
+    return np.fromiter((all(word in text for word in order)
+                        for text in values), dtype=bool, count=len(values))
 
 
 def has_list_of_words(df, column_name, words, index_name):
@@ -133,12 +467,6 @@ def has_list_of_words(df, column_name, words, index_name):
         - column_name (str): Column name to check
         - word (str): Keyword to check
     '''
-    df['aux'] = 0
-    for word in words:
-        df = has_word(df, column_name, word)
-        df['aux'] += df[word]
-        df = df.drop([word], axis=1)
-    df[index_name + ' count'] = df['aux'].apply(lambda x: x == len(words))
-    df = df.drop(columns=['aux'], axis=1)
+    df[index_name + ' count'] = contains_all(df[column_name], words)
 
     return df
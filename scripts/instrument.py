@@ -0,0 +1,344 @@
+# -*- coding: utf-8 -*-
+"""
+Purpose: Stage-level instrumentation for the crawlers, the cleaners and
+the index. A stage is timed with the stage context manager or the timed
+decorator; for every stage the run keeps the number of calls, the wall
+and CPU seconds and the peak resident memory seen while it ran (sampled
+by a background thread every SAMPLE_INTERVAL seconds, plus once when it
+starts and ends). Counters keep totals such as articles written.
+
+When the environment variable RUN_REPORT names a JSON file, the stages
+and counters of the process are added to it when the process exits,
+under the name of the script, so the scripts of run_all_scripts.sh
+write one report for the whole run. The report can also be written
+with save_report.
+
+A single stage can be profiled by naming it in PROFILE_STAGE:
+    - PROFILER=cprofile (default): the stage runs under cProfile and the
+    stats are saved to PROFILE_DIR/<stage>.prof (open with pstats or
+    snakeviz). Only the thread that runs the stage is profiled
+    - PROFILER=py-spy: py-spy records the whole process (every thread)
+    while the stage runs, into PROFILE_DIR/<stage>.svg. py-spy must be
+    on the PATH
+
+Authors:
+Diego Diaz
+Rukhshan Arif Mian
+Piyush Tank
+"""
+
+import atexit
+import cProfile
+import functools
+import inspect
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import shutil
+import signal
+import subprocess
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+#Seconds between two samples of the resident memory
+SAMPLE_INTERVAL = 0.05
+REPORT_VARIABLE = "RUN_REPORT"
+PROFILE_VARIABLE = "PROFILE_STAGE"
+PROFILER_VARIABLE = "PROFILER"
+PROFILE_DIR_VARIABLE = "PROFILE_DIR"
+DEFAULT_PROFILE_DIR = "../data/profiles"
+
+_LOCK = threading.Lock()
+_STAGES = {}
+_COUNTERS = {}
+#Stages running right now, with the peak memory seen since they started
+_OPEN = {}
+_STARTED = time.time()
+_SAMPLER = None
+_END = object()
+_PROFILE = {"stage": os.environ.get(PROFILE_VARIABLE),
+            "profiler": os.environ.get(PROFILER_VARIABLE, "cprofile"),
+            "directory": os.environ.get(PROFILE_DIR_VARIABLE,
+                                        DEFAULT_PROFILE_DIR),
+            "cprofile": None, "depth": 0}
+
+
+def rss():
+    '''
+    Resident memory of the process in bytes. Where /proc is not available
+    the peak of the whole process is returned instead
+    '''
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        #Kilobytes on Linux, bytes on macOS
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _sample():
+    '''
+    Updates the peak memory of every open stage
+    '''
+    now = rss()
+    with _LOCK:
+        for token in _OPEN:
+            _OPEN[token] = max(_OPEN[token], now)
+    return now
+
+
+def _sampler():
+    '''
+    Samples the memory while any stage is open, then stops
+    '''
+    global _SAMPLER # pylint: disable=global-statement
+    while True:
+        time.sleep(SAMPLE_INTERVAL)
+        with _LOCK:
+            if not _OPEN:
+                _SAMPLER = None
+                return
+        _sample()
+
+
+def _start_sampler():
+    '''
+    Starts the memory sampler if it is not running
+    '''
+    global _SAMPLER # pylint: disable=global-statement
+    with _LOCK:
+        if _SAMPLER is None:
+            _SAMPLER = threading.Thread(target=_sampler, daemon=True)
+            _SAMPLER.start()
+
+
+def record(name, seconds, cpu_seconds=0.0, peak=None, calls=1):
+    '''
+    Adds a measurement to a stage, for time measured somewhere else (for
+    instance in a worker process)
+        Inputs:
+            - name (str): Stage
+            - seconds (float): Wall seconds
+            - cpu_seconds (float): CPU seconds
+            - peak (int): Peak resident memory in bytes, if measured
+            - calls (int): Calls the measurement covers
+    '''
+    with _LOCK:
+        entry = _STAGES.setdefault(name, {"calls": 0, "seconds": 0.0,
+                                          "cpu_seconds": 0.0,
+                                          "peak_rss": None})
+        entry["calls"] += calls
+        entry["seconds"] += seconds
+        entry["cpu_seconds"] += cpu_seconds
+        if peak is not None:
+            entry["peak_rss"] = max(entry["peak_rss"] or 0, peak)
+
+
+def count(name, value=1):
+    '''
+    Adds value to a counter
+    '''
+    with _LOCK:
+        _COUNTERS[name] = _COUNTERS.get(name, 0) + value
+
+
+@contextmanager
+def stage(name, calls=1):
+    '''
+    Context manager that times the block inside it as the stage name
+    (and profiles it if it is the stage to profile)
+    '''
+    token = object()
+    with _LOCK:
+        _OPEN[token] = 0
+    _sample()
+    _start_sampler()
+    profiling = _profile_start(name)
+    start, cpu_start = time.perf_counter(), time.process_time()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        cpu_seconds = time.process_time() - cpu_start
+        if profiling:
+            _profile_stop()
+        _sample()
+        with _LOCK:
+            peak = _OPEN.pop(token)
+        record(name, seconds, cpu_seconds, peak, calls)
+
+
+def timed(name=None):
+    '''
+    Decorator that times every call of a function as the stage name
+    (module.function by default). For generator functions only the time
+    spent inside the generator counts, not the time of the loop
+    consuming it, and a call ends when the generator is closed.
+    '''
+    def decorator(function):
+        stage_name = name or (function.__module__ + "." +
+                              function.__qualname__)
+
+        if inspect.isgeneratorfunction(function):
+            @functools.wraps(function)
+            def generator_wrapper(*args, **kwargs):
+                generator = function(*args, **kwargs)
+                calls = 1
+                try:
+                    while True:
+                        with stage(stage_name, calls):
+                            item = next(generator, _END)
+                        if item is _END:
+                            return
+                        calls = 0
+                        yield item
+                finally:
+                    generator.close()
+            return generator_wrapper
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with stage(stage_name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def set_profile(name, profiler="cprofile", directory=DEFAULT_PROFILE_DIR):
+    '''
+    Profiles the stage name from now on (None stops profiling), as the
+    PROFILE_STAGE, PROFILER and PROFILE_DIR environment variables do
+    '''
+    if profiler not in ("cprofile", "py-spy"):
+        raise ValueError("Unknown profiler: " + str(profiler))
+    _PROFILE.update(stage=name, profiler=profiler, directory=directory)
+
+
+def _profile_path(extension):
+    '''
+    File the profile of the stage is saved to
+    '''
+    os.makedirs(_PROFILE["directory"], exist_ok=True)
+    return os.path.join(_PROFILE["directory"], _PROFILE["stage"] + extension)
+
+
+def _profile_start(name):
+    '''
+    Starts the profiler if name is the stage to profile. Nested calls of
+    the stage are covered by the outermost one
+    '''
+    if name != _PROFILE["stage"]:
+        return False
+    _PROFILE["depth"] += 1
+    if _PROFILE["depth"] > 1:
+        return True
+    if _PROFILE["profiler"] == "py-spy":
+        if shutil.which("py-spy") is None:
+            print("py-spy not found, stage " + name + " is not profiled")
+            _PROFILE["process"] = None
+            return True
+        _PROFILE["process"] = subprocess.Popen(
+            ["py-spy", "record", "--pid", str(os.getpid()), "--output",
+             _profile_path(".svg")], stdout=subprocess.DEVNULL)
+    else:
+        if _PROFILE["cprofile"] is None:
+            _PROFILE["cprofile"] = cProfile.Profile()
+        _PROFILE["cprofile"].enable()
+    return True
+
+
+def _profile_stop():
+    '''
+    Stops the profiler when the outermost call of the stage ends, and
+    saves what it recorded
+    '''
+    _PROFILE["depth"] -= 1
+    if _PROFILE["depth"]:
+        return
+    if _PROFILE["profiler"] == "py-spy":
+        process = _PROFILE.get("process")
+        if process is not None:
+            #py-spy writes its output when interrupted
+            process.send_signal(signal.SIGINT)
+            process.wait()
+    else:
+        _PROFILE["cprofile"].disable()
+        _PROFILE["cprofile"].dump_stats(_profile_path(".prof"))
+
+
+def report():
+    '''
+    Stages and counters measured so far in this process
+        Returns:
+            - dict with the start time, the seconds since then, the
+            current and peak resident memory, and the stages (calls,
+            seconds, CPU seconds and peak memory in MB of each, in the
+            order they first ran) and counters
+    '''
+    with _LOCK:
+        stages = {name: {"calls": entry["calls"],
+                         "seconds": round(entry["seconds"], 4),
+                         "cpu_seconds": round(entry["cpu_seconds"], 4),
+                         "peak_rss_mb": None if entry["peak_rss"] is None
+                                        else round(entry["peak_rss"] / 2**20,
+                                                   1)}
+                  for name, entry in _STAGES.items()}
+        counters = dict(_COUNTERS)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform != "darwin":
+        peak *= 1024
+    return {"started": datetime.fromtimestamp(_STARTED).isoformat(
+        timespec="seconds"), "seconds": round(time.time() - _STARTED, 4),
+            "rss_mb": round(rss() / 2**20, 1),
+            "peak_rss_mb": round(peak / 2**20, 1),
+            "stages": stages, "counters": counters}
+
+
+def save_report(path, name=None):
+    '''
+    Adds the report of this process to the JSON run report in path,
+    under name (the script being run by default). Reports of earlier
+    processes already in the file are kept.
+    '''
+    name = name or os.path.basename(sys.argv[0] or "python")
+    run = {"python": platform.python_version(), "machine": platform.node(),
+           "scripts": {}}
+    if os.path.exists(path):
+        with open(path) as file:
+            run = json.load(file)
+    run["scripts"][name] = report()
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as file:
+        json.dump(run, file, indent=2)
+
+
+def reset():
+    '''
+    Forgets the stages and counters measured so far
+    '''
+    global _STARTED # pylint: disable=global-statement
+    with _LOCK:
+        _STAGES.clear()
+        _COUNTERS.clear()
+        _STARTED = time.time()
+
+
+def _save_at_exit():
+    '''
+    Adds the report to the file in RUN_REPORT, if set. Worker processes
+    (of the cleaning and parsing pools) leave the report to the process
+    that started them
+    '''
+    if multiprocessing.current_process().name == "MainProcess" and \
+            os.environ.get(REPORT_VARIABLE):
+        save_report(os.environ[REPORT_VARIABLE])
+
+
+atexit.register(_save_at_exit)
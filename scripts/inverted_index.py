@@ -0,0 +1,261 @@
+# -*- coding: utf-8 -*-
+"""
+Purpose: Persistent inverted index over the clean corpus. Every term of
+the article and title columns maps to the sorted ids (row numbers) of
+the articles that contain it. The posting lists are delta encoded and
+saved compressed in a single .npz file, together with the month and
+newspaper of every article, so an index for any keyword combination can
+be computed without reading the articles again.
+
+Keywords are matched like has_list_of_words does: an article matches a
+keyword when the keyword is a substring of its text. Clean articles only
+hold letters, apostrophes and spaces, so a keyword without spaces is in
+an article exactly when it is a substring of one of its terms. The
+posting lists of a keyword are then those of every term of the
+vocabulary that contains it, and an AND of keywords is the intersection
+of their posting lists.
+
+Usage (from the scripts directory):
+    python3 inverted_index.py
+
+Authors:
+Diego Diaz
+Rukhshan Arif Mian
+Piyush Tank
+"""
+
+import os
+from functools import reduce
+from itertools import chain
+import numpy as np
+import pandas as pd
+import index_builder as ib
+import main
+
+DEFAULT_PATH = "../data/index/inverted_index.npz"
+CLEAN_FILES = "../data/clean/*pkl"
+#Columns whose terms are indexed
+COLUMNS = (ib.ARTICLE, ib.TITLE)
+#Articles tokenized at a time while building
+CHUNK_SIZE = 10000
+
+
+def _sorted_unique(values):
+    '''
+    Sorted distinct values of an integer array (faster than np.unique,
+    which hashes)
+    '''
+    values = np.sort(values)
+    if len(values) > 1:
+        values = values[np.concatenate(([True], values[1:] != values[:-1]))]
+    return values
+
+
+def _postings(texts):
+    '''
+    Term and article id of every (term, article) pair of a column, with
+    the terms numbered in order of appearance.
+        Inputs:
+            - texts (Pandas series): Texts to index
+        Returns:
+            - (vocabulary list, term ids, article ids), the ids as numpy
+            arrays sorted by term and then by article
+    '''
+    vocabulary = {}
+    term_chunks, id_chunks = [], []
+    values = texts.to_numpy(dtype=object)
+    for start in range(0, len(values), CHUNK_SIZE):
+        split = [text.split() if isinstance(text, str) else []
+                 for text in values[start:start + CHUNK_SIZE]]
+        lengths = np.fromiter((len(terms) for terms in split),
+                              dtype=np.int64, count=len(split))
+        if not lengths.sum():
+            continue
+        tokens = np.empty(lengths.sum(), dtype=object)
+        tokens[:] = list(chain.from_iterable(split))
+        codes, uniques = pd.factorize(tokens)
+        rows = np.repeat(np.arange(len(split), dtype=np.int64), lengths)
+        pairs = _sorted_unique(codes.astype(np.int64) * CHUNK_SIZE + rows)
+        to_global = np.fromiter((vocabulary.setdefault(term, len(vocabulary))
+                                 for term in uniques), dtype=np.int64,
+                                count=len(uniques))
+        term_chunks.append(to_global[pairs // CHUNK_SIZE])
+        id_chunks.append(pairs % CHUNK_SIZE + start)
+    if not term_chunks:
+        return [], np.zeros(0, np.int64), np.zeros(0, np.int64)
+    terms = np.concatenate(term_chunks)
+    ids = np.concatenate(id_chunks)
+    order = np.lexsort((ids, terms))
+    return list(vocabulary), terms[order], ids[order]
+
+
+def _encode(terms, ids, num_terms):
+    '''
+    Delta encodes the article ids of every posting list. Returns the
+    deltas and the offset where each term's list starts.
+    '''
+    offsets = np.zeros(num_terms + 1, dtype=np.int64)
+    np.cumsum(np.bincount(terms, minlength=num_terms), out=offsets[1:])
+    deltas = np.diff(ids, prepend=0)
+    firsts = offsets[:-1][offsets[:-1] < offsets[1:]]
+    deltas[firsts] = ids[firsts]
+    return deltas.astype(np.uint32), offsets
+
+
+class InvertedIndex():
+    '''
+    Posting lists of the terms of the clean corpus plus the month and
+    newspaper of every article.
+    '''
+
+    def __init__(self, arrays):
+        '''
+        Inputs:
+            - arrays (dict): Arrays saved in the .npz file, see build
+        '''
+        self.num_articles = int(arrays['num_articles'])
+        self.month_year = pd.PeriodIndex.from_ordinals(
+            arrays['month_year'], freq='M').array
+        self.newspapers = [str(name) for name in arrays['newspapers']]
+        self.newspaper_codes = arrays['newspaper_codes']
+        self.has_article = arrays['has_article']
+        self._vocabulary = {}
+        self._deltas = {}
+        self._offsets = {}
+        for column in COLUMNS:
+            joined = arrays[column + '_vocabulary'].tobytes().decode('utf-8')
+            self._vocabulary[column] = joined.split('\n') if joined else []
+            self._deltas[column] = arrays[column + '_deltas']
+            self._offsets[column] = arrays[column + '_offsets']
+
+    @classmethod
+    def build(cls, df):
+        '''
+        Indexes a clean dataframe. Article ids are the row numbers of df.
+            Inputs:
+                - df (Pandas dataframe): Clean dataframe with the
+                newspaper, date, title and article columns
+            Returns:
+                - InvertedIndex
+        '''
+        codes, newspapers = pd.factorize(df[ib.NEWSPAPER])
+        arrays = {
+            'num_articles': np.int64(len(df)),
+            'month_year': df[ib.DATE].dt.to_period('M').array.asi8,
+            'newspapers': np.array(newspapers, dtype=str),
+            'newspaper_codes': codes.astype(np.int32),
+            'has_article': df[ib.ARTICLE].notna().to_numpy()}
+        for column in COLUMNS:
+            vocabulary, terms, ids = _postings(df[column])
+            deltas, offsets = _encode(terms, ids, len(vocabulary))
+            arrays[column + '_vocabulary'] = np.frombuffer(
+                '\n'.join(vocabulary).encode('utf-8'), dtype=np.uint8)
+            arrays[column + '_deltas'] = deltas
+            arrays[column + '_offsets'] = offsets
+        return cls(arrays)
+
+    @classmethod
+    def load(cls, path=DEFAULT_PATH):
+        '''
+        Reads an index saved with save
+        '''
+        with np.load(path) as arrays:
+            return cls(dict(arrays))
+
+    def save(self, path=DEFAULT_PATH):
+        '''
+        Saves the index as a compressed .npz file
+        '''
+        arrays = {'num_articles': np.int64(self.num_articles),
+                  'month_year': self.month_year.asi8,
+                  'newspapers': np.array(self.newspapers, dtype=str),
+                  'newspaper_codes': self.newspaper_codes,
+                  'has_article': self.has_article}
+        for column in COLUMNS:
+            arrays[column + '_vocabulary'] = np.frombuffer(
+                '\n'.join(self._vocabulary[column]).encode('utf-8'),
+                dtype=np.uint8)
+            arrays[column + '_deltas'] = self._deltas[column]
+            arrays[column + '_offsets'] = self._offsets[column]
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        np.savez_compressed(path, **arrays)
+
+    def terms_containing(self, word, column=ib.ARTICLE):
+        '''
+        Ids of the terms of the vocabulary that contain word
+        '''
+        return [term_id for term_id, term in
+                enumerate(self._vocabulary[column]) if word in term]
+
+    def posting_list(self, term_id, column=ib.ARTICLE):
+        '''
+        Sorted ids of the articles holding a term
+        '''
+        start, end = self._offsets[column][term_id:term_id + 2]
+        return np.cumsum(self._deltas[column][start:end], dtype=np.int64)
+
+    def articles_with(self, word, column=ib.ARTICLE):
+        '''
+        Sorted ids of the articles in which word is a substring
+        '''
+        if not word or word != ''.join(word.split()):
+            raise ValueError("Keywords must be non empty and without spaces"
+                             " to be looked up in the inverted index: " +
+                             repr(word))
+        lists = [self.posting_list(term_id, column)
+                 for term_id in self.terms_containing(word, column)]
+        if not lists:
+            return np.zeros(0, dtype=np.int64)
+        return _sorted_unique(np.concatenate(lists))
+
+    def match_all(self, words, column=ib.ARTICLE):
+        '''
+        Boolean mask of the articles holding every word, the same as
+        index_builder.contains_all on the indexed column
+            Inputs:
+                - words (list of str): Keywords
+                - column (str): 'article' or 'title'
+            Returns:
+                - numpy array of bool with one entry per article
+        '''
+        lists = sorted((self.articles_with(word, column) for word in
+                        set(words)), key=len)
+        mask = np.zeros(self.num_articles, dtype=bool)
+        if lists:
+            mask[reduce(lambda left, right: np.intersect1d(
+                left, right, assume_unique=True), lists)] = True
+        else:
+            mask[:] = True
+        mask &= self.has_article
+        return mask
+
+    def monthly_counts(self, masks):
+        '''
+        index_builder.monthly_counts for the indexed corpus
+        '''
+        #Articles without a newspaper have code -1, which from_codes
+        #keeps as missing
+        newspaper = pd.Categorical.from_codes(self.newspaper_codes,
+                                              self.newspapers)
+        return ib.count_by_month(self.month_year, newspaper, self.has_article,
+                                 masks)
+
+
+def build_from_clean_files(clean_files=CLEAN_FILES, path=DEFAULT_PATH):
+    '''
+    Builds the inverted index of the clean pickles and saves it.
+        Inputs:
+            - clean_files (str): Glob of the clean pickles
+            - path (str): .npz file to write
+        Returns:
+            - InvertedIndex
+    '''
+    inverted = InvertedIndex.build(main.append_dfs_in_dir(clean_files))
+    inverted.save(path)
+    return inverted
+
+
+if __name__ == "__main__":
+    build_from_clean_files()
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+"""
+Purpose: Loads many dataframe files into one. The files are read
+concurrently by a pool of threads, each one is brought to the same
+columns and types as soon as it is read, and all of them are
+concatenated once at the end (instead of appending them one by one,
+which copies everything loaded so far for every file). The time spent
+on every file is reported.
+
+Authors:
+Diego Diaz
+Rukhshan Arif Mian
+Piyush Tank
+"""
+
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+import instrument
+
+#Types understood by coerce
+STRING = 'string'
+DATETIME = 'datetime'
+
+
+def coerce(df, schema):
+    '''
+    Brings a dataframe to a schema: columns in the schema order (missing
+    ones are added empty, extra ones are dropped) and the schema types.
+    Missing values are kept as missing.
+        Inputs:
+            - df (Pandas dataframe): Dataframe to coerce
+            - schema (dict): Maps column name to STRING, DATETIME, or any
+            type accepted by astype. None keeps the type of the column
+        Returns:
+            - Pandas dataframe
+    '''
+    df = df.reindex(columns=list(schema))
+    for column, kind in schema.items():
+        if kind is None:
+            continue
+        if kind == STRING:
+            values = df[column]
+            df[column] = values.where(values.isna(), values.astype(str))
+        elif kind == DATETIME:
+            df[column] = pd.to_datetime(df[column])
+        else:
+            df[column] = df[column].astype(kind)
+    return df
+
+
+def _read_one(path, read, schema):
+    '''
+    Reads and coerces a file, returning it with the seconds it took
+    '''
+    start = time.perf_counter()
+    df = read(path)
+    if schema is not None:
+        df = coerce(df, schema)
+    return df, time.perf_counter() - start
+
+
+@instrument.timed()
+def load_files(paths, read=pd.read_pickle, schema=None, workers=None,
+               verbose=True):
+    '''
+    Reads files concurrently and concatenates them once, in the order of
+    paths.
+        Inputs:
+            - paths (list of str): Files to read
+            - read (function): Takes a path and returns a dataframe
+            - schema (dict): Columns and types every file is coerced to,
+            see coerce. Files are left as read if None
+            - workers (int): Number of threads, one per file up to the
+            number of cores by default
+            - verbose (bool): Print the rows and seconds of every file
+        Returns:
+            - (df, timings) where df is the concatenated dataframe (None
+            if there are no paths) and timings is a list of (path, rows,
+            seconds) tuples
+    '''
+    paths = list(paths)
+    if not paths:
+        return None, []
+    workers = workers or min(len(paths), os.cpu_count() or 1)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(lambda path: _read_one(path, read, schema),
+                                paths))
+    timings = [(path, len(df), seconds)
+               for path, (df, seconds) in zip(paths, results)]
+    if verbose:
+        for path, rows, seconds in timings:
+            print("Loaded " + path + ": " + str(rows) + " rows in " +
+                  "{:.2f}".format(seconds) + " seconds")
+    frames = [df for df, _ in results]
+    if len(frames) == 1:
+        return frames[0], timings
+    return pd.concat(frames, sort=False), timings
@@ -12,15 +12,35 @@ Domestic Violence
 
 from datetime import datetime
 import glob
-import pandas as pd
+import os
 import matplotlib.pyplot as plt
+import compact
+import instrument
 import index_builder as ib
-
-
+import loader
+
+#Keywords of every index, see index_builder.NewspaperIndex
+INDICES = {'EPU': ['econ', 'policy', 'uncert'],
+           'Natural Disaster': ['earthquake', 'damage'],
+           'Domestic Violence': ['domestic', 'violence']}
+#Environment variable naming the corpus store (see corpus.py) to read
+#the clean articles from instead of the pickles. Not set by default: a
+#store written by one cleaner (e.g. herald_cleaner.clean_to_store) holds
+#only that source, and any store may be older than the pickles
+STORE_VARIABLE = 'CORPUS_STORE'
+#Columns and types of the clean dataframes of every source
+CLEAN_SCHEMA = {ib.NEWSPAPER: loader.STRING, ib.URL: loader.STRING,
+                ib.DATE: loader.DATETIME, ib.TITLE: loader.STRING,
+                ib.ARTICLE: loader.STRING}
+
+
+@instrument.timed()
 def append_dfs_in_dir(dir_of_dfs):
     '''
     Appends the dataframes available from each source
-    into one dataframe.
+    into one dataframe. The files are read concurrently,
+    brought to the same columns and types, and
+    concatenated once.
         Inputs:
             - dir_of_dfs (str): Directory where the
             dataframes are stored, they must be in
@@ -30,19 +50,13 @@ def append_dfs_in_dir(dir_of_dfs):
             dataframe
     '''
 
-    files = glob.glob(dir_of_dfs)
-    df = None
-
-    for i, file in enumerate(files):
-        if i == 0:
-            df = pd.read_pickle(file)
-        else:
-            temp_df = pd.read_pickle(file)
-            df = df.append(temp_df, sort=False)
+    files = sorted(glob.glob(dir_of_dfs))
+    df, _ = loader.load_files(files, schema=CLEAN_SCHEMA)
 
     return df
 
 
+@instrument.timed()
 def labels(fig, index_name):
 
     '''
@@ -124,27 +138,43 @@ def main():
     Domestic Violence
     '''
 
-    print("Appending clean dataframes for each news source")
-    df_total = append_dfs_in_dir('../data/clean/*pkl')
+    #The corpus is kept compact (see compact.py) while the indices are made
+    store = os.environ.get(STORE_VARIABLE)
+    if store:
+        #Only the columns the indices need are read from the store
+        print("Reading clean corpus from the corpus store in " + store)
+        with instrument.stage("main.load"):
+            df_total = compact.CompactCorpus.from_store(
+                root=store, columns=ib.INDEX_COLUMNS)
+    else:
+        print("Appending clean dataframes for each news source from "
+              "../data/clean/*pkl")
+        with instrument.stage("main.load"):
+            df_total = compact.CompactCorpus.from_frame(
+                append_dfs_in_dir('../data/clean/*pkl'))
+    print(str(len(df_total)) + " articles of " +
+          ", ".join(sorted(str(name) for name in df_total.newspapers)))
+
+    #All indices are counted in a single pass over the articles
+    print("Indices: Economic Policy Uncertainty (EPU), Natural Disasters,"
+          " Domestic Violence")
+    indices = ib.build_indices(df_total, INDICES)
 
     #FOR ECONOMIC POLICY UNCERTAINTY
-    print("Index: Economic Policy Uncertainty (EPU)")
-    policy = ib.NewspaperIndex(df_total, 'EPU', ['econ', 'policy', 'uncert'])
+    policy = indices['EPU']
     print("EPU Index created")
     fig = policy.plot_index(2009)
     print("Plot Saved: figures/EPU.png")
     labels(fig, 'EPU')
 
     #POTENTIAL: FOR NATURAL DISASTERS
-    print("Index: Natural Disasters")
-    natural_disasters = ib.NewspaperIndex(df_total, 'Natural Disaster', ['earthquake', 'damage'])
+    natural_disasters = indices['Natural Disaster']
     print("Natural Disaster Index created")
     fig = natural_disasters.plot_index(2009)
     print("Plot Saved: figures/Natural Disasters.png")
 
     #POTENTIAL: FOR DOMESTIC VIOLENCE
-    print("Index: Domestic Violence")
-    dom_viol = ib.NewspaperIndex(df_total, 'Domestic Violence', ['domestic', 'violence'])
+    dom_viol = indices['Domestic Violence']
     print("Domestic Violence Index created")
     fig = dom_viol.plot_index(2009)
     print("Plot Saved: figures/Domestic Violence.png")
@@ -0,0 +1,261 @@
+# -*- coding: utf-8 -*-
+"""
+Purpose: HTML parsing backends for the crawlers. Every site only needs a
+few elements from each page (the links, the h1, the paragraphs of the
+article body and the date), so instead of building a full BeautifulSoup
+tree with html5lib for every page, the default 'lxml' backend parses the
+page with lxml and pulls out just those elements with XPath. Only the
+matched elements are turned into Python objects.
+
+The 'bs4' backend runs the original BeautifulSoup code of each crawler
+and is kept as the reference the lxml backend is checked against (see
+bench_parsers.py).
+
+Authors:
+Diego Diaz
+Rukhshan Arif Mian
+Piyush Tank
+"""
+
+import lxml.etree
+import lxml.html
+from bs4 import BeautifulSoup, SoupStrainer
+from bs4.dammit import EncodingDetector
+import instrument
+
+DEFAULT_BACKEND = 'lxml'
+#Parser used by BeautifulSoup when a soup is still needed
+DEFAULT_FEATURES = 'lxml'
+
+HERALD_BODY = '//div[@id="article-body"]'
+HERALD_PUBLISH = '//div[contains(concat(" ", normalize-space(@class), " "),'\
+    ' " publish ")]'
+STUFF_BODY = '//div[contains(concat(" ", normalize-space(@class), " "),'\
+    ' " sics-component__app__content ")]'
+STUFF_DATE = '//span[contains(concat(" ", normalize-space(@class), " "),'\
+    ' " sics-component__byline__date ")]'
+TVNZ_STORY = '//div[@class="storyPage first-page"]'
+
+
+def _parse(content):
+    '''
+    Parses a page with lxml, using the same encoding BeautifulSoup with
+    lxml would pick: the one declared in the page, else utf-8, else
+    windows-1252. (html5lib goes straight to windows-1252 for pages that
+    declare nothing, which only changes accented letters that the
+    cleaners remove anyway.)
+        Inputs:
+            - content (bytes): Body of the response
+        Returns:
+            - lxml root element, or None for an empty page
+    '''
+    encoding = EncodingDetector.find_declared_encoding(content, is_html=True)
+    if not encoding:
+        try:
+            content.decode('utf-8')
+            encoding = 'utf-8'
+        except UnicodeDecodeError:
+            encoding = 'windows-1252'
+    try:
+        return lxml.html.document_fromstring(
+            content, parser=lxml.html.HTMLParser(encoding=encoding))
+    except (lxml.etree.ParserError, LookupError):
+        return None
+
+
+def _first(root, xpath):
+    '''
+    First element matching xpath in document order, or None
+    '''
+    found = root.xpath('(' + xpath + ')[1]')
+    return found[0] if found else None
+
+
+def _text(element):
+    '''
+    Text of an element and all its descendants, like the .text of a
+    BeautifulSoup tag
+    '''
+    return element.text_content()
+
+
+def _children(element):
+    '''
+    Children of an element as BeautifulSoup lists them: text nodes and
+    elements, in order
+    '''
+    children = []
+    if element.text:
+        children.append(element.text)
+    for child in element:
+        children.append(child)
+        if child.tail:
+            children.append(child.tail)
+    return children
+
+
+def _to_str(node):
+    '''
+    str() of a BeautifulSoup node: text for strings and comments, markup
+    for elements
+    '''
+    if isinstance(node, str):
+        return node
+    if isinstance(node, lxml.etree._Comment): # pylint: disable=protected-access
+        return node.text or ''
+    return lxml.html.tostring(node, encoding='unicode', with_tail=False)
+
+
+def page_links(content):
+    '''
+    Returns the href of every <a> tag of a page, in order
+    '''
+    root = _parse(content)
+    if root is None:
+        return []
+    return [str(href) for href in root.xpath('//a/@href')]
+
+
+@instrument.timed()
+def link_soup(content):
+    '''
+    Soup with only the <a> tags of a page, for the functions of the
+    crawlers that look for links with soup.find_all('a')
+    '''
+    return BeautifulSoup(content, DEFAULT_FEATURES,
+                         parse_only=SoupStrainer('a'))
+
+
+@instrument.timed()
+def make_soup(content):
+    '''
+    Full soup of a page built with the default parser
+    '''
+    return BeautifulSoup(content, DEFAULT_FEATURES)
+
+
+def herald_article(content):
+    '''
+    Title, date and time and text of a NZ Herald article, the same as
+    herald_crawler.get_data_from_url
+        Inputs:
+            - content (bytes): Body of the article page
+        Returns:
+            - (title, date_and_time, article) tuple of str
+    '''
+    root = _parse(content)
+    if root is None:
+        return 'None', 'None', ''
+    body = _first(root, HERALD_BODY)
+    article = ''
+    if body is not None:
+        article = ''.join(_text(tag) for tag in body.iter('p'))
+    title = _first(root, '//h1')
+    title = _text(title) if title is not None else None
+    date_and_time = _first(root, HERALD_PUBLISH)
+    if date_and_time is not None:
+        children = _children(date_and_time)
+        date_and_time = _to_str(children[0] if len(children) > 1
+                                else date_and_time)
+    return str(title), str(date_and_time), article
+
+
+def stuff_article(content):
+    '''
+    Title, date and time and text of a Stuff article, the same as
+    stuff_crawler.get_data_from_soup. Pages missing any of them are not
+    articles and give None for the three fields.
+        Inputs:
+            - content (bytes): Body of the article page
+        Returns:
+            - (title, date_and_time, article) tuple
+    '''
+    root = _parse(content)
+    if root is None:
+        return None, None, None
+    body = _first(root, STUFF_BODY)
+    title = _first(root, '//h1')
+    date_and_time = _first(root, STUFF_DATE)
+    if body is None or title is None or date_and_time is None:
+        return None, None, None
+    article = ''.join(_text(tag) for tag in body.iter('p'))
+    return _text(title), _text(date_and_time), article
+
+
+def tvnz_article(content):
+    '''
+    Title and list of paragraphs of a TVNZ article, the same as
+    tvnz_crawler.get_article_text
+        Inputs:
+            - content (bytes): Body of the article page
+        Returns:
+            - (title, article_text) tuple, or None if the page has no h1
+    '''
+    root = _parse(content)
+    if root is None:
+        return None
+    title = _first(root, '//h1')
+    if title is None:
+        return None
+    return _text(title), [_text(tag) for tag in root.iter('p')]
+
+
+def tvnz_is_article(content):
+    '''
+    Checks if a TVNZ page is a story page, the same as
+    tvnz_crawler.check_if_article
+    '''
+    root = _parse(content)
+    return root is not None and bool(root.xpath(TVNZ_STORY))
+
+
+def tvnz_page(content):
+    '''
+    Whether a TVNZ page is a story page (as tvnz_is_article) and the href
+    of every <a> tag (as page_links), parsing the page once
+        Returns:
+            - (is_story, hrefs) tuple
+    '''
+    root = _parse(content)
+    if root is None:
+        return False, []
+    return bool(root.xpath(TVNZ_STORY)), \
+        [str(href) for href in root.xpath('//a/@href')]
+
+
+def _bs4_herald(content):
+    import herald_crawler # pylint: disable=import-outside-toplevel
+    return herald_crawler.get_data_from_url(BeautifulSoup(content, 'lxml'))
+
+
+def _bs4_stuff(content):
+    import stuff_crawler # pylint: disable=import-outside-toplevel
+    return stuff_crawler.get_data_from_soup(BeautifulSoup(content, 'html5lib'))
+
+
+def _bs4_tvnz(content):
+    import tvnz_crawler # pylint: disable=import-outside-toplevel
+    try:
+        return tvnz_crawler.get_article_text(BeautifulSoup(content, 'html5lib'))
+    except AttributeError:
+        return None
+
+
+BACKENDS = {
+    'lxml': {'herald': herald_article, 'stuff': stuff_article,
+             'tvnz': tvnz_article},
+    'bs4': {'herald': _bs4_herald, 'stuff': _bs4_stuff, 'tvnz': _bs4_tvnz},
+}
+
+
+def extract(site, content, backend=DEFAULT_BACKEND):
+    '''
+    Extracts the fields of an article page.
+        Inputs:
+            - site (str): 'herald', 'stuff' or 'tvnz'
+            - content (bytes): Body of the article page
+            - backend (str): 'lxml' (default) or 'bs4'
+        Returns:
+            - the tuple returned by the extractor of the site
+    '''
+    return BACKENDS[backend][site](content)
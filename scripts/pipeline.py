@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+"""
+Purpose: Fetch/extract pipeline for the crawlers. A pool of fetch
+threads downloads the pages and puts their bodies in a bounded queue;
+a pool of worker processes takes them from there and runs the HTML
+extractor of the site. Downloading and parsing overlap, parsing uses
+every core, and because both the queue and the number of pages being
+parsed are bounded, the fetchers wait (instead of piling bodies up in
+memory) whenever parsing falls behind.
+
+Authors:
+Diego Diaz
+Rukhshan Arif Mian
+Piyush Tank
+"""
+
+import atexit
+import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import requests
+import fetcher
+import instrument
+import parsers
+import sessions
+import telemetry
+
+#Bodies waiting to be parsed before the fetchers have to wait
+QUEUE_SIZE = 64
+
+_POOL = None
+_POOL_LOCK = threading.Lock()
+_DONE = object()
+
+
+def get_pool(workers=None):
+    '''
+    Returns the process pool of extractor workers shared by all crawls,
+    starting it the first time it is needed.
+        Inputs:
+            - workers (int): Number of processes, one per core by default
+    '''
+    global _POOL # pylint: disable=global-statement
+    with _POOL_LOCK:
+        if _POOL is None:
+            _POOL = ProcessPoolExecutor(max_workers=workers or os.cpu_count())
+            atexit.register(_POOL.shutdown)
+        return _POOL
+
+
+def _fetch_worker(urls, urls_lock, bodies, get, stop):
+    '''
+    Takes urls one at a time and puts (url, status_code, content) in the
+    bodies queue. Status and content are None when the request failed.
+    Blocks while the queue is full.
+    '''
+    while not stop.is_set():
+        with urls_lock:
+            url = next(urls, None)
+        if url is None:
+            break
+        try:
+            response = get(url)
+        except requests.exceptions.RequestException:
+            response = None
+        if response is None:
+            item = (url, None, None)
+        else:
+            item = (url, response.status_code, response.content)
+        while not stop.is_set():
+            try:
+                bodies.put(item, timeout=0.1)
+                break
+            except queue.Full:
+                continue
+    bodies.put(_DONE)
+
+
+def _extract(site, content):
+    '''
+    Runs the extractor of the site in a worker process, returning the
+    fields with the wall and CPU seconds it took there
+    '''
+    start, cpu_start = time.perf_counter(), time.process_time()
+    fields = parsers.extract(site, content)
+    return fields, time.perf_counter() - start, \
+        time.process_time() - cpu_start
+
+
+def _fields(site, url, future):
+    '''
+    Fields extracted by a finished _extract, whose time is added to the
+    parse stage of the site. A page the extractor fails on gives None,
+    as a page that could not be downloaded, so that one malformed page
+    does not stop the crawl.
+    '''
+    if future is None:
+        return None
+    try:
+        fields, seconds, cpu_seconds = future.result()
+    except Exception as error: # pylint: disable=broad-except
+        instrument.count("pipeline.parse_errors." + site)
+        telemetry.log("parse_failed", site=site, url=url, error=repr(error))
+        return None
+    instrument.record("pipeline.parse." + site, seconds, cpu_seconds)
+    return fields
+
+
+@instrument.timed()
+def fetch_and_extract(urls, site, concurrency=fetcher.DEFAULT_CONCURRENCY,
+                      get=sessions.get, workers=None, queue_size=QUEUE_SIZE):
+    '''
+    Downloads urls with concurrency fetch threads and extracts the fields
+    of every page that answered with status 200 in the extractor process
+    pool.
+        Inputs:
+            - urls (iterable of str): Pages to download
+            - site (str): Site whose extractor to use, see parsers.extract
+            - concurrency (int): Number of fetch threads
+            - get (function): Blocking function that takes a url and
+            returns a response object or None
+            - workers (int): Number of extractor processes
+            - queue_size (int): Maximum number of bodies waiting to be
+            parsed, and of bodies being parsed
+        Yields:
+            - (url, status_code, fields) tuples, in the order the pages
+            finished downloading. status_code is None if the request
+            failed and fields is None unless the status was 200 and the
+            extractor could read the page
+    '''
+    pool = get_pool(workers)
+    urls = iter(list(urls))
+    urls_lock = threading.Lock()
+    bodies = queue.Queue(maxsize=queue_size)
+    stop = threading.Event()
+    threads = [threading.Thread(target=_fetch_worker, daemon=True,
+                                args=(urls, urls_lock, bodies, get, stop))
+               for _ in range(max(1, concurrency))]
+    for thread in threads:
+        thread.start()
+
+    in_flight = deque()
+    running = len(threads)
+    try:
+        while running or in_flight:
+            #Hand back, in order, the pages at the front that are parsed
+            while in_flight and (in_flight[0][2] is None or
+                                 in_flight[0][2].done()):
+                url, status, future = in_flight.popleft()
+                yield url, status, _fields(site, url, future)
+
+            telemetry.set_queue(site + '.bodies', bodies.qsize())
+            telemetry.set_queue(site + '.parsing', len(in_flight))
+            #Only take a new body when there is room in the process pool
+            if running and len(in_flight) < queue_size:
+                try:
+                    item = bodies.get(timeout=0.05)
+                except queue.Empty:
+                    continue
+                if item is _DONE:
+                    running -= 1
+                    continue
+                url, status, content = item
+                future = None
+                if status == 200:
+                    future = pool.submit(_extract, site, content)
+                in_flight.append((url, status, future))
+            elif in_flight:
+                url, status, future = in_flight.popleft()
+                yield url, status, _fields(site, url, future)
+    finally:
+        stop.set()
+        for future in in_flight:
+            if future[2]:
+                future[2].cancel()
+        for thread in threads:
+            while thread.is_alive():
+                try:
+                    bodies.get_nowait()
+                except queue.Empty:
+                    thread.join(0.1)
@@ -0,0 +1,207 @@
+# -*- coding: utf-8 -*-
+"""
+Purpose: Per-host rate limiter shared by the crawlers. Each host gets a
+token bucket whose rate adapts to how the server answers (AIMD): every
+successful response raises the rate a little, and a 429/503 or refused
+connection cuts it in half. Refusals that arrive within one round trip
+of the last cut (the smoothed response time of the host, and at least
+the request interval before the cut) are answers to requests already in
+flight and do not cut it again. Retry-After headers are honoured.
+This way the crawlers run at the highest rate the archive tolerates
+instead of sleeping a fixed, pessimistic amount between requests.
+
+Authors:
+Diego Diaz
+Rukhshan Arif Mian
+Piyush Tank
+"""
+
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+#Requests per second a host starts at, and the limits of the rate
+INITIAL_RATE = 5.0
+MIN_RATE = 0.2
+MAX_RATE = 50.0
+#Rate added after every success and factor applied after every refusal
+INCREASE = 0.1
+DECREASE = 0.5
+#Requests that can be sent at once after a quiet period
+BURST = 5
+THROTTLE_STATUS = (429, 503)
+#Weight of the newest response time in the smoothed round trip time
+RTT_GAIN = 0.125
+
+
+def parse_retry_after(value):
+    '''
+    Seconds to wait from a Retry-After header, which holds either a
+    number of seconds or an HTTP date. Returns None if it cannot be read.
+    '''
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max((when - datetime.now(timezone.utc)).total_seconds(), 0.0)
+
+
+class HostLimiter():
+    '''
+    Token bucket for a single host with an adaptive rate
+    '''
+
+    def __init__(self, rate=INITIAL_RATE, burst=BURST):
+        self.rate = rate
+        self.burst = burst
+        #Seconds spent waiting for a token at the current rate, and
+        #seconds spent waiting only because the server asked for it
+        #(Retry-After)
+        self.pacing_seconds = 0.0
+        self.throttled_seconds = 0.0
+        self.throttle_events = 0
+        #Smoothed response time of the host
+        self.rtt = None
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        #Time of the last decrease of the rate and how long refusals
+        #after it are taken as answers to requests sent before it
+        self._decreased = None
+        self._window = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        '''
+        Waits until a request to the host is allowed. The token is taken
+        under the lock and the wait happens outside it, so threads queue
+        up one token apart.
+        '''
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens +
+                               (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            pacing = max(-self._tokens / self.rate, 0.0)
+            backoff = max(self._blocked_until - now - pacing, 0.0)
+            self.pacing_seconds += pacing
+            self.throttled_seconds += backoff
+            wait = pacing + backoff
+        if wait > 0:
+            time.sleep(wait)
+
+    def record(self, status_code, retry_after=None, seconds=None):
+        '''
+        Adapts the rate to a response. The rate is cut at most once per
+        round trip, so a burst of refusals of requests that were in
+        flight together counts as one.
+            Inputs:
+                - status_code (int): Status of the response, None for a
+                refused connection
+                - retry_after (str): Retry-After header of the response
+                - seconds (float): Time the response took, None if unknown
+        '''
+        with self._lock:
+            if seconds is not None:
+                self.rtt = seconds if self.rtt is None else \
+                    self.rtt + RTT_GAIN * (seconds - self.rtt)
+            if status_code is None or status_code in THROTTLE_STATUS:
+                now = time.monotonic()
+                if self._decreased is None or \
+                        now - self._decreased >= self._window:
+                    #Requests sent before the cut are answered within a
+                    #round trip of it, and at the old rate there are
+                    #several of them when the round trip is long
+                    self._window = max(1 / self.rate, self.rtt or 0.0)
+                    self.rate = max(MIN_RATE, self.rate * DECREASE)
+                    self._decreased = now
+                self.throttle_events += 1
+                delay = parse_retry_after(retry_after)
+                if delay:
+                    self._blocked_until = max(self._blocked_until,
+                                              now + delay)
+            else:
+                self.rate = min(MAX_RATE, self.rate + INCREASE)
+
+
+class RateLimiter():
+    '''
+    One HostLimiter per host, created the first time the host is seen
+    '''
+
+    def __init__(self, initial_rate=INITIAL_RATE, burst=BURST):
+        self.initial_rate = initial_rate
+        self.burst = burst
+        self._hosts = {}
+        self._lock = threading.Lock()
+
+    def host(self, host):
+        '''
+        Returns the limiter of a host
+        '''
+        with self._lock:
+            if host not in self._hosts:
+                self._hosts[host] = HostLimiter(self.initial_rate, self.burst)
+            return self._hosts[host]
+
+    def acquire(self, host):
+        '''
+        Waits until a request to host is allowed
+        '''
+        self.host(host).acquire()
+
+    def record(self, host, status_code, retry_after=None, seconds=None):
+        '''
+        Adapts the rate of host to a response, see HostLimiter.record
+        '''
+        self.host(host).record(status_code, retry_after, seconds)
+
+    def stats(self):
+        '''
+        Current rate (requests per second), seconds spent waiting for a
+        token (pacing), seconds spent waiting because the server asked
+        for it (throttled) and number of throttling responses for every
+        host
+        '''
+        with self._lock:
+            hosts = dict(self._hosts)
+        return {host: {"rate": limiter.rate,
+                       "pacing_seconds": limiter.pacing_seconds,
+                       "throttled_seconds": limiter.throttled_seconds,
+                       "throttle_events": limiter.throttle_events}
+                for host, limiter in hosts.items()}
+
+
+class _Unlimited():
+    '''
+    Stand-in limiter that never waits
+    '''
+
+    def acquire(self, host):
+        '''
+        Returns straight away
+        '''
+
+    def record(self, host, status_code, retry_after=None, seconds=None):
+        '''
+        Ignores the response
+        '''
+
+    def stats(self):
+        '''
+        No hosts are tracked
+        '''
+        return {}
+
+
+UNLIMITED = _Unlimited()
@@ -0,0 +1,238 @@
+# -*- coding: utf-8 -*-
+"""
+Purpose: URL-seen ledger shared by every crawler and every run. The
+exact set of article urls already saved lives in a SQLite file; an
+in-memory Bloom filter in front of it answers "never seen" for almost
+every new url without touching the disk, so only likely duplicates are
+looked up in SQLite. Urls are canonicalized before being checked, so
+the same article reached through different web.archive captures, with
+tracking parameters or over http and https is downloaded once.
+
+Authors:
+Diego Diaz
+Rukhshan Arif Mian
+Piyush Tank
+"""
+
+import hashlib
+import math
+import sqlite3
+import threading
+import time
+import cdx
+
+DEFAULT_PATH = "../data/raw/seen_urls.sqlite"
+#Urls the Bloom filter is sized for before it is rebuilt twice as big
+DEFAULT_CAPACITY = 1000000
+#Share of unseen urls that still have to be looked up in SQLite
+DEFAULT_ERROR_RATE = 0.001
+#Query parameters that identify a page: NZ Herald articles are
+#article.cfm?objectid=...
+KEEP_PARAMS = ('objectid',)
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS seen (
+    url TEXT PRIMARY KEY,
+    source TEXT,
+    added_at REAL NOT NULL
+);
+'''
+
+
+def canonical_url(url):
+    '''
+    Canonical form used as the key of the ledger: without the web.archive
+    prefix, https scheme, no fragment and no query string other than the
+    parameters in KEEP_PARAMS. See cdx.canonical_url.
+    '''
+    return cdx.canonical_url(url, KEEP_PARAMS)
+
+
+class BloomFilter():
+    '''
+    Fixed size Bloom filter over strings
+    '''
+
+    def __init__(self, capacity=DEFAULT_CAPACITY,
+                 error_rate=DEFAULT_ERROR_RATE):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.num_bits = max(8, int(-capacity * math.log(error_rate) /
+                                   math.log(2) ** 2))
+        self.num_hashes = max(1, round(self.num_bits / capacity *
+                                       math.log(2)))
+        self.count = 0
+        self._bits = bytearray((self.num_bits + 7) // 8)
+
+    def _positions(self, item):
+        '''
+        Bit positions of an item, from two 64 bit hashes (double hashing)
+        '''
+        digest = hashlib.blake2b(item.encode('utf-8'), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:], 'little') | 1
+        return [(first + i * second) % self.num_bits
+                for i in range(self.num_hashes)]
+
+    def add(self, item):
+        '''
+        Adds a string to the filter
+        '''
+        for position in self._positions(item):
+            self._bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, item):
+        return all(self._bits[position >> 3] & (1 << (position & 7))
+                   for position in self._positions(item))
+
+
+class UrlLedger():
+    '''
+    Set of canonical article urls already saved, kept in a SQLite file
+    with a Bloom filter in memory.
+
+    Crawlers call claim() with the urls they are about to download, which
+    drops the ones already saved (in this run or any earlier one, by any
+    crawler) and the ones already claimed in this run, and add() once the
+    rows of the urls are safely on disk.
+    '''
+
+    def __init__(self, path=DEFAULT_PATH, capacity=DEFAULT_CAPACITY,
+                 error_rate=DEFAULT_ERROR_RATE):
+        '''
+        Inputs:
+            - path (str): SQLite file of the ledger, created if it does not
+            exist. None keeps the ledger in memory only (for samples and
+            tests that must not mark anything as seen for good)
+            - capacity (int): Number of urls the Bloom filter is sized for
+            - error_rate (float): False positive rate of the Bloom filter
+        '''
+        self.path = path
+        self._db = sqlite3.connect(path or ":memory:",
+                                   check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(SCHEMA)
+        self._lock = threading.Lock()
+        self._claimed = set()
+        self._bloom = BloomFilter(capacity, error_rate)
+        self._loaded_rowid = 0
+        self.bloom_hits = 0
+        self.lookups = 0
+        with self._lock:
+            self._refresh()
+
+    def _refresh(self):
+        '''
+        Adds to the Bloom filter the urls saved since it was last updated,
+        including those saved by other processes sharing the file. Builds
+        a filter twice as big when it holds more urls than it was sized
+        for. Must be called with the lock held.
+        '''
+        rows = self._db.execute("SELECT rowid, url FROM seen WHERE rowid > ?"
+                                " ORDER BY rowid",
+                                (self._loaded_rowid,)).fetchall()
+        if self._bloom.count + len(rows) > self._bloom.capacity:
+            capacity = self._bloom.capacity
+            while capacity < self._bloom.count + len(rows):
+                capacity *= 2
+            self._bloom = BloomFilter(capacity, self._bloom.error_rate)
+            rows = self._db.execute("SELECT rowid, url FROM seen"
+                                    " ORDER BY rowid").fetchall()
+        for rowid, url in rows:
+            self._bloom.add(url)
+            self._loaded_rowid = rowid
+
+    def _is_saved(self, canonical):
+        '''
+        Checks the Bloom filter, and SQLite only if the filter says the
+        url may be there. Must be called with the lock held.
+        '''
+        if canonical not in self._bloom:
+            return False
+        self.bloom_hits += 1
+        return self._db.execute("SELECT 1 FROM seen WHERE url = ?",
+                                (canonical,)).fetchone() is not None
+
+    def __contains__(self, url):
+        canonical = canonical_url(url)
+        with self._lock:
+            self.lookups += 1
+            return canonical in self._claimed or self._is_saved(canonical)
+
+    def claim(self, urls):
+        '''
+        Keeps the urls that were never saved nor claimed before, and claims
+        them so that a second copy in the same run is dropped too.
+            Inputs:
+                - urls (iterable of str): Urls about to be downloaded
+            Returns:
+                - (new, duplicates) lists of the urls as given
+        '''
+        new, duplicates = [], []
+        with self._lock:
+            self._refresh()
+            for url in urls:
+                canonical = canonical_url(url)
+                self.lookups += 1
+                if canonical in self._claimed or self._is_saved(canonical):
+                    duplicates.append(url)
+                else:
+                    self._claimed.add(canonical)
+                    new.append(url)
+        return new, duplicates
+
+    def release(self, urls):
+        '''
+        Gives back the claim on urls that could not be saved, so that a
+        later page of this run that links to them can try them again.
+            Inputs:
+                - urls (str or list of str): Urls claimed with claim
+        '''
+        if isinstance(urls, str):
+            urls = [urls]
+        with self._lock:
+            for url in urls:
+                self._claimed.discard(canonical_url(url))
+
+    def add(self, urls, source=None):
+        '''
+        Records urls as saved, for this and every later run.
+            Inputs:
+                - urls (str or list of str): Urls whose rows were saved
+                - source (str): Crawler that saved them
+        '''
+        if isinstance(urls, str):
+            urls = [urls]
+        canonicals = [canonical_url(url) for url in urls]
+        now = time.time()
+        with self._lock:
+            with self._db:
+                self._db.executemany("INSERT OR IGNORE INTO seen VALUES"
+                                     " (?, ?, ?)",
+                                     [(url, source, now) for url in canonicals])
+            self._refresh()
+            #Saved urls are found in SQLite from now on
+            self._claimed.difference_update(canonicals)
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM seen").fetchone()[0]
+
+    def stats(self):
+        '''
+        Number of urls saved, urls checked, and checks that had to go to
+        SQLite because the Bloom filter matched
+        '''
+        return {"saved": len(self), "lookups": self.lookups,
+                "bloom_hits": self.bloom_hits,
+                "bloom_bits": self._bloom.num_bits,
+                "bloom_hashes": self._bloom.num_hashes}
+
+    def close(self):
+        '''
+        Closes the SQLite file
+        '''
+        with self._lock:
+            self._db.close()
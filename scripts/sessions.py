@@ -0,0 +1,251 @@
+# -*- coding: utf-8 -*-
+"""
+Purpose: Shared HTTP session for the crawlers. All requests to
+web.archive go through one requests.Session with a bounded pool of
+keep-alive connections per host, so consecutive fetches reuse the same
+TCP/TLS connection instead of opening a new one every time. Keeps
+statistics on how many connections were opened and how many requests
+reused one, to measure the handshakes saved. The latency, status code
+and size of every request are recorded in telemetry.
+
+Successful responses are also kept in the on-disk response cache, so a
+url that was already downloaded is read from disk on later runs, and
+requests that do go to the network pass through the adaptive per-host
+rate limiter.
+
+Authors:
+Diego Diaz
+Rukhshan Arif Mian
+Piyush Tank
+"""
+
+import threading
+import time
+from collections import defaultdict
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+import cache
+import ratelimit
+import telemetry
+
+try:
+    import brotli # pylint: disable=unused-import
+    ACCEPT_ENCODING = "gzip, deflate, br"
+except ImportError:
+    #urllib3 only decodes brotli responses when the package is installed
+    ACCEPT_ENCODING = "gzip, deflate"
+
+#Number of hosts with a pool of their own (web.archive plus the sites)
+POOL_HOSTS = 10
+#Maximum number of open connections to a single host
+POOL_MAXSIZE_PER_HOST = 16
+#Seconds to wait for a server before giving up on a request
+DEFAULT_TIMEOUT = 60
+#Times a request refused with 429 or 503 is sent again
+MAX_RETRIES = 3
+
+_LOCK = threading.Lock()
+_SESSION = None
+#False until the default cache is opened; None once caching is turned off
+_CACHE = False
+_STATS = {"requests": defaultdict(int), "new_connections": defaultdict(int)}
+LIMITER = ratelimit.RateLimiter()
+
+
+class CountingHTTPConnectionPool(HTTPConnectionPool):
+    '''
+    HTTP connection pool that counts every new connection it opens
+    '''
+    def _new_conn(self):
+        with _LOCK:
+            _STATS["new_connections"][self.host] += 1
+        return super()._new_conn()
+
+
+class CountingHTTPSConnectionPool(HTTPSConnectionPool):
+    '''
+    HTTPS connection pool that counts every new connection it opens
+    '''
+    def _new_conn(self):
+        with _LOCK:
+            _STATS["new_connections"][self.host] += 1
+        return super()._new_conn()
+
+
+class PooledAdapter(HTTPAdapter):
+    '''
+    Transport adapter with a bounded keep-alive pool per host. When every
+    connection to a host is busy, new requests wait for one to be free
+    instead of opening more connections.
+    '''
+    def __init__(self, pool_hosts=POOL_HOSTS,
+                 pool_maxsize=POOL_MAXSIZE_PER_HOST):
+        super().__init__(pool_connections=pool_hosts,
+                         pool_maxsize=pool_maxsize, pool_block=True)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": CountingHTTPConnectionPool,
+            "https": CountingHTTPSConnectionPool}
+
+
+def make_session(pool_hosts=POOL_HOSTS, pool_maxsize=POOL_MAXSIZE_PER_HOST):
+    '''
+    Creates a session with pooled, keep-alive connections and compressed
+    transfers.
+        Inputs:
+            - pool_hosts (int): Number of hosts that keep a pool
+            - pool_maxsize (int): Maximum connections per host
+        Returns:
+            - requests.Session
+    '''
+    session = requests.Session()
+    adapter = PooledAdapter(pool_hosts, pool_maxsize)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.headers.update({"Accept-Encoding": ACCEPT_ENCODING,
+                            "Connection": "keep-alive"})
+    return session
+
+
+def get_session():
+    '''
+    Returns the session shared by all crawlers, creating it the first
+    time it is needed.
+    '''
+    global _SESSION # pylint: disable=global-statement
+    with _LOCK:
+        if _SESSION is None:
+            _SESSION = make_session()
+        return _SESSION
+
+
+def get_cache():
+    '''
+    Returns the response cache shared by all crawlers, opening the
+    default one the first time it is needed, or None if caching was
+    turned off with set_cache(None).
+    '''
+    global _CACHE # pylint: disable=global-statement
+    with _LOCK:
+        if _CACHE is False:
+            _CACHE = cache.ResponseCache()
+        return _CACHE
+
+
+def set_cache(response_cache):
+    '''
+    Replaces the shared response cache.
+        Inputs:
+            - response_cache (cache.ResponseCache): Cache to use, or None
+            to always go to the network
+    '''
+    global _CACHE # pylint: disable=global-statement
+    with _LOCK:
+        _CACHE = response_cache
+
+
+def set_limiter(limiter):
+    '''
+    Replaces the shared rate limiter.
+        Inputs:
+            - limiter (ratelimit.RateLimiter): Limiter to use, or None to
+            send requests without waiting (only for local stand-ins)
+    '''
+    global LIMITER # pylint: disable=global-statement
+    with _LOCK:
+        LIMITER = limiter if limiter is not None else ratelimit.UNLIMITED
+
+
+def get(url, **kwargs):
+    '''
+    Drop-in replacement for requests.get that uses the shared session.
+    Responses already in the cache are returned without a request, and
+    new successful responses are stored in it. Requests wait for the rate
+    limiter of their host, and are sent again (after the wait the server
+    asked for) when they are refused with 429 or 503.
+        Inputs:
+            - url (str): Absolute url to fetch
+            - kwargs: Passed on to requests.Session.get
+        Returns:
+            - requests.Response or cache.CachedResponse
+    '''
+    response_cache = get_cache()
+    if response_cache is not None:
+        cached = response_cache.get(url)
+        if cached is not None:
+            return cached
+
+    kwargs.setdefault("timeout", DEFAULT_TIMEOUT)
+    host = requests.utils.urlparse(url).hostname
+    limiter = LIMITER
+    for attempt in range(MAX_RETRIES + 1):
+        limiter.acquire(host)
+        with _LOCK:
+            _STATS["requests"][host] += 1
+        start = time.perf_counter()
+        try:
+            response = get_session().get(url, **kwargs)
+        except requests.exceptions.ConnectionError:
+            seconds = time.perf_counter() - start
+            telemetry.observe_request(host, None, seconds)
+            limiter.record(host, None, seconds=seconds)
+            raise
+        except requests.exceptions.Timeout:
+            telemetry.observe_request(host, None, time.perf_counter() - start)
+            raise
+        seconds = time.perf_counter() - start
+        telemetry.observe_request(host, response.status_code, seconds,
+                                  len(response.content))
+        limiter.record(host, response.status_code,
+                       response.headers.get("Retry-After"), seconds)
+        if response.status_code not in ratelimit.THROTTLE_STATUS or \
+            attempt == MAX_RETRIES:
+            break
+
+    if response_cache is not None:
+        response_cache.put(url, response)
+    return response
+
+
+def connection_stats():
+    '''
+    Reports how many requests were made, how many connections were
+    opened and how many requests reused an open connection, in total
+    and by host.
+        Returns:
+            - dict with the keys requests, new_connections, reused,
+            reuse_ratio and by_host
+    '''
+    with _LOCK:
+        by_host = {}
+        for host, n_requests in _STATS["requests"].items():
+            n_new = _STATS["new_connections"].get(host, 0)
+            by_host[host] = {"requests": n_requests, "new_connections": n_new,
+                             "reused": max(n_requests - n_new, 0)}
+    n_requests = sum(host["requests"] for host in by_host.values())
+    n_new = sum(host["new_connections"] for host in by_host.values())
+    reused = sum(host["reused"] for host in by_host.values())
+    return {"requests": n_requests, "new_connections": n_new,
+            "reused": reused,
+            "reuse_ratio": reused / n_requests if n_requests else 0.0,
+            "by_host": by_host}
+
+
+def rate_stats():
+    '''
+    Current request rate, seconds spent pacing and throttled and number of
+    throttling responses for every host, see ratelimit.RateLimiter.stats
+    '''
+    return LIMITER.stats()
+
+
+def reset_stats():
+    '''
+    Sets every counter back to zero
+    '''
+    with _LOCK:
+        _STATS["requests"].clear()
+        _STATS["new_connections"].clear()
@@ -7,15 +7,18 @@ Rukhshan Arif Mian
 Piyush Tank
 """
 
-import re
-from datetime import datetime
-import pandas as pd
+import cleaning
+import corpus
+import instrument
+import writer
 
 URL = "url"
 ARTICLE = "article"
 TITLE = "title"
 DATE = "date"
+DATE_FORMAT = '%b %d %Y'
 
+@instrument.timed()
 def clean(raw_data_path, output_filename):
 
     '''
@@ -24,36 +27,18 @@ def clean(raw_data_path, output_filename):
     make it consistent.
 
     Inputs:
-        raw_data_path (string): path for raw data
+        raw_data_path (string): folder with the raw data part files
         output_filename (string): filename for output
 
     Outputs:
         df (dataframe): Cleaned dataframe
     '''
 
-    raw_data_path += ".pkl"
     output_filename += ".pkl"
 
-    stuff_df = pd.read_pickle(raw_data_path)
-
-    stuff_df['newspaper'] = "Stuff"
-    stuff_df = stuff_df.rename(columns={"date_time": DATE, "text": ARTICLE})
-    stuff_df = stuff_df[['newspaper', URL, DATE, TITLE, ARTICLE]]
-
-    stuff_df = stuff_df[stuff_df[DATE].notnull()]
-    stuff_df = stuff_df[stuff_df[ARTICLE].notnull()]
-    stuff_df = stuff_df[stuff_df[TITLE].notnull()]
+    stuff_df = select_articles(writer.read_parts(raw_data_path))
     stuff_df = stuff_df.sort_values(by=ARTICLE).drop_duplicates([URL])
-
-    #Cleaning
-    stuff_df[ARTICLE] = stuff_df.apply(lambda x: re.sub("[^a-z ']+", "",  \
-        x[ARTICLE].lower()), axis=1)
-    stuff_df[TITLE] = stuff_df.apply(lambda x: re.sub("[^a-z ']+", "",  \
-        x[TITLE].lower()), axis=1)
-    stuff_df[DATE] = stuff_df.date.apply(lambda x: x[7:len(x)])
-    stuff_df[DATE] = stuff_df.apply(lambda x:  \
-        datetime.strptime(x[DATE].strip(), '%b %d %Y'), axis=1)
-
+    stuff_df = clean_columns(stuff_df)
     stuff_df = stuff_df.sort_values(by=ARTICLE)
     stuff_df.to_pickle(output_filename)
 
@@ -62,6 +47,55 @@ def clean(raw_data_path, output_filename):
     return stuff_df
 
 
+def select_articles(stuff_df):
+    '''
+    Renames the raw columns to the project ones and removes the rows
+    without date, article or title
+    '''
+    stuff_df = stuff_df.rename(columns={"date_time": DATE, "text": ARTICLE})
+    stuff_df['newspaper'] = "Stuff"
+    stuff_df = stuff_df[['newspaper', URL, DATE, TITLE, ARTICLE]]
+
+    return stuff_df[stuff_df[DATE].notnull() & stuff_df[ARTICLE].notnull()
+                    & stuff_df[TITLE].notnull()]
+
+
+@instrument.timed()
+def clean_columns(stuff_df):
+    '''
+    Lower cases the article and title and keeps only their letters, and
+    turns the date into a datetime object, on whole columns at once
+    '''
+    stuff_df = stuff_df.copy()
+    stuff_df[ARTICLE] = cleaning.clean_text(stuff_df[ARTICLE])
+    stuff_df[TITLE] = cleaning.clean_text(stuff_df[TITLE])
+    stuff_df[DATE] = cleaning.parse_dates(stuff_df[DATE].str[7:], DATE_FORMAT)
+    return stuff_df
+
+
+def clean_chunk(stuff_df):
+    '''
+    Every per-row cleaning step for a chunk of raw Stuff articles
+    '''
+    return clean_columns(select_articles(stuff_df))
+
+
+def clean_to_store(raw_data_path, root=corpus.DEFAULT_ROOT,
+                   chunk_size=cleaning.CHUNK_SIZE):
+    '''
+    Cleans every raw Stuff article, a chunk at a time, into the corpus
+    store (see cleaning.clean_to_store). Repeated urls are dropped across
+    chunks, keeping the first one read.
+
+    Inputs:
+        raw_data_path (string): folder with the raw data part files
+        root (string): folder of the corpus store
+        chunk_size (int): rows cleaned at a time
+    '''
+    return cleaning.clean_to_store(raw_data_path, clean_chunk, root,
+                                   chunk_size, unique_column=URL)
+
+
 def main():
     '''
     Main function that cleans sample data that has been collected using
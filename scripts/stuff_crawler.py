@@ -12,22 +12,30 @@ Piyush Tank
 
 import queue
 import re
-import csv
 from datetime import datetime
 from datetime import timedelta
-import time
-import pandas as pd
-from bs4 import BeautifulSoup
-import requests
+import cdx
+import frontier
+import instrument
+import parsers
+import pipeline
+import seen
+import sessions
+import telemetry
+import writer
 
 #This link was causing our scraper to stop.
 EXCLUDE_ERROR = "worst-case-bushfire-scenario-predicted"
+COLUMNS = ['url', 'title', 'date_time', 'text']
 
-def run(url, start_day, end_day, increment, csv_filename, depth, test=False):
+@instrument.timed()
+def run(url, start_day, end_day, increment, directory, depth, test=False,
+        frontier_path=None, discovery='homepage', seen_path=seen.DEFAULT_PATH):
     '''
     Function to run crawler. Collects urls from start_day and end_day and
     stores them in a list. After this, relevant details (title, date, time and
-    article text) are extracted from each url.
+    article text) are extracted from each url. The progress is kept in a crawl
+    frontier, so running it again with the same directory resumes it.
 
     Inputs:
         url (string): url
@@ -36,18 +44,38 @@ def run(url, start_day, end_day, increment, csv_filename, depth, test=False):
         end_day (int): number of days to go back (this value has to be greater
         than or equal to 1)
         increment (int): number of days to increment after one day.
-        csv_filename (string): output file's name
+        directory (string): output folder for the Parquet part files
         depth (int): depth of web crawling. Number of pages to crawl.
         test (boolean): True if testing, False if not.
+        frontier_path (string): SQLite file with the progress of the crawl,
+        directory + '.frontier' by default
+        discovery (string): 'homepage' to crawl the homepage snapshot of
+        every day, 'cdx' to list every article captured that day from the
+        Wayback CDX server
+        seen_path (string): SQLite file of the url ledger shared by all
+        crawlers. Articles saved by any earlier run are not downloaded
+        again. Test runs keep the ledger in memory.
 
     Output:
         List of all URLs that can be news articles.
     '''
 
-    list_of_articles = go_back(url, start_day, end_day, increment, depth)
-    make_csv_from_links(list_of_articles, csv_filename, test)
-
-def go_back(url, start_day, end_day, increment, depth):
+    telemetry.start()
+    crawl_frontier = frontier.CrawlFrontier(frontier_path or
+                                            directory.rstrip('/') + '.frontier')
+    #Articles that failed in an earlier run are tried again
+    crawl_frontier.retry_failed()
+    go_back(url, start_day, end_day, increment, depth, crawl_frontier,
+            discovery)
+    seen_urls = seen.UrlLedger(None if test else seen_path)
+    write_articles_from_links(crawl_frontier.pending(), directory, test,
+                              crawl_frontier, seen_urls)
+    crawl_frontier.close()
+    seen_urls.close()
+
+@instrument.timed()
+def go_back(url, start_day, end_day, increment, depth, crawl_frontier=None,
+            discovery='homepage'):
 
     '''
     Inputs:
@@ -58,68 +86,114 @@ def go_back(url, start_day, end_day, increment, depth):
         than or equal to 1)
         increment (int): number of days to increment after one day.
         depth (int): depth of web crawling. Number of pages to crawl.
+        crawl_frontier (CrawlFrontier): if given, the links of every day are
+        recorded in it and days that were already crawled are skipped. Days
+        are counted from the date of the first run, so that a resumed crawl
+        goes through the same dates.
+        discovery (string): 'homepage' to crawl the homepage snapshot of
+        every day, 'cdx' to list every article captured that day from the
+        Wayback CDX server
 
     Output:
         List of all URLs that can be news articles.
     '''
 
     return_set = set()
+    offset = 0
+    if crawl_frontier:
+        first_run = datetime.strptime(crawl_frontier.setdefault(
+            'start_date', datetime.today().strftime('%Y%m%d')), '%Y%m%d')
+        offset = (datetime.today() - first_run).days
 
     while start_day <= end_day:
         #Incrementing the number of days
         #we want to skip
         start_day += increment
-        links = crawl(url, depth, start_day)
+        day = (datetime.today() - timedelta(days=start_day + offset))\
+            .strftime('%Y%m%d')
+        if crawl_frontier and crawl_frontier.day_state(day):
+            continue
+        if discovery == 'cdx':
+            links = cdx.discover('stuff', day, day)
+        else:
+            links = crawl(url, depth, start_day + offset)
         return_set.update(links)
+        if crawl_frontier:
+            crawl_frontier.add_day_urls(day, links)
 
     return return_set
 
 
-def make_csv_from_links(all_links, csv_filename, test=False):
+@instrument.timed()
+def write_articles_from_links(all_links, directory, test=False,
+                              crawl_frontier=None, seen_urls=None,
+                              get=sessions.get):
     '''
-    Takes a list of articles and creates a csv.
+    Takes a list of articles and writes their details to Parquet part files.
 
     Input:
         all_links : a list of all links
-        csv_filename: filename we want to write to
+        directory: folder we want to write the part files to
         test (bool): boolean to indicate if we are testing the code.
-        if testing, csv only writes the first 10 articles.
+        if testing, only the first 10 articles are written.
+        crawl_frontier (CrawlFrontier): if given, every article is marked
+        as visited once the part file holding its row is saved, and every
+        link that could not be downloaded or is not an article is marked
+        as failed, so an interrupted run can be resumed.
+        seen_urls (seen.UrlLedger): ledger of the articles already saved.
+        Links in it are not downloaded, and the articles are added to it
+        once their part file is saved. An in-memory ledger is used if None.
+        get (function): function that fetches a url, the shared session by
+        default
 
     Ouput:
-        None. CSV written to current directory.
+        None. Part files written to directory.
     '''
 
-    with open(csv_filename, 'w') as csv_file:
-        writer = csv.writer(csv_file, delimiter=",", quoting=csv.QUOTE_MINIMAL)
-        counter = 0
-        header = ['url', 'title', 'date_time', 'text']
-        writer.writerow(header)
-
-        for each_url in all_links:
-            each_url = each_url[43:len(each_url)]
-
-            if test:
-                if counter == 10:
-                    break
-
-            #Error while scraping. Need to exclude it.
-            if EXCLUDE_ERROR not in each_url:
-                counter += 1
-                if counter == 1000:
-                    print("Pausing for 30 seconds")
-                    time.sleep(30)
-                time.sleep(0.2)
-
-                print("Extracting details for Article #", counter)
-                details = get_data_from_url(each_url)
-                title = details[0]
-                date_and_time = details[1]
-                text = details[2]
-                writer.writerow([each_url, title, date_and_time, text])
-            else:
+    if seen_urls is None:
+        seen_urls = seen.UrlLedger(None)
+    all_links, duplicates = seen_urls.claim(all_links)
+    if duplicates and crawl_frontier:
+        crawl_frontier.mark_visited(duplicates)
+
+    #Error while scraping. Need to exclude it.
+    links = {}
+    for link in all_links:
+        if EXCLUDE_ERROR not in link[43:]:
+            links[link[43:]] = link
+        else:
+            seen_urls.release(link)
+            if crawl_frontier:
+                crawl_frontier.mark_failed(link)
+    urls = list(links)
+    if test:
+        urls = urls[:10]
+
+    def saved(keys):
+        if crawl_frontier:
+            crawl_frontier.mark_visited(keys)
+        seen_urls.add(keys, 'stuff')
+
+    with writer.ArticleWriter(directory, COLUMNS, on_commit=saved,
+                              append=crawl_frontier is not None) as out:
+        for each_url, _, details in pipeline.fetch_and_extract(urls, 'stuff',
+                                                               get=get):
+            #Pages that are not articles give (None, None, None)
+            is_article = details is not None and details[0] is not None
+            telemetry.article('stuff', saved=is_article)
+            telemetry.log("article_saved" if is_article else "article_failed",
+                          site='stuff', url=each_url)
+            if not is_article:
+                #Only saved articles go to the ledger, so a later run
+                #tries this one again
+                seen_urls.release(links[each_url])
+                if crawl_frontier:
+                    crawl_frontier.mark_failed(links[each_url])
                 continue
-    print("All valid URLs written to CSV")
-    csv_file.close()
+            title, date_and_time, text = details
+            out.write([each_url, title, date_and_time, text],
+                      key=links[each_url])
+    print("All valid URLs written to", directory)
 
 def get_articles(soup, starting_url, articles, visited_urls, sites_to_visit):
 
@@ -171,6 +245,7 @@ def get_articles(soup, starting_url, articles, visited_urls, sites_to_visit):
     return articles, sites_to_visit
 
 
+@instrument.timed()
 def crawl(url, depth, days_back_in_time):
     '''
     Crawler function to crawl webarchive to COLLECT urls.
@@ -197,25 +272,26 @@ def crawl(url, depth, days_back_in_time):
     counter = 0
 
     url = get_past_url(url, days_back_in_time)
-    req = requests.get(url)
-    soup = BeautifulSoup(req.content, "html5lib")
+    req = sessions.get(url)
+    soup = parsers.link_soup(req.content)
     starting_url = url
 
     #Adding web.archive.org as a starting URL
     get_articles(soup, 'https://web.archive.org', article_urls, visited_urls, q)
 
     while not q.empty() and len(visited_urls) < depth:
+        telemetry.set_queue('stuff.pages', q.qsize())
         url = q.get()
 
         if visited_urls.get(url):
             continue
 
-        req = requests.get(url)
+        req = sessions.get(url)
 
         if req.status_code != 200:
             continue
 
-        soup = BeautifulSoup(req.content, "html5lib")
+        soup = parsers.link_soup(req.content)
         visited_urls[url] = 1
         counter += 1
         ret = get_articles(soup, starting_url, article_urls, visited_urls, q)
@@ -237,10 +313,26 @@ def get_data_from_url(url):
     '''
 
     try:
-        article = ""
+        r = sessions.get(url)
+        return parsers.extract('stuff', r.content)
+    except:
+        return None, None, None
 
-        r = requests.get(url)
-        soup = BeautifulSoup(r.content, "html5lib")
+def get_data_from_soup(soup):
+    '''
+    Extract title, text, date and time from the soup of an article.
+    This is the BeautifulSoup version of parsers.stuff_article, kept
+    as its reference.
+    Input:
+        soup (BeautifulSoup): soup of the page
+    Output:
+        title (string): title of the article
+        date_and_time (string): date and time given in the article
+        article (string): text of the article
+    '''
+
+    try:
+        article = ""
 
         #For the purpose of stuff.co.nz, the following div and class combination
         #provide the details of a given article.
@@ -323,19 +415,16 @@ def main():
     '''
     Main function that tests the crawler.
     Goes 3 days back in time and collects newspaper articles from Stuff.co.nz's
-    first page and saves them to a .csv (for viewing purposes) and a .pkl.
+    first page and saves them as Parquet part files in data/raw.
     For testing purposes, only details for the first 10 articles are saved.
     '''
 
     print("Starting sample scraping from stuff.co.nz and saving to data/raw")
+    telemetry.start()
 
     list_of_articles = go_back("https://stuff.co.nz", 1, 3, 1, 1)
-    make_csv_from_links(list_of_articles,  \
-        "../data/raw/test_stuff_raw.csv", test=True)
-    return_csv = pd.read_csv("../data/raw/test_stuff_raw.csv")
-
-    print("Creating .pkl file for further processing")
-    return_csv.to_pickle("../data/raw/test_stuff_raw.pkl")
+    write_articles_from_links(list_of_articles,  \
+        "../data/raw/test_stuff_raw", test=True)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,308 @@
+# -*- coding: utf-8 -*-
+"""
+Purpose: Deterministic synthetic corpora for benchmarks, so the pipeline
+can be measured without downloading the real data. Generates:
+    - clean articles with the columns and types of data/clean/*.pkl
+    - raw Herald articles as written by herald_crawler.py
+    - raw Stuff articles as written by stuff_crawler.py
+Article lengths follow a log-normal distribution around the length of
+the real articles, the keywords of the indices in main.py appear at
+fixed rates, the Herald publishes the most articles and every newspaper
+publishes more articles in later years (TVNZ only from 2016).
+
+Corpora are made chunk by chunk: chunk k of a corpus depends only on the
+seed and k, so a corpus of any size is the same whatever the chunks are
+used for, and a larger corpus starts with the rows of a smaller one.
+
+Authors:
+Diego Diaz
+Rukhshan Arif Mian
+Piyush Tank
+"""
+
+import string
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import cleaning
+
+NEWSPAPER = "newspaper"
+URL = "url"
+DATE = "date"
+TITLE = "title"
+ARTICLE = "article"
+
+CHUNK_SIZE = 100000
+NEWSPAPERS = ['NZ Herald', 'Stuff', 'tvnz_one_news']
+#Share of the articles of each newspaper, and first month it publishes
+NEWSPAPER_SHARES = [0.5, 0.35, 0.15]
+NEWSPAPER_START = ['2009-01', '2009-01', '2016-01']
+FIRST_MONTH = '2009-01'
+LAST_MONTH = '2020-03'
+#Articles per month grow linearly from 1 to this many times the first
+MONTH_GROWTH = 3.0
+#Characters of an article: log-normal with this median and log spread
+ARTICLE_MEDIAN = 2700
+ARTICLE_SPREAD = 0.6
+ARTICLE_RANGE = (200, 20000)
+TITLE_WORDS = (4, 12)
+#Share of the articles holding a word with each keyword of main.py
+KEYWORD_RATES = {'economy': 0.2, 'policy': 0.15, 'uncertainty': 0.05,
+                 'earthquake': 0.02, 'damage': 0.05, 'domestic': 0.03,
+                 'violence': 0.03}
+#Distinct made up words, and how skewed their frequencies are (Zipf)
+VOCABULARY_SIZE = 20000
+ZIPF_EXPONENT = 1.1
+#Words of the text every article is cut from
+POOL_WORDS = 1000000
+#Raw texts: share of capitalized words and of words followed by a mark
+CAPITALIZED = 0.1
+PUNCTUATED = 0.12
+MARKS = [',', '.', '’s', '"', ')', ':', ' 2019', ' -', '!']
+HERALD_DATE_FORMAT = '%d %b, %Y %I:%M%p'
+STUFF_DATE_FORMAT = 'Updated %b %d %Y'
+WAYBACK = 'https://web.archive.org/web/'
+
+
+def _vocabulary(rng):
+    '''
+    Made up lower case words (none of them containing a keyword of the
+    indices) followed by the English stopwords, with their frequencies
+    '''
+    stems = ['econ', 'policy', 'uncert', 'earthquake', 'damage', 'domestic',
+             'violence']
+    letters = np.array(list(string.ascii_lowercase))
+    words = set()
+    while len(words) < VOCABULARY_SIZE:
+        word = ''.join(rng.choice(letters, rng.integers(2, 11)))
+        if not any(stem in word for stem in stems):
+            words.add(word)
+    words = sorted(cleaning.STOPWORDS) + sorted(words)
+    weights = 1 / np.arange(1, len(words) + 1) ** ZIPF_EXPONENT
+    return np.array(words, dtype=object), weights / weights.sum()
+
+
+class _Pools():
+    '''
+    Clean and raw text every article is cut from, made once per seed
+    '''
+    cache = {}
+
+    @classmethod
+    def get(cls, seed):
+        '''
+        (clean pool, raw pool, vocabulary, frequencies) of a seed
+        '''
+        if seed not in cls.cache:
+            rng = np.random.default_rng([seed, 0])
+            vocabulary, frequencies = _vocabulary(rng)
+            words = rng.choice(vocabulary, POOL_WORDS, p=frequencies)
+            clean = ' '.join(words)
+            capital = rng.random(POOL_WORDS) < CAPITALIZED
+            words[capital] = [word.capitalize() for word in words[capital]]
+            marked = np.flatnonzero(rng.random(POOL_WORDS) < PUNCTUATED)
+            marks = rng.choice(MARKS, len(marked))
+            words[marked] = [word + mark for word, mark in
+                             zip(words[marked], marks)]
+            cls.cache[seed] = (clean, ' '.join(words), vocabulary,
+                               frequencies)
+        return cls.cache[seed]
+
+
+def _texts(rng, pool, lengths):
+    '''
+    Pieces of pool of about the given lengths, starting and ending at
+    word boundaries
+    '''
+    starts = rng.integers(0, len(pool) - ARTICLE_RANGE[1] - 1, len(lengths))
+    texts = []
+    for start, length in zip(starts.tolist(), lengths.tolist()):
+        start = pool.find(' ', start) + 1
+        end = pool.find(' ', start + length)
+        texts.append(pool[start:end])
+    return texts
+
+
+def _add_keywords(rng, texts):
+    '''
+    Inserts each keyword, at its rate, at a random word boundary
+    '''
+    for word, rate in KEYWORD_RATES.items():
+        for i in np.flatnonzero(rng.random(len(texts)) < rate).tolist():
+            text = texts[i]
+            cut = text.find(' ', int(rng.integers(0, len(text) + 1)))
+            texts[i] = text + ' ' + word if cut < 0 else \
+                text[:cut] + ' ' + word + text[cut:]
+    return texts
+
+
+def _metadata(rng, num_rows):
+    '''
+    Newspaper and publication time of num_rows articles
+    '''
+    months = pd.period_range(FIRST_MONTH, LAST_MONTH, freq='M')
+    growth = np.linspace(1, MONTH_GROWTH, len(months))
+    newspaper = np.empty(num_rows, dtype=np.int64)
+    month = np.empty(num_rows, dtype=np.int64)
+    papers = rng.choice(len(NEWSPAPERS), num_rows, p=NEWSPAPER_SHARES)
+    for paper, start in enumerate(NEWSPAPER_START):
+        rows = np.flatnonzero(papers == paper)
+        weights = np.where(months >= pd.Period(start, freq='M'), growth, 0)
+        newspaper[rows] = paper
+        month[rows] = rng.choice(len(months), len(rows),
+                                 p=weights / weights.sum())
+    first = months[month].to_timestamp()
+    seconds = rng.random(num_rows) * first.days_in_month * 86400
+    dates = first + pd.to_timedelta(seconds.astype(np.int64), unit='s')
+    return np.array(NEWSPAPERS, dtype=object)[newspaper], \
+        dates.as_unit('ns')
+
+
+def _strftime(dates, date_format):
+    '''
+    dates.strftime(date_format), formatted by Arrow
+    '''
+    return pc.strftime(pa.array(dates.as_unit('s')), format=date_format)\
+        .to_numpy(zero_copy_only=False)
+
+
+def _rng(seed, chunk):
+    '''
+    Random generator of a chunk
+    '''
+    return np.random.default_rng([seed, chunk + 1])
+
+
+def _titles(rng, vocabulary, frequencies, num_rows):
+    '''
+    Titles made of TITLE_WORDS vocabulary words
+    '''
+    sizes = rng.integers(TITLE_WORDS[0], TITLE_WORDS[1] + 1, num_rows)
+    words = rng.choice(vocabulary, sizes.sum(), p=frequencies).tolist()
+    ends = np.cumsum(sizes).tolist()
+    return [' '.join(words[end - size:end])
+            for size, end in zip(sizes.tolist(), ends)]
+
+
+def _lengths(rng, num_rows):
+    '''
+    Characters of num_rows articles
+    '''
+    return np.clip(rng.lognormal(np.log(ARTICLE_MEDIAN), ARTICLE_SPREAD,
+                                 num_rows), *ARTICLE_RANGE).astype(np.int64)
+
+
+def clean_chunk(chunk, chunk_size=CHUNK_SIZE, seed=0):
+    '''
+    Chunk number chunk of a synthetic clean corpus, with the columns and
+    types of the clean pickles
+        Inputs:
+            - chunk (int): Number of the chunk, from 0
+            - chunk_size (int): Rows of the chunk
+            - seed (int): Seed of the corpus
+        Returns:
+            - Pandas dataframe
+    '''
+    clean_pool, _, vocabulary, frequencies = _Pools.get(seed)
+    rng = _rng(seed, chunk)
+    newspaper, dates = _metadata(rng, chunk_size)
+    first = chunk * chunk_size
+    return pd.DataFrame({
+        NEWSPAPER: newspaper,
+        URL: ['https://www.example.co.nz/news/' + str(row)
+              for row in range(first, first + chunk_size)],
+        DATE: dates,
+        TITLE: _titles(rng, vocabulary, frequencies, chunk_size),
+        ARTICLE: _add_keywords(rng, _texts(rng, clean_pool,
+                                           _lengths(rng, chunk_size)))})
+
+
+def raw_herald_chunk(chunk, chunk_size=CHUNK_SIZE, seed=0):
+    '''
+    Chunk of synthetic raw Herald articles, as herald_crawler.py saves
+    them (every column is text). A few articles have no date or text.
+        Inputs: see clean_chunk
+        Returns:
+            - Pandas dataframe
+    '''
+    _, raw_pool, vocabulary, frequencies = _Pools.get(seed)
+    rng = _rng(seed, chunk)
+    _, dates = _metadata(rng, chunk_size)
+    first = chunk * chunk_size
+    articles = _add_keywords(rng, _texts(rng, raw_pool,
+                                         _lengths(rng, chunk_size)))
+    df = pd.DataFrame({
+        NEWSPAPER: 'NZ Herald',
+        URL: [WAYBACK + stamp + '/https://www.nzherald.co.nz/nz/news/'
+              'article.cfm?objectid=' + str(row) for stamp, row in
+              zip(_strftime(dates, '%Y%m%d%H%M%S'),
+                  range(first, first + chunk_size))],
+        DATE: _strftime(dates, HERALD_DATE_FORMAT),
+        TITLE: [title.title() for title in
+                _titles(rng, vocabulary, frequencies, chunk_size)],
+        ARTICLE: articles})
+    missing = rng.random((2, chunk_size)) < 0.01
+    df.loc[missing[0], DATE] = 'None'
+    df.loc[missing[1], ARTICLE] = 'None'
+    return df
+
+
+def raw_stuff_chunk(chunk, chunk_size=CHUNK_SIZE, seed=0):
+    '''
+    Chunk of synthetic raw Stuff articles, as stuff_crawler.py saves them
+    (url, title, date_time and text). A few articles miss a field, and a
+    few urls repeat an earlier one of the chunk.
+        Inputs: see clean_chunk
+        Returns:
+            - Pandas dataframe
+    '''
+    _, raw_pool, vocabulary, frequencies = _Pools.get(seed)
+    rng = _rng(seed, chunk)
+    _, dates = _metadata(rng, chunk_size)
+    first = chunk * chunk_size
+    rows = np.arange(first, first + chunk_size)
+    repeated = rng.random(chunk_size) < 0.02
+    rows[repeated] = rng.integers(first, first + chunk_size, repeated.sum())
+    df = pd.DataFrame({
+        URL: ['https://www.stuff.co.nz/national/' + str(row) for row in
+              rows.tolist()],
+        TITLE: [title.title() for title in
+                _titles(rng, vocabulary, frequencies, chunk_size)],
+        'date_time': _strftime(dates, STUFF_DATE_FORMAT),
+        'text': _add_keywords(rng, _texts(rng, raw_pool,
+                                          _lengths(rng, chunk_size)))})
+    missing = rng.random((3, chunk_size)) < 0.005
+    df.loc[missing[0], TITLE] = None
+    df.loc[missing[1], 'date_time'] = None
+    df.loc[missing[2], 'text'] = None
+    return df
+
+
+def chunks(make_chunk, num_rows, chunk_size=CHUNK_SIZE, seed=0):
+    '''
+    The first num_rows rows of a synthetic corpus, a chunk at a time
+        Inputs:
+            - make_chunk (function): clean_chunk, raw_herald_chunk or
+            raw_stuff_chunk
+            - num_rows (int): Rows of the corpus
+            - chunk_size (int): Rows of every chunk (the last one may
+            have fewer)
+            - seed (int): Seed of the corpus
+        Yields:
+            - Pandas dataframes
+    '''
+    for chunk in range(-(-num_rows // chunk_size)):
+        df = make_chunk(chunk, chunk_size, seed)
+        yield df.iloc[:num_rows - chunk * chunk_size].copy() \
+            if (chunk + 1) * chunk_size > num_rows else df
+
+
+def make_corpus(make_chunk, num_rows, chunk_size=CHUNK_SIZE, seed=0):
+    '''
+    The first num_rows rows of a synthetic corpus in a single dataframe
+    (see chunks)
+    '''
+    frames = list(chunks(make_chunk, num_rows, chunk_size, seed))
+    return pd.concat(frames, ignore_index=True) if len(frames) > 1 \
+        else frames[0]
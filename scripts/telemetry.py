@@ -0,0 +1,330 @@
+# -*- coding: utf-8 -*-
+"""
+Purpose: Metrics shared by the crawlers. Every request sent through
+sessions.get is recorded with its host, latency (in a histogram), status
+code and size; the crawlers add the articles they save or fail to get
+and the depth of their queues. The metrics are exported in the
+Prometheus text format, to a file that is rewritten every
+EXPORT_INTERVAL seconds (for the textfile collector of node_exporter,
+or to be read by hand) and, if a port is given, on a local HTTP
+endpoint at /metrics. The limiter rate and connection reuse of sessions
+are exported with them.
+
+Instead of printing every article, the crawlers log one JSON line for
+the first event of every kind and then one every LOG_EVERY events.
+
+Environment variables:
+    - METRICS_TEXTFILE: file the metrics are written to
+    (DEFAULT_TEXTFILE by default, empty to write none)
+    - METRICS_PORT: port of the HTTP endpoint (none by default)
+    - LOG_EVERY: events between two logged ones
+
+Authors:
+Diego Diaz
+Rukhshan Arif Mian
+Piyush Tank
+"""
+
+import atexit
+import bisect
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import instrument
+
+#Upper bounds (seconds) of the request latency histogram buckets
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+DEFAULT_TEXTFILE = "../data/metrics/crawler.prom"
+EXPORT_INTERVAL = 15
+LOG_EVERY = int(os.environ.get("LOG_EVERY", 100))
+
+_LOCK = threading.Lock()
+_LATENCY = {}
+_STATUS = defaultdict(int)
+_BYTES = defaultdict(int)
+_ARTICLES = defaultdict(int)
+#Time of the first article of every site
+_FIRST_ARTICLE = {}
+_QUEUES = {}
+_EVENTS = defaultdict(int)
+_EXPORT = {"started": False, "server": None}
+
+
+class Histogram():
+    '''
+    Counts of observations below every bucket bound, with their sum
+    '''
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        '''
+        Adds one observation
+        '''
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    def cumulative(self):
+        '''
+        (bound, observations up to it) for every bucket, the last one
+        with bound '+Inf'
+        '''
+        total = 0
+        bounds = [str(bound) for bound in self.buckets] + ["+Inf"]
+        for bound, observations in zip(bounds, self.counts):
+            total += observations
+            yield bound, total
+
+
+def observe_request(host, status, seconds, size=0):
+    '''
+    Records a request sent to host. status is None for requests that
+    failed without a response
+    '''
+    with _LOCK:
+        if host not in _LATENCY:
+            _LATENCY[host] = Histogram()
+        _LATENCY[host].observe(seconds)
+        _STATUS[host, "error" if status is None else str(status)] += 1
+        _BYTES[host] += size
+
+
+def article(site, saved=True):
+    '''
+    Counts an article of site that was saved (or, if not saved, that
+    could not be downloaded or read)
+    '''
+    outcome = "saved" if saved else "failed"
+    with _LOCK:
+        _FIRST_ARTICLE.setdefault(site, time.time())
+        _ARTICLES[site, outcome] += 1
+    instrument.count(site + "." + ("articles" if saved else "failed"))
+
+
+def set_queue(name, depth):
+    '''
+    Depth of a queue right now
+    '''
+    with _LOCK:
+        _QUEUES[name] = depth
+
+
+def log(event, **fields):
+    '''
+    Prints a JSON line with the event and its fields the first time the
+    event happens and then once every LOG_EVERY times, with the number
+    of times it happened so far
+        Returns:
+            - True if the line was printed
+    '''
+    with _LOCK:
+        _EVENTS[event] += 1
+        seen = _EVENTS[event]
+    if LOG_EVERY > 1 and seen % LOG_EVERY != 1:
+        return False
+    line = {"time": time.strftime("%Y-%m-%dT%H:%M:%S"), "event": event,
+            "count": seen}
+    line.update(fields)
+    print(json.dumps(line, default=str))
+    return True
+
+
+def articles_per_second():
+    '''
+    Articles saved per second by every site since its first article
+    '''
+    now = time.time()
+    with _LOCK:
+        return {site: _ARTICLES[site, "saved"] / max(now - first, 1e-9)
+                for site, first in _FIRST_ARTICLE.items()}
+
+
+def _label(value):
+    '''
+    Label value escaped for the Prometheus text format
+    '''
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n")\
+        .replace('"', '\\"')
+
+
+def _sample(name, labels, value):
+    '''
+    One line of the Prometheus text format
+    '''
+    if labels:
+        name += "{" + ",".join('{}="{}"'.format(key, _label(label))
+                               for key, label in labels.items()) + "}"
+    return name + " " + repr(float(value))
+
+
+def render():
+    '''
+    Every metric in the Prometheus text exposition format
+    '''
+    import sessions # pylint: disable=import-outside-toplevel
+    speeds = articles_per_second()
+    connections = sessions.connection_stats()["by_host"]
+    limits = sessions.rate_stats()
+    lines = []
+
+    def metric(name, kind, description, samples):
+        lines.append("# HELP " + name + " " + description)
+        lines.append("# TYPE " + name + " " + kind)
+        lines.extend(_sample(*sample) for sample in samples)
+
+    with _LOCK:
+        latency = []
+        for host, histogram in sorted(_LATENCY.items()):
+            for bound, total in histogram.cumulative():
+                latency.append(("crawler_request_duration_seconds_bucket",
+                                {"host": host, "le": bound}, total))
+            latency.append(("crawler_request_duration_seconds_sum",
+                            {"host": host}, histogram.sum))
+            latency.append(("crawler_request_duration_seconds_count",
+                            {"host": host}, sum(histogram.counts)))
+        metric("crawler_request_duration_seconds", "histogram",
+               "Seconds taken by the requests to every host", latency)
+        metric("crawler_responses_total", "counter",
+               "Responses by host and status code (error if the request "
+               "failed)",
+               [("crawler_responses_total", {"host": host, "status": status},
+                 total) for (host, status), total in sorted(_STATUS.items())])
+        metric("crawler_response_bytes_total", "counter",
+               "Bytes downloaded from every host",
+               [("crawler_response_bytes_total", {"host": host}, total)
+                for host, total in sorted(_BYTES.items())])
+        metric("crawler_articles_total", "counter",
+               "Articles saved or failed by every crawler",
+               [("crawler_articles_total", {"site": site, "outcome": outcome},
+                 total)
+                for (site, outcome), total in sorted(_ARTICLES.items())])
+        metric("crawler_queue_depth", "gauge", "Items waiting in every queue",
+               [("crawler_queue_depth", {"queue": name}, depth)
+                for name, depth in sorted(_QUEUES.items())])
+    metric("crawler_articles_per_second", "gauge",
+           "Articles saved per second since the first one",
+           [("crawler_articles_per_second", {"site": site}, speed)
+            for site, speed in sorted(speeds.items())])
+    metric("crawler_connections_opened_total", "counter",
+           "Connections opened to every host",
+           [("crawler_connections_opened_total", {"host": host},
+             stats["new_connections"])
+            for host, stats in sorted(connections.items())])
+    metric("crawler_rate_limit", "gauge",
+           "Requests per second the rate limiter allows to every host",
+           [("crawler_rate_limit", {"host": host}, stats["rate"])
+            for host, stats in sorted(limits.items())])
+    metric("crawler_pacing_seconds_total", "counter",
+           "Seconds spent waiting for the rate limiter of every host at "
+           "its current rate",
+           [("crawler_pacing_seconds_total", {"host": host},
+             stats["pacing_seconds"])
+            for host, stats in sorted(limits.items())])
+    metric("crawler_throttled_seconds_total", "counter",
+           "Seconds spent waiting because every host asked for it "
+           "(Retry-After)",
+           [("crawler_throttled_seconds_total", {"host": host},
+             stats["throttled_seconds"])
+            for host, stats in sorted(limits.items())])
+    return "\n".join(lines) + "\n"
+
+
+def write_textfile(path=DEFAULT_TEXTFILE):
+    '''
+    Writes the metrics to path. The file is replaced at once, so a
+    collector never reads half of it
+    '''
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    temporary = path + ".tmp"
+    with open(temporary, "w") as file:
+        file.write(render())
+    os.replace(temporary, path)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    '''
+    Answers GET /metrics with the metrics
+    '''
+
+    def do_GET(self): # pylint: disable=invalid-name
+        '''
+        Sends the metrics, or 404 for any other path
+        '''
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args): # pylint: disable=redefined-builtin
+        '''
+        Scrapes are not printed
+        '''
+
+
+def serve(port, host="127.0.0.1"):
+    '''
+    Serves the metrics at http://host:port/metrics from a background
+    thread
+        Returns:
+            - the ThreadingHTTPServer (port 0 picks a free port, see
+            server_address)
+    '''
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def _write_every(path, interval):
+    '''
+    Rewrites the metrics file every interval seconds
+    '''
+    while True:
+        time.sleep(interval)
+        write_textfile(path)
+
+
+def start(textfile=None, port=None, interval=EXPORT_INTERVAL):
+    '''
+    Starts exporting the metrics, once per process: to textfile every
+    interval seconds and when the process exits, and on a local HTTP
+    endpoint if a port is given. By default both are taken from the
+    METRICS_TEXTFILE and METRICS_PORT environment variables.
+    '''
+    with _LOCK:
+        if _EXPORT["started"]:
+            return
+        _EXPORT["started"] = True
+    if textfile is None:
+        textfile = os.environ.get("METRICS_TEXTFILE", DEFAULT_TEXTFILE)
+    if port is None and os.environ.get("METRICS_PORT"):
+        port = int(os.environ["METRICS_PORT"])
+    if textfile:
+        threading.Thread(target=_write_every, args=(textfile, interval),
+                         daemon=True).start()
+        atexit.register(write_textfile, textfile)
+    if port is not None:
+        _EXPORT["server"] = serve(port)
+        print("Metrics served at http://127.0.0.1:" +
+              str(_EXPORT["server"].server_address[1]) + "/metrics")
+
+
+def reset():
+    '''
+    Sets every metric back to zero
+    '''
+    with _LOCK:
+        for metrics in (_LATENCY, _STATUS, _BYTES, _ARTICLES, _FIRST_ARTICLE,
+                        _QUEUES, _EVENTS):
+            metrics.clear()
@@ -0,0 +1,244 @@
+# -*- coding: utf-8 -*-
+"""
+Purpose: Tests for cdx.py against a local stand-in of the Wayback
+Machine CDX server. The stand-in answers the listing queries of
+cdx.iter_captures (domain, date range, status filter and paging with
+resumeKey) from a fixed list of captures, and serves a few TVNZ pages
+for the content check. No request leaves the machine.
+
+Usage (from the scripts directory):
+    python3 -m pytest test_cdx.py
+
+Authors:
+Diego Diaz
+Rukhshan Arif Mian
+Piyush Tank
+"""
+
+import json
+import threading
+import unittest
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import cdx
+import sessions
+
+TVNZ = 'https://www.tvnz.co.nz/one-news/'
+#(timestamp, original url, status code) of every capture, in the order
+#of the listing
+CAPTURES = [
+    ('20180101000000', 'https://www.nzherald.co.nz/nz/news/article.cfm?'
+                       'c_id=1&objectid=11001', '200'),
+    #Same article: http, no www, other parameters and a fragment
+    ('20180102000000', 'http://nzherald.co.nz/nz/news/article.cfm?'
+                       'objectid=11001&ref=rss#comments', '200'),
+    ('20180103000000', 'https://www.nzherald.co.nz/nz/news/article.cfm?'
+                       'c_id=1&objectid=11002', '200'),
+    ('20180104000000', 'https://www.nzherald.co.nz/business/', '200'),
+    ('20180105000000', 'https://www.nzherald.co.nz/nz/news/article.cfm?'
+                       'objectid=11003', '404'),
+    #Outside the date range
+    ('20190101000000', 'https://www.nzherald.co.nz/nz/news/article.cfm?'
+                       'objectid=11004', '200'),
+    ('20180101000000', 'https://www.stuff.co.nz/national/101234567/'
+                       'storm-hits', '200'),
+    ('20180102000000', 'https://www.stuff.co.nz/national/101234567/'
+                       'storm-hits/', '200'),
+    ('20180103000000', 'https://www.stuff.co.nz/national/', '200'),
+    ('20180104000000', 'https://www.stuff.co.nz/business/101234999/'
+                       'budget?utm_source=home', '200'),
+    ('20180101000000', TVNZ + 'new-zealand/storm-hits', '200'),
+    ('20180102000000', 'http://tvnz.co.nz/one-news/new-zealand/'
+                       'storm-hits#video', '200'),
+    ('20180103000000', TVNZ + 'world', '200'),
+    ('20180104000000', 'https://www.tvnz.co.nz/shows/', '200'),
+    ('20180105000000', TVNZ + 'politics/budget-day', '200'),
+]
+STORY = ('<html><body><div class="storyPage first-page"><h1>Story</h1>'
+         '</div></body></html>')
+SECTION = '<html><body><ul><li><a href="/story">Story</a></li></ul></body>' \
+          '</html>'
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    '''
+    Answers /cdx/search/cdx as the CDX server does for the parameters
+    cdx.iter_captures sends, and /pages/<name> with the pages in PAGES
+    '''
+    PAGES = {'story': STORY, 'section': SECTION}
+    queries = []
+    lock = threading.Lock()
+
+    def do_GET(self):
+        '''
+        Sends the listing or the page
+        '''
+        path, _, query = self.path.partition('?')
+        if path == '/cdx/search/cdx':
+            params = dict(urllib.parse.parse_qsl(query))
+            with StandInHandler.lock:
+                StandInHandler.queries.append(params)
+            self.send(json.dumps(self.listing(params)), 'application/json')
+        elif path.startswith('/pages/') and path[7:] in self.PAGES:
+            self.send(self.PAGES[path[7:]], 'text/html')
+        else:
+            self.send_error(404)
+
+    @staticmethod
+    def listing(params):
+        '''
+        Rows of one page of the listing: a header row and the captures,
+        followed by an empty row and the resume key if there are more
+        '''
+        status = params['filter'].split(':')[1]
+        matches = [[timestamp, original] for timestamp, original, code
+                   in CAPTURES
+                   if urllib.parse.urlsplit(original).hostname.endswith(
+                       params['url'])
+                   and params['from'] <= timestamp[:8] <= params['to']
+                   and code == status]
+        start = int(params.get('resumeKey', 0))
+        end = start + int(params['limit'])
+        rows = [['timestamp', 'original']] + matches[start:end]
+        if params.get('showResumeKey') == 'true' and end < len(matches):
+            rows += [[], [str(end)]]
+        return rows
+
+    def send(self, text, content_type):
+        '''
+        Sends a 200 response with text
+        '''
+        body = text.encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args): # pylint: disable=redefined-builtin
+        '''
+        Requests are not printed
+        '''
+
+
+class CdxTest(unittest.TestCase):
+    '''
+    cdx.py against the local stand-in
+    '''
+
+    @classmethod
+    def setUpClass(cls):
+        #The stand-in is local: no cache and no rate limit
+        sessions.set_cache(None)
+        sessions.set_limiter(None)
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), StandInHandler)
+        cls.server.daemon_threads = True
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.base_url = 'http://127.0.0.1:' + str(cls.server.server_port)
+        cls.cdx_url = cls.base_url + '/cdx/search/cdx'
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        StandInHandler.queries = []
+
+    def discover(self, site):
+        '''
+        cdx.discover of site for 2018
+        '''
+        return cdx.discover(site, '20180101', '20181231', self.cdx_url)
+
+    def test_paging_with_resume_key(self):
+        '''
+        Every capture is listed once over pages of two, each page asked
+        for with the resume key of the one before
+        '''
+        captures = list(cdx.iter_captures('nzherald.co.nz', '20180101',
+                                          '20181231', self.cdx_url,
+                                          page_size=2))
+        self.assertEqual(captures, [
+            (timestamp, original) for timestamp, original, code in CAPTURES
+            if 'nzherald' in original and timestamp < '2019'
+            and code == '200'])
+        self.assertEqual([query.get('resumeKey') for query in
+                          StandInHandler.queries], [None, '2'])
+        self.assertEqual({query['url'] for query in StandInHandler.queries},
+                         {'nzherald.co.nz'})
+
+    def test_single_page(self):
+        '''
+        A listing that fits in one page takes one request
+        '''
+        captures = list(cdx.iter_captures('tvnz.co.nz', '20180101',
+                                          '20181231', self.cdx_url))
+        self.assertEqual(len(captures), 5)
+        self.assertEqual(len(StandInHandler.queries), 1)
+
+    def test_site_predicates(self):
+        '''
+        Only the captures that pass the article check of each site are
+        kept
+        '''
+        self.assertTrue(cdx.herald_is_article(CAPTURES[0][1]))
+        self.assertFalse(cdx.herald_is_article(CAPTURES[3][1]))
+        stuff = cdx.WAYBACK_URL + '20180101000000/'
+        self.assertTrue(cdx.stuff_is_article(stuff + CAPTURES[6][1]))
+        self.assertFalse(cdx.stuff_is_article(stuff + CAPTURES[8][1]))
+        tvnz = cdx.WAYBACK_URL + '20180101000000/'
+        self.assertTrue(cdx.tvnz_is_article(tvnz + CAPTURES[10][1]))
+        self.assertFalse(cdx.tvnz_is_article(tvnz + CAPTURES[12][1]))
+        self.assertFalse(cdx.tvnz_is_article(tvnz + CAPTURES[13][1]))
+
+    def test_canonical_url_deduplication(self):
+        '''
+        Captures of the same page with another scheme, host prefix,
+        trailing slash, fragment or extra parameters count once, while
+        the parameters that identify a Herald article are kept
+        '''
+        keep = cdx.SITES['herald']['keep_params']
+        self.assertEqual(cdx.canonical_url(CAPTURES[0][1], keep),
+                         cdx.canonical_url(CAPTURES[1][1], keep))
+        self.assertNotEqual(cdx.canonical_url(CAPTURES[0][1], keep),
+                            cdx.canonical_url(CAPTURES[2][1], keep))
+        self.assertEqual(
+            cdx.canonical_url(cdx.WAYBACK_URL + '20180101000000/' +
+                              CAPTURES[6][1]),
+            cdx.canonical_url(CAPTURES[7][1]))
+        self.assertEqual(len(self.discover('tvnz')), 2)
+
+    def test_herald_output_is_the_site_url(self):
+        '''
+        Herald articles are returned as site urls, the first capture of
+        each
+        '''
+        self.assertEqual(self.discover('herald'),
+                         [CAPTURES[0][1], CAPTURES[2][1]])
+
+    def test_stuff_and_tvnz_output_is_the_wayback_url(self):
+        '''
+        Stuff and TVNZ articles are returned as the web.archive url of
+        their first capture
+        '''
+        self.assertEqual(self.discover('stuff'), [
+            cdx.WAYBACK_URL + timestamp + '/' + original
+            for timestamp, original, _ in (CAPTURES[6], CAPTURES[9])])
+        self.assertEqual(self.discover('tvnz'), [
+            cdx.WAYBACK_URL + timestamp + '/' + original
+            for timestamp, original, _ in (CAPTURES[10], CAPTURES[14])])
+
+    def test_check_articles(self):
+        '''
+        Only story pages that were downloaded are articles, in the order
+        of the urls
+        '''
+        urls = [self.base_url + '/pages/' + name
+                for name in ('section', 'story', 'missing', 'story')]
+        self.assertEqual(list(cdx.check_articles(urls, concurrency=2)),
+                         list(zip(urls, [False, True, False, True])))
+
+
+if __name__ == "__main__":
+    unittest.main()
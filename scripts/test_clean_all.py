@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+"""
+Purpose: Tests for clean_all.py. The three newspapers are cleaned from
+small raw samples in a temporary folder. The clean articles must be the
+same as those of the cleaner of every source run on the whole sample,
+and the clean pickles must be the ones main.py loads.
+
+Usage (from the scripts directory):
+    python3 -m pytest test_clean_all.py
+
+Authors:
+Diego Diaz
+Rukhshan Arif Mian
+Piyush Tank
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+import pandas as pd
+import clean_all
+import herald_cleaner
+import main
+import stuff_clean
+import synthetic
+import tvnz_clean
+import writer
+
+ROWS = 200
+
+
+def write_raw(directory, data_frame):
+    '''
+    Saves a raw dataframe as the part files a crawler writes
+    '''
+    with writer.ArticleWriter(directory, data_frame.columns) as article_writer:
+        for row in data_frame.itertuples(index=False):
+            article_writer.write(list(row))
+
+
+class CleanAllTest(unittest.TestCase):
+    '''
+    clean_all on a raw sample of every newspaper
+    '''
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp() + os.sep
+        write_raw(self.directory + 'herald',
+                  synthetic.raw_herald_chunk(0, ROWS))
+        write_raw(self.directory + 'stuff',
+                  synthetic.raw_stuff_chunk(0, ROWS))
+        write_raw(self.directory + 'tvnz_raw', pd.DataFrame({
+            'date': ['201801{:02d}'.format(day % 28 + 1)
+                     for day in range(ROWS)],
+            #Some titles repeat, as stories captured on several days
+            'title': ['Story ' + str(row % (ROWS - 20)) for row in range(ROWS)],
+            'article': ['Text of story ' + str(row) for row in range(ROWS)],
+            'url': ['https://www.tvnz.co.nz/one-news/' + str(row)
+                    for row in range(ROWS)]}))
+        self.output = self.directory + 'clean' + os.sep
+        os.makedirs(self.output)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def clean_all(self, workers):
+        '''
+        clean_all of the samples in chunks of a third of them
+        '''
+        return clean_all.clean_all(
+            {'herald': self.directory + 'herald',
+             'stuff': self.directory + 'stuff', 'tvnz': self.directory},
+            workers=workers, chunk_size=ROWS // 3,
+            output_directory=self.output)
+
+    def test_same_as_the_cleaner_of_every_source(self):
+        '''
+        The chunks cleaned in the pool and put back together give the
+        frame the cleaner of each source gives on the whole sample
+        '''
+        results = self.clean_all(workers=2)
+
+        herald = herald_cleaner.remove_stopwords(herald_cleaner.clean_herald(
+            writer.read_parts(self.directory + 'herald')),
+            herald_cleaner.ARTICLE)
+        stuff = stuff_clean.clean(self.directory + 'stuff',
+                                  self.directory + 'stuff_clean')
+        #tvnz_clean.clean_tvnz_articles, which saves in ../data/clean
+        tvnz = tvnz_clean.clean_tvnz_frame(
+            pd.read_pickle(self.directory + 'tvnz_raw_data.pkl'))
+        tvnz = tvnz.drop_duplicates(subset='title', keep='first')
+
+        pd.testing.assert_frame_equal(results['herald'], herald)
+        pd.testing.assert_frame_equal(results['stuff'], stuff)
+        pd.testing.assert_frame_equal(results['tvnz'], tvnz)
+        self.assertEqual(len(results['tvnz']), ROWS - 20)
+
+    def test_output_is_loaded_by_main(self):
+        '''
+        Every clean pickle is picked up by main.append_dfs_in_dir, with the
+        articles of every newspaper
+        '''
+        results = self.clean_all(workers=1)
+        self.assertEqual(sorted(os.listdir(self.output)),
+                         sorted(source[3] for source in
+                                clean_all.SOURCES.values()))
+
+        loaded = main.append_dfs_in_dir(self.output + '*pkl')
+        self.assertEqual(len(loaded), sum(len(data) for data in
+                                          results.values()))
+        self.assertEqual(set(loaded['newspaper']),
+                         {'NZ Herald', 'Stuff', 'tvnz_one_news'})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+"""
+Purpose: Equivalence tests for the keyword matcher of index_builder.
+has_list_of_words and match_indices must mark exactly the articles the
+original apply-based has_list_of_words marked (kept in bench_index.py as
+legacy_has_list_of_words), on realistic articles and on edge cases:
+empty texts, overlapping keywords, keywords that are substrings of
+other words, and keyword orders that differ after the sample used to
+order them.
+
+Usage (from the scripts directory):
+    python3 -m pytest test_index_builder.py
+
+Authors:
+Diego Diaz
+Rukhshan Arif Mian
+Piyush Tank
+"""
+
+import unittest
+import pandas as pd
+import bench_index
+import index_builder as ib
+import synthetic
+
+EDGE_ARTICLES = [
+    '',
+    ' ',
+    'econ',
+    'economic policy uncertainty',
+    'the economy is uncertain, says policy maker',
+    'uncertainty about policies of the economic ministry',
+    'Economic Policy Uncertainty',
+    'economicpolicyuncertain',
+    'policy policy policy',
+    'econ econ uncert',
+    'domestic violence',
+    'violence at home, domestically',
+    'earthquakes damaged the city',
+    'damage',
+    'ecoNomic poli-cy uncert',
+    'nothing to see here',
+]
+EDGE_KEYWORDS = {
+    'EPU': ['econ', 'policy', 'uncert'],
+    'overlapping': ['econ', 'economy', 'economic'],
+    'substrings': ['poli', 'policy', 'policies'],
+    'repeated': ['econ', 'econ', 'uncert'],
+    'single': ['damage'],
+    'suffix': ['ally'],
+    'none': [],
+}
+
+
+def legacy_mask(df, words):
+    '''
+    Mask of the original has_list_of_words
+    '''
+    result = bench_index.legacy_has_list_of_words(df.copy(), ib.ARTICLE,
+                                                  words, 'test')
+    return result['test count'].to_numpy(dtype=bool)
+
+
+class MatcherEquivalenceTest(unittest.TestCase):
+    '''
+    The single pass matchers against the original one
+    '''
+
+    def assert_equivalent(self, df, indices):
+        '''
+        has_list_of_words and match_indices give the legacy mask for
+        every keyword list
+        '''
+        masks = ib.match_indices(df[ib.ARTICLE], indices)
+        for index_name, words in indices.items():
+            expected = legacy_mask(df, words)
+            result = ib.has_list_of_words(df.copy(), ib.ARTICLE, words,
+                                          index_name)
+            self.assertEqual(
+                result[index_name + ' count'].to_numpy(dtype=bool).tolist(),
+                expected.tolist(), index_name)
+            self.assertEqual(masks[index_name].tolist(), expected.tolist(),
+                             index_name)
+
+    def test_edge_cases(self):
+        '''
+        Empty texts, overlapping and repeated keywords, keywords inside
+        longer words and an empty keyword list
+        '''
+        df = pd.DataFrame({ib.ARTICLE: EDGE_ARTICLES})
+        self.assert_equivalent(df, EDGE_KEYWORDS)
+
+    def test_clean_articles(self):
+        '''
+        Synthetic clean articles with the length, vocabulary and keyword
+        rates of the clean corpus
+        '''
+        df = synthetic.clean_chunk(0, 3000)[[ib.ARTICLE]]
+        self.assert_equivalent(df, {**bench_index.KEYWORDS,
+                                    'synthetic': ['economy', 'policy']})
+
+    def test_order_from_unrepresentative_sample(self):
+        '''
+        The keyword order comes from the first SAMPLE_SIZE texts; texts
+        after them where the order is wrong are still matched exactly
+        '''
+        sample = ['econ econ econ'] * ib.SAMPLE_SIZE
+        rest = ['policy uncertain', 'econ policy uncertain', 'uncert',
+                'econ', ''] * 50
+        df = pd.DataFrame({ib.ARTICLE: sample + rest})
+        self.assert_equivalent(df, {'EPU': ['econ', 'policy', 'uncert']})
+
+    def test_benchmark_articles(self):
+        '''
+        The articles of bench_index
+        '''
+        df = bench_index.synthetic_articles(2000)
+        self.assert_equivalent(df, bench_index.KEYWORDS)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+"""
+Purpose: Tests for stuff_crawler.write_articles_from_links with a
+session that fails on some links. Only the articles must be written and
+recorded as saved; the links that could not be downloaded, or that are
+not articles, must stay free to be tried again by a later run.
+
+Usage (from the scripts directory):
+    python3 -m pytest test_stuff_crawler.py
+
+Authors:
+Diego Diaz
+Rukhshan Arif Mian
+Piyush Tank
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+import requests
+import frontier
+import seen
+import stuff_crawler
+import writer
+
+WAYBACK = 'https://web.archive.org/web/20200101000000/'
+ARTICLE = WAYBACK + 'https://www.stuff.co.nz/national/101234567/storm-hits'
+REFUSED = WAYBACK + 'https://www.stuff.co.nz/national/101234568/flood'
+NOT_ARTICLE = WAYBACK + 'https://www.stuff.co.nz/national/101234569/video'
+ARTICLE_PAGE = b'''<html><body><h1>Storm hits</h1>
+<span class="sics-component__byline__date">Updated Jan 1 2020</span>
+<div class="sics-component__app__content"><p>First.</p><p>Second.</p></div>
+</body></html>'''
+OTHER_PAGE = b'<html><body><h1>Video</h1></body></html>'
+
+
+class FakeResponse():
+    '''
+    The attributes of a response the pipeline reads
+    '''
+
+    def __init__(self, content):
+        self.status_code = 200
+        self.content = content
+
+
+def failing_get(url):
+    '''
+    Session that refuses the connection for REFUSED and serves a page
+    that is not an article for NOT_ARTICLE
+    '''
+    if url == REFUSED[len(WAYBACK):]:
+        raise requests.exceptions.ConnectionError("connection refused")
+    if url == NOT_ARTICLE[len(WAYBACK):]:
+        return FakeResponse(OTHER_PAGE)
+    return FakeResponse(ARTICLE_PAGE)
+
+
+class WriteArticlesTest(unittest.TestCase):
+    '''
+    write_articles_from_links with a session that fails on some links
+    '''
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp() + os.sep
+        self.frontier = frontier.CrawlFrontier(self.directory + 'f.frontier')
+        self.ledger = seen.UrlLedger(self.directory + 'seen.sqlite')
+        self.frontier.add_day_urls('20200101', [ARTICLE, REFUSED,
+                                                NOT_ARTICLE])
+
+    def tearDown(self):
+        self.frontier.close()
+        self.ledger.close()
+        shutil.rmtree(self.directory)
+
+    def test_only_articles_are_saved(self):
+        '''
+        The article is written and recorded as seen and visited; the
+        failed links are marked as failed and not recorded as seen
+        '''
+        stuff_crawler.write_articles_from_links(
+            self.frontier.pending(), self.directory + 'raw', False,
+            self.frontier, self.ledger, get=failing_get)
+
+        rows = writer.read_parts(self.directory + 'raw')
+        self.assertEqual(rows['url'].tolist(), [ARTICLE[len(WAYBACK):]])
+        self.assertEqual(rows['title'].tolist(), ['Storm hits'])
+        self.assertIn(ARTICLE, self.ledger)
+        self.assertNotIn(REFUSED, self.ledger)
+        self.assertNotIn(NOT_ARTICLE, self.ledger)
+        self.assertEqual(self.frontier.counts()['visited'], 1)
+        self.assertEqual(self.frontier.counts()['failed'], 2)
+
+        #A later run (with another claim on the same ledger) downloads
+        #the failed links again, but not the article
+        new, duplicates = self.ledger.claim([ARTICLE, REFUSED, NOT_ARTICLE])
+        self.assertEqual(new, [REFUSED, NOT_ARTICLE])
+        self.assertEqual(duplicates, [ARTICLE])
+
+    def test_resumed_crawl_retries_failures(self):
+        '''
+        retry_failed, which the crawlers call when they start, puts the
+        failed links back in the pending state
+        '''
+        stuff_crawler.write_articles_from_links(
+            self.frontier.pending(), self.directory + 'raw', False,
+            self.frontier, self.ledger, get=failing_get)
+        self.assertEqual(self.frontier.pending(), [])
+        self.frontier.retry_failed()
+        self.assertEqual(sorted(self.frontier.pending()),
+                         sorted([REFUSED, NOT_ARTICLE]))
+
+
+if __name__ == "__main__":
+    unittest.main()
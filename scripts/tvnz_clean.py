@@ -7,6 +7,13 @@
 #STEP 0: import the following packages for running this file
 import os
 import pandas as pd
+import instrument
+import loader
+import writer
+
+COLUMNS = ['date', 'title', 'article', 'url']
+RAW_SCHEMA = {'date': loader.STRING, 'title': loader.STRING,
+              'article': loader.STRING, 'url': loader.STRING}
 
 
 #please change the following location
@@ -14,41 +21,69 @@ import pandas as pd
 #STEP 1: running all required funcitons for this.
 ## all Functions to run the above command.
 
+@instrument.timed()
 def append_all_tvnz_batches(location):
     '''
-    to append all tvnz batches of csv file to create one dataframe
+    to append all tvnz articles written by the crawler, and any batch csv files
+    from older runs of it, to create one dataframe
     Input:
         location (str): location where all the batch files for tvnz is stored
     Returns:
         Nothing, it would save a tvnz_raw_data.pkl file
     '''
+    #the folder of part files is only there once the crawler has written
+    #to it, older runs only left batch csv files
     all_files = []
+    if os.path.isdir(location + 'tvnz_raw'):
+        all_files.append(location + 'tvnz_raw')
 
-    for i in os.listdir(location):
+    for i in sorted(os.listdir(location)):
         if 'batch' in i:
-            all_files.append(i)
-
-    first_file = pd.read_csv(location + all_files[0], header=None)
-    for file in all_files[1:]:
-        temp_df = pd.read_csv(location + file, header=None)
-        first_file = first_file.append(temp_df)
-    first_file = first_file.rename(columns={0: 'date', 1: 'title', 2: 'article', 3:'url'})
-    first_file['date'] = first_file['date'].astype('str')
+            all_files.append(location + i)
+
+    if not all_files:
+        raise FileNotFoundError("No tvnz articles in " + location +
+                                ": neither a tvnz_raw folder nor batch files")
+
+    #the part files and the batch csv files are read at the same time
+    #and put together once
+    first_file, _ = loader.load_files(all_files, read_raw, RAW_SCHEMA)
     first_file.to_pickle(location+'tvnz_raw_data.pkl')
 
     return_message = "all tvnz batches appended"
 
     return return_message
 
+def read_raw(path):
+    '''
+    reads the folder of part files written by the crawler, or a batch csv
+    file from older runs of it
+    '''
+    if os.path.isdir(path):
+        return writer.read_parts(path)
+    return pd.read_csv(path, header=None, names=COLUMNS)
+
+@instrument.timed()
+def clean_tvnz_frame(data):
+    '''
+    the cleaning steps of clean_tvnz_articles that work row by row (every
+    step except removing repeated titles), so they can run on any part of
+    the data
+    '''
+    data = data.copy()
+    data['date'] = pd.to_datetime(data['date'], format='%Y%m%d')
+    data['newspaper'] = 'tvnz_one_news'
+    data['article'] = data['article'].astype('str')
+    return data
+
+@instrument.timed()
 def clean_tvnz_articles(location, tvnz_unclean_filename):
     '''
     takes a tvnz_unclean pickle object and creates a clean pickle file
     '''
     data = pd.read_pickle(location+tvnz_unclean_filename)
-    data['date'] = pd.to_datetime(data['date'], format='%Y%m%d')
+    data = clean_tvnz_frame(data)
     data = data.drop_duplicates(subset='title', keep='first')
-    data['newspaper'] = 'tvnz_one_news'
-    data['article'] = data['article'].astype('str')
 
     data.to_pickle('../data/clean/'+'sample_tvnz_clean_data.pkl')
 
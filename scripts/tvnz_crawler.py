@@ -1,7 +1,7 @@
 '''
 # purpose of this code file
 # this code is created to crawl TVNZ One news website for it's articles in past and
-# save them in a csv ffiles in a batch wise
+# save them in parquet part files in a batch wise
 # the code file is divided in two parts .. Part I, runs the crawlr and Part II
 # has all helper function
 
@@ -15,10 +15,23 @@ Piyush Tank
 import datetime
 from datetime import datetime
 from datetime import timedelta
-import queue
-import csv
-from bs4 import BeautifulSoup
+import heapq
+import itertools
+import os
+import re
+import tempfile
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import requests
+import cdx
+import fetcher
+import frontier
+import instrument
+import parsers
+import pipeline
+import seen
+import telemetry
 import util
+import writer
 # this crawler uses some function from the util file provided in the PA1.
 # so ti would be good required to keep the util.py code file in the same directoty
 # to run this crawler
@@ -31,7 +44,17 @@ import util
 
 #PART 1: This part includes the main function to run this crawler
 
-def get_articles_batch_wise(today_url, num_batches, batch_size, days_skip):
+RAW_DIRECTORY = "../data/raw/tvnz_raw"
+COLUMNS = ['date', 'title', 'article', 'url']
+#story pages are under one-news/<section>/<words-of-the-title>
+STORY_URL = re.compile(r'tvnz\.co\.nz/one-news/[^/?#]+/[^/?#]+-[^/?#]+-')
+STORY = 0
+NAVIGATION = 1
+
+@instrument.timed()
+def get_articles_batch_wise(today_url, num_batches, batch_size, days_skip,
+                            frontier_path="../data/raw/tvnz.frontier",
+                            discovery='homepage', seen_path=seen.DEFAULT_PATH):
     '''
     This is the main cralwer function which takes a url link for tvnz archived website
     and scraps articles from past
@@ -46,85 +69,209 @@ def get_articles_batch_wise(today_url, num_batches, batch_size, days_skip):
         days_skip (int): number days it skips in each time the crawler goes in past.
                         this is to make sure for our project we have a articles from a
                         distant past.
+        frontier_path (str): SQLite file where the progress of every batch is kept.
+                        Running the crawler again with the same file resumes it from the
+                        last article saved.
+        discovery (str): 'homepage' crawls the homepage snapshot of every day in
+                        the batch, 'cdx' lists every story captured in the days of
+                        the batch from the Wayback CDX server
+        seen_path (str): SQLite file of the url ledger shared by all crawlers.
+                        Stories saved by any earlier run are not downloaded again
     '''
+    telemetry.start()
+    crawl_frontier = frontier.CrawlFrontier(frontier_path)
+    #Stories that failed in an earlier run are tried again
+    crawl_frontier.retry_failed()
+    seen_urls = seen.UrlLedger(seen_path)
     for i in range(num_batches):
-        all_links = get_all_articles(today_url, batch_size, 50, days_skip)
-        csv_name = "articles_batch_" + str(i) + ".csv"
-        make_csv_from_links(all_links, csv_name)
+        batch = "batch_" + str(i) + "_" + today_url[28:36]
+        if not crawl_frontier.is_day_done(batch):
+            if not crawl_frontier.day_state(batch):
+                if discovery == 'cdx':
+                    all_links = cdx.discover(
+                        'tvnz', get_past_date(today_url[28:36], batch_size*days_skip),
+                        get_past_date(today_url[28:36], days_skip), verify=True)
+                else:
+                    all_links = get_all_articles(today_url, batch_size, 50, days_skip)
+                crawl_frontier.add_day_urls(batch, all_links)
+            write_articles_from_links(crawl_frontier.pending(batch),
+                                      RAW_DIRECTORY, crawl_frontier, seen_urls)
         date = today_url[28:36]
         next_batch_date = get_past_date(date, batch_size*days_skip)
         today_url = "https://web.archive.org/web/" + next_batch_date + '013014/' \
         + 'https://www.tvnz.co.nz/one-news'
+    crawl_frontier.close()
+    seen_urls.close()
 
 
 
 #Part 2: All hepler functions for the crawler to work
 
 
-def crawl_and_get_article_links(num_pages_to_crawl, url_to_crawl):
+class LinkFrontier():
+    '''
+    Pages waiting to be crawled by crawl_and_get_article_links. Story
+    pages come out first, and pages of the same kind come out breadth
+    first (by depth, then in the order they were found). Every url is
+    only added once, checked against a set.
+    '''
+
+    def __init__(self):
+        self._heap = []
+        self._seen = set()
+        self._order = itertools.count()
+
+    def add(self, url, depth=0):
+        '''
+        Adds a page found at the given depth, unless it was added before
+            Returns:
+                - True if the page is new
+        '''
+        if url is None or url in self._seen:
+            return False
+        self._seen.add(url)
+        heapq.heappush(self._heap, (page_priority(url), depth,
+                                    next(self._order), url))
+        return True
+
+    def pop(self):
+        '''
+        Takes the next page to crawl
+            Returns:
+                - (url, depth) tuple
+        '''
+        _, depth, _, url = heapq.heappop(self._heap)
+        return url, depth
+
+    def __len__(self):
+        return len(self._heap)
+
+
+def page_priority(url):
+    '''
+    STORY for the urls of story pages and NAVIGATION for any other page
+    '''
+    return STORY if STORY_URL.search(url) else NAVIGATION
+
+
+def crawl_page(url, get=util.get_request):
+    '''
+    Downloads a page and reads it, in a thread of the crawler pool
+        Returns:
+            - (is_story, links) with whether the page is a story page and
+            its links as absolute urls, or None if the page could not be
+            downloaded
+    '''
+    try:
+        r_object = get(url)
+    except requests.exceptions.RequestException:
+        r_object = None
+    #because many times the archive just gives a blank page
+    # but does not give a different status_code error, so this is a way
+    # to make sure we have a good webpage to crawl
+    if not r_object:
+        return None
+    is_story, hrefs = parsers.tvnz_page(r_object.content)
+    return is_story, absolute_links(hrefs, url)
+
+
+@instrument.timed()
+def crawl_and_get_article_links(num_pages_to_crawl, url_to_crawl,
+                                concurrency=fetcher.DEFAULT_CONCURRENCY,
+                                get=util.get_request):
 
     '''
     this function finds all urls from the given link and filters links which are
-    an article format.
+    an article format. The pages are crawled breadth first by a pool of
+    concurrency threads, story pages before navigation pages (see LinkFrontier).
+    Pages that cannot be downloaded do not count towards num_pages_to_crawl.
     Inputs:
        num_pages_to_crawl (int): the number of pages to process during the crawl
        url_to_crawl (str): url link, from which all  article links are to be filtered
+       concurrency (int): the number of pages downloaded at the same time
+       get (function): takes a url and returns a response object, or None
+                        if the page could not be downloaded
     Returns:
         article_links (list): a list of  all article links can be found from the given url
     '''
-    starting_url = url_to_crawl
-
-    links_queue = queue.Queue()
-    links_set = set()
-    links_queue.put(starting_url)
-    links_set.add(starting_url)
-    article_links = set()
-
-    i = 0
-
-    while (i <= num_pages_to_crawl) and (links_queue.qsize() >= 1):
-
-        current_url = links_queue.get()
-        soup = cook_soup(current_url)
-        #because many times the archive just gives a blank page
-        # but does not give a different status_code error, so this is a way
-        # to make sure we have a good webpage to crawl
-        if not soup:
-            continue
-
-       ## to check if this is indeed an article
-        if check_if_article(soup):
-            article_links.add(current_url)
-
-        new_links = get_all_links(soup, current_url)
-
-        for link in new_links:
-            if link not in links_set:
-                links_queue.put(link)
-                links_set.add(link)
-        i += 1
-    return list(article_links)
-
-def make_csv_from_links(all_links, csv_filename):
+    links = LinkFrontier()
+    links.add(url_to_crawl)
+    article_links = []
+    crawled = 0
+    in_flight = {}
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+        while True:
+            #as in the serial crawler, up to num_pages_to_crawl + 1 pages
+            #are crawled
+            while links and len(in_flight) < concurrency and \
+                    crawled + len(in_flight) <= num_pages_to_crawl:
+                url, depth = links.pop()
+                in_flight[pool.submit(crawl_page, url, get)] = (url, depth)
+            telemetry.set_queue('tvnz.pages', len(links))
+            if not in_flight:
+                break
+
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                url, depth = in_flight.pop(future)
+                page = future.result()
+                if page is None:
+                    continue
+                crawled += 1
+                is_story, new_links = page
+                ## to check if this is indeed an article
+                if is_story:
+                    article_links.append(url)
+                for link in new_links:
+                    links.add(link, depth + 1)
+    return article_links
+
+@instrument.timed()
+def write_articles_from_links(all_links, directory, crawl_frontier=None,
+                              seen_urls=None):
     '''
-    takes all links of articles and makes a csv of article dataset
+    takes all links of articles and writes the article dataset to parquet part files
     Input:
         all_links (list) : a list of article links
-        csv_filename (str) : a file name with with the articles are to be stored
+        directory (str) : a folder in which the part files with the articles are stored
+        crawl_frontier (CrawlFrontier): if given, every link is marked as visited once
+                        the part file with its row is saved (or as failed if the page
+                        could not be read), so a crash loses at most one part
+        seen_urls (UrlLedger): ledger of the stories already saved. Links in it
+                        are not downloaded, the rest are added to it once saved.
+                        An in-memory ledger is used if None is given
     '''
-    with open("../data/raw/"+csv_filename, 'w') as csv_file:
-        writer = csv.writer(csv_file, delimiter=",", quoting=csv.QUOTE_MINIMAL)
-
-        for link in all_links:
-            article_link = link[43:]
-            soup = cook_soup(article_link)
-            if soup:
-                title, article_text = get_article_text(soup)
+    if seen_urls is None:
+        seen_urls = seen.UrlLedger(None)
+    all_links, duplicates = seen_urls.claim(all_links)
+    if duplicates and crawl_frontier:
+        crawl_frontier.mark_visited(duplicates)
+
+    def saved(keys):
+        if crawl_frontier:
+            crawl_frontier.mark_visited(keys)
+        seen_urls.add(keys, 'tvnz')
+
+    links = {link[43:]: link for link in all_links}
+    with writer.ArticleWriter(directory, COLUMNS, on_commit=saved) as out:
+
+        for article_link, _, fields in pipeline.fetch_and_extract(
+                links, 'tvnz', get=util.get_request):
+            link = links[article_link]
+            if fields:
+                title, article_text = fields
                 date = link[28:36]
-                print(date)
-                print("---------")
-                writer.writerow([date, title, article_text, link])
-    csv_file.close()
+                telemetry.article('tvnz')
+                telemetry.log("article_saved", site='tvnz', date=date,
+                              title=title)
+                out.write([date, title, article_text, link])
+            else:
+                telemetry.article('tvnz', saved=False)
+                telemetry.log("article_failed", site='tvnz', url=link)
+                seen_urls.release(link)
+                if crawl_frontier:
+                    crawl_frontier.mark_failed(link)
 
 def check_if_article(soup):
     '''
@@ -134,6 +281,8 @@ def check_if_article(soup):
         soup (soup object): soup object of a url
     Returns:
         Boolean : True if the soup is an article, False if not
+    The crawler uses parsers.tvnz_page, which gives the same answer; this
+    version is kept as its reference.
     '''
     answer = False
     if soup.find_all('div', {'class':'storyPage first-page'}):
@@ -167,15 +316,27 @@ def get_all_links(soup, url):
     Output:
         all_links (list): a list of ready to go urls
     '''
-    all_links = []
+    return absolute_links([link['href'] for link in soup.find_all('a')
+                           if link.has_attr('href')], url)
 
-    mega_set = soup.find_all('a')
-    for link in mega_set:
-        if link.has_attr('href'):
-            link = util.remove_fragment(link['href'])
-            abs_link = util.convert_if_relative_url(url, link)
-            if abs_link not in all_links:
-                all_links.append(abs_link)
+def absolute_links(hrefs, url):
+    '''
+    turns the links of a page into absolute urls without fragment, keeping
+    the first time each one appears (checked against a set)
+    Input:
+        hrefs (list): href of every link of the page, in order
+        url (str): the url of the page
+    Output:
+        all_links (list): a list of ready to go urls
+    '''
+    all_links = []
+    seen_links = set()
+    for link in hrefs:
+        link = util.remove_fragment(link)
+        abs_link = util.convert_if_relative_url(url, link)
+        if abs_link not in seen_links:
+            seen_links.add(abs_link)
+            all_links.append(abs_link)
 
     return all_links
 
@@ -185,12 +346,12 @@ def cook_soup(url):
     Input:
         url (str): a valid url/link
     Output:
-        soup (bs4 object): a bs4 soup object using 'html5lib' parser
+        soup (bs4 object): a bs4 soup object using the 'lxml' parser
     '''
     answer = None
     r_object = util.get_request(url)
     if r_object:
-        soup = BeautifulSoup(r_object.content, "html5lib")
+        soup = parsers.make_soup(r_object.content)
         answer = soup
     return answer
 
@@ -221,6 +382,7 @@ def get_next_link(url, days_skip):
      'https://www.tvnz.co.nz/one-news'
     return usable_url
 
+@instrument.timed()
 def get_all_articles(starting_url, days_in_past, articles_per_page, days_skip):
     '''
     this function geets all artile links for a given range of days in past
@@ -258,8 +420,11 @@ def sample_tvnz_scrapping():
     '''
     print("Starting sample scraping from the TVNZ and saving to data/raw")
     today_url = "https://web.archive.org/web/20180507104633/https://www.tvnz.co.nz/one-news"
-    get_articles_batch_wise(today_url, num_batches=2,\
-     batch_size=2, days_skip=5)
+    #The sample must not resume, or mark stories as seen for, the real crawls
+    with tempfile.TemporaryDirectory() as folder:
+        get_articles_batch_wise(today_url, num_batches=2,\
+         batch_size=2, days_skip=5,\
+         frontier_path=os.path.join(folder, "tvnz.frontier"), seen_path=None)
     print("Finished sample scraping, saved in data/raw")
 
 
@@ -7,8 +7,8 @@ Utility code
 # pylint: disable=R1714
 import urllib.parse
 import os
-import requests
 import bs4
+import sessions
 
 ######### DO NOT CHANGE THIS CODE  #########
 
@@ -29,7 +29,7 @@ def get_request(url):
 
     if is_absolute_url(url):
         try:
-            r = requests.get(url)
+            r = sessions.get(url)
             if r.status_code == 404 or r.status_code == 403:
                 r = None
         except Exception:
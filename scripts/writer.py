@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+"""
+Purpose: Streaming, append-only writer for the scraped articles. Rows are
+buffered in small batches and appended to a Parquet part file. After a
+fixed number of rows the part is closed and renamed into place, so a
+directory of parts only ever holds complete files and memory use does
+not grow with the number of articles scraped.
+
+Authors:
+Diego Diaz
+Rukhshan Arif Mian
+Piyush Tank
+"""
+
+import os
+import glob
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+ROWS_PER_PART = 1000
+ROWS_PER_BATCH = 50
+PART_PATTERN = "part-{:05d}.parquet"
+
+
+class ArticleWriter():
+    '''
+    Writes rows of articles to rolling Parquet part files in a directory.
+    A part being written is kept under a hidden temporary name and only
+    appears as part-NNNNN.parquet once it is complete.
+    '''
+
+    def __init__(self, directory, columns, rows_per_part=ROWS_PER_PART,
+                 rows_per_batch=ROWS_PER_BATCH, on_commit=None, append=True):
+        '''
+        Inputs:
+            - directory (str): Folder for the part files. New parts are
+            numbered after the ones already there, so an interrupted
+            crawl can keep writing to the same folder.
+            - columns (list of str): Column names, every column is text
+            - rows_per_part (int): Rows in each part file
+            - rows_per_batch (int): Rows buffered in memory before being
+            appended to the open part
+            - on_commit (function): Called with the keys of the rows of a
+            part once the part is safely on disk
+            - append (bool): If False, the parts already in the folder are
+            deleted first
+        '''
+        self.directory = directory
+        self.columns = list(columns)
+        self.rows_per_part = rows_per_part
+        self.rows_per_batch = rows_per_batch
+        self.on_commit = on_commit
+        self.key_index = self.columns.index('url')
+        self.schema = pa.schema([(column, pa.string()) for column in columns])
+        self.rows_written = 0
+
+        os.makedirs(directory, exist_ok=True)
+        if not append:
+            for path in glob.glob(os.path.join(directory, "part-*.parquet")):
+                os.remove(path)
+        #After the highest part already there, so that a gap in the
+        #numbers never leads to a part being overwritten
+        self._part_number = max([_part_number(path) for path in glob.glob(
+            os.path.join(directory, "part-*.parquet"))], default=-1) + 1
+        self._buffer = []
+        self._keys = []
+        self._part_keys = []
+        self._part_rows = 0
+        self._part_writer = None
+        self._tmp_path = None
+
+    def write(self, row, key=None):
+        '''
+        Adds one row, a list with a value for every column. The key passed
+        to on_commit is the url column unless another one is given.
+        '''
+        self._buffer.append(row)
+        self._keys.append(row[self.key_index] if key is None else key)
+        if len(self._buffer) >= self.rows_per_batch:
+            self._write_buffer()
+        if self._part_rows >= self.rows_per_part:
+            self._commit_part()
+
+    def flush(self):
+        '''
+        Closes the part being written so that every row received so far
+        is on disk
+        '''
+        self._write_buffer()
+        self._commit_part()
+
+    def close(self):
+        '''
+        Writes the remaining rows and closes the writer
+        '''
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _write_buffer(self):
+        if not self._buffer:
+            return
+        if self._part_writer is None:
+            self._tmp_path = os.path.join(
+                self.directory, "." + PART_PATTERN.format(self._part_number)
+                + ".tmp")
+            self._part_writer = pq.ParquetWriter(self._tmp_path, self.schema,
+                                                 compression="zstd")
+        batch = pa.RecordBatch.from_arrays(
+            [pa.array([_to_text(row[i]) for row in self._buffer],
+                      type=pa.string()) for i in range(len(self.columns))],
+            schema=self.schema)
+        self._part_writer.write_batch(batch)
+        self._part_keys.extend(self._keys)
+        self._part_rows += len(self._buffer)
+        self._buffer = []
+        self._keys = []
+
+    def _commit_part(self):
+        if self._part_writer is None:
+            return
+        self._part_writer.close()
+        os.replace(self._tmp_path, os.path.join(
+            self.directory, PART_PATTERN.format(self._part_number)))
+        self.rows_written += self._part_rows
+        if self.on_commit:
+            self.on_commit(self._part_keys)
+        self._part_number += 1
+        self._part_writer = None
+        self._part_keys = []
+        self._part_rows = 0
+
+
+def _part_number(path):
+    '''
+    Number of a part file named as PART_PATTERN, -1 for other names
+    '''
+    number = os.path.basename(path)[len("part-"):-len(".parquet")]
+    return int(number) if number.isdigit() else -1
+
+
+def _to_text(value):
+    '''
+    Keeps missing values as nulls and stores everything else as text
+    '''
+    if value is None:
+        return None
+    return str(value)
+
+
+def read_parts(directory, columns=None):
+    '''
+    Reads every complete part file in a directory into one dataframe.
+        Inputs:
+            - directory (str): Folder written by an ArticleWriter
+            - columns (list of str): Columns to read, all by default
+        Returns:
+            - df (Pandas dataframe)
+    '''
+    files = sorted(glob.glob(os.path.join(directory, "part-*.parquet")))
+    if not files:
+        raise FileNotFoundError("No part files in " + directory)
+    return pq.ParquetDataset(files).read(columns=columns).to_pandas()